@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# analyze steered molecular dynamics trajectories (Hummer-Szabo PMF)
+# python port of analyzesmd.cpp: same inputs, options and .pmf output
+
+import argparse
+import numpy as np
+import os.path
+
+gas_constant = 8.3144626 / 4184  # kcal/K/mol
+
+
+def read_colvars_conf(filepath):
+    # colvarstrajfrequency, forceconstant, centers, targetcenters, targetnumsteps
+    keys = ('colvarstrajfrequency', 'forceconstant', 'centers', 'targetcenters', 'targetnumsteps')
+    settings = {}
+    with open(filepath) as conffile:
+        for line in conffile:
+            line = line.split('#')[0].split()
+            if len(line) > 1 and line[0].lower() in keys:
+                settings[line[0].lower()] = float(line[1].strip('()'))
+    missing = [key for key in keys if key not in settings]
+    if missing:
+        raise ValueError(f'{filepath}: missing {", ".join(missing)}')
+    return settings
+
+
+def read_colvars_traj(filepath):
+    # columns: step, r, center, accumulated work (as written by a moving harmonic restraint)
+    data = np.loadtxt(filepath, comments='#', usecols=(1, 2, 3), ndmin=2)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+def logsumexp(a, axis):
+    amax = np.max(a, axis=axis, keepdims=True)
+    amax[~np.isfinite(amax)] = 0
+    return np.squeeze(amax, axis=axis) + np.log(np.sum(np.exp(a - amax), axis=axis))
+
+
+def smd_pmf(rlists, centerlist, worklists, rbegin, rend, rstepsize, force_constant, temp):
+    # Hummer-Szabo estimator on the grid rbegin, rbegin + rstepsize, ... (as analyzesmd.cpp):
+    #   G(r) = -kT ln( sum_t <delta(r - r_t) exp(-W_t/kT)> / <exp(-W_t/kT)>
+    #                  / sum_t exp(-V(r, t)/kT) / <exp(-W_t/kT)> )
+    # rlists and worklists are (trajectories, timesteps); each sample falls in at most one
+    # bin, so the numerator is one digitize + bincount over all samples.
+    kt = gas_constant * temp
+    numtraj, timesteps = rlists.shape
+    step = rstepsize if rend >= rbegin else -rstepsize
+    rsteps = int((rend - rbegin) / step) + 1
+    rgrid = rbegin + np.arange(rsteps) * step
+
+    # ln <exp(-W/kT)> per timestep (log-sum-exp over trajectories, stable for large works)
+    logexpwork = -worklists / kt
+    logexpworksum = logsumexp(logexpwork, axis=0)
+
+    # numerator: samples binned to the nearest grid point within rstepsize / 2
+    order = np.argsort(rgrid)
+    edges = np.concatenate((rgrid[order] - rstepsize / 2, [rgrid[order][-1] + rstepsize / 2]))
+    bins = np.digitize(rlists.ravel(), edges) - 1
+    inside = (bins >= 0) & (bins < rsteps)
+    weights = np.exp(logexpwork - logexpworksum).ravel()
+    numerator = np.zeros(rsteps)
+    numerator[order] = np.bincount(bins[inside], weights=weights[inside], minlength=rsteps)
+
+    # denominator: restraint Boltzmann factor of every grid point at every timestep
+    logbias = -force_constant / 2 * (rgrid[:, None] - centerlist[None, :]) ** 2 / kt
+    logdenominator = logsumexp(logbias - logexpworksum[None, :], axis=1)
+
+    with np.errstate(divide='ignore'):
+        pmf = -kt * (np.log(numerator) - logdenominator - np.log(numtraj))
+    return rgrid, pmf
+
+
+def count_trajectories(jobname, maxtraj):
+    if maxtraj == 0:
+        while os.path.isdir(f'traj{maxtraj + 1}'):
+            maxtraj += 1
+    trajfilepaths = []
+    for trajid in range(1, maxtraj + 1):
+        trajfilepath = f'traj{trajid}/{jobname}_traj{trajid}.colvars.traj'
+        if os.path.isfile(trajfilepath):
+            trajfilepaths.append(trajfilepath)
+        else:
+            print(f' Problem encountered opening file {trajfilepath}\n Skipping...')
+    return trajfilepaths
+
+
+def main(jobname, maxtraj, rstepsize, temp):
+    settings = read_colvars_conf(f'traj1/{jobname}_traj1.colvars.conf')
+    cvfreq = int(settings['colvarstrajfrequency'])
+    timesteps = int(settings['targetnumsteps']) // cvfreq + 1
+
+    trajfilepaths = count_trajectories(jobname, maxtraj)
+    if not trajfilepaths:
+        raise Exception(f'No trajectories found for {jobname}')
+    rlists = np.empty((len(trajfilepaths), timesteps))
+    worklists = np.empty((len(trajfilepaths), timesteps))
+    for trajnum, trajfilepath in enumerate(trajfilepaths):
+        rlist, centerlist, worklist = read_colvars_traj(trajfilepath)
+        if len(rlist) != timesteps:
+            raise Exception(f'Incomplete trajectory ({len(rlist)}/{timesteps} lines) in file {trajfilepath}')
+        rlists[trajnum] = rlist
+        worklists[trajnum] = worklist
+        if trajnum == 0:
+            centers = centerlist
+
+    rgrid, pmf = smd_pmf(rlists, centers, worklists, settings['centers'], settings['targetcenters'],
+                         rstepsize, settings['forceconstant'], temp)
+
+    with open(f'{jobname}.pmf', 'w') as pmffile:
+        pmffile.write(f'# {jobname} {len(trajfilepaths)}-trajectory pmf\n')
+        pmffile.write('# r (Å), G (kcal/mol)\n')
+        for r, g in zip(rgrid, pmf):
+            pmffile.write(f'{r:g},{g:g}\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='calculate a potential of mean force from steered MD pulls '
+                                                 '(trajN/<job>_trajN.colvars.traj) with the Hummer-Szabo estimator')
+
+    parser.add_argument('jobname', type=str, help='name of job')
+    parser.add_argument('-m', '--maxtraj', type=int, default=0, help='number of traj directories (default: count them)')
+    parser.add_argument('-s', '--rstepsize', type=float, default=0.1, help='pmf bin width in Å')
+    parser.add_argument('-T', '--temperature', type=float, default=310, help='temperature at which simulations ran')
+
+    args = parser.parse_args()
+
+    main(args.jobname, args.maxtraj, args.rstepsize, args.temperature)
@@ -0,0 +1,339 @@
+"""
+Columnar (structure-of-arrays) atom table used by build_complexI_9TI4_models.py.
+
+An `AtomTable` holds one NumPy array per atom field. Variants are derived by applying
+an `EditSet` (update/delete/insert rows): the derived table shares the parent's column
+arrays and only stores a row-order index plus the few rows it changed or added, so any
+number of variants costs one copy of the parsed structure.
+"""
+
+from __future__ import annotations
+
+from collections import namedtuple
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+
+# Column names (same order as the AtomRecord fields in build_complexI_9TI4_models.py).
+ATOM_COLUMNS = (
+    "group",
+    "atom_id",
+    "element",
+    "resname",
+    "chain_auth",
+    "chain_pdb",
+    "segid",
+    "resseq",
+    "icode",
+    "atomname",
+    "x",
+    "y",
+    "z",
+    "occupancy",
+    "bfactor",
+    "label_asym",
+    "label_seq",
+)
+
+ResidueKey = Tuple[str, int, str]  # (chain_auth, resseq, icode)
+Rows = Union[slice, np.ndarray]
+
+# Lightweight per-row value tuple (attribute-compatible with AtomRecord).
+AtomValues = namedtuple("AtomValues", ATOM_COLUMNS)
+
+
+class AtomRow:
+    """Read-only view of one row of an `AtomTable` (attribute access like AtomRecord)."""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: "AtomTable", index: int) -> None:
+        self._table = table
+        self._index = index
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    def __getattr__(self, name: str) -> Any:
+        if name in ATOM_COLUMNS:
+            return self._table.value(name, self._index)
+        raise AttributeError(name)
+
+    def values(self) -> Dict[str, Any]:
+        return {name: self._table.value(name, self._index) for name in ATOM_COLUMNS}
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{k}={v!r}" for k, v in self.values().items())
+        return f"AtomRow({self._index}: {fields})"
+
+
+@dataclass
+class EditSet:
+    """
+    Row edits relative to one table: `updates` and `deletes` refer to row positions;
+    `inserts` go after a row position (None = at the end of the table), in list order.
+    """
+
+    updates: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    deletes: Set[int] = field(default_factory=set)
+    inserts: List[Tuple[Optional[int], Dict[str, Any]]] = field(default_factory=list)
+
+    def update(self, row: int, **values: Any) -> None:
+        self.updates.setdefault(row, {}).update(values)
+
+    def delete(self, row: int) -> None:
+        self.deletes.add(row)
+
+    def insert_after(self, row: Optional[int], values: Dict[str, Any]) -> None:
+        self.inserts.append((row, values))
+
+
+def _runs(columns: Sequence[np.ndarray], n: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Start/stop of runs of consecutive rows with equal values in all `columns`.
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    changed = np.zeros(n, dtype=bool)
+    changed[0] = True
+    for col in columns:
+        changed[1:] |= col[1:] != col[:-1]
+    starts = np.flatnonzero(changed)
+    stops = np.append(starts[1:], n)
+    return starts, stops
+
+
+def _ranges_to_rows(ranges: List[Tuple[int, int]]) -> Rows:
+    if len(ranges) == 1:
+        return slice(*ranges[0])
+    return np.concatenate([np.arange(a, b, dtype=np.int64) for a, b in ranges])
+
+
+class ResidueIndex:
+    """
+    Row lookup for one table: (chain_auth, resseq, icode) -> rows, chain_auth -> rows,
+    and the ATOM-record rows. Contiguous blocks are returned as slices (the usual case
+    for residues); split blocks (e.g. ligands listed after the polymer) as index arrays.
+    """
+
+    __slots__ = ("_residues", "_chains", "_atom_rows")
+
+    def __init__(self, table: "AtomTable") -> None:
+        n = len(table)
+        chain = table.column("chain_auth")
+        resseq = table.column("resseq")
+        icode = table.column("icode")
+
+        self._residues: Dict[ResidueKey, List[Tuple[int, int]]] = {}
+        starts, stops = _runs([chain, resseq, icode], n)
+        keys = zip(chain[starts].tolist(), resseq[starts].tolist(), icode[starts].tolist())
+        for key, a, b in zip(keys, starts.tolist(), stops.tolist()):
+            self._residues.setdefault(key, []).append((a, b))
+
+        self._chains: Dict[str, List[Tuple[int, int]]] = {}
+        starts, stops = _runs([chain], n)
+        for key, a, b in zip(chain[starts].tolist(), starts.tolist(), stops.tolist()):
+            self._chains.setdefault(key, []).append((a, b))
+
+        self._atom_rows = np.flatnonzero(table.column("group") == "ATOM")
+
+    def residue_rows(self, chain_auth: str, resseq: int, icode: str = "") -> Rows:
+        ranges = self._residues.get((chain_auth, resseq, icode))
+        if ranges is None:
+            return slice(0, 0)
+        return _ranges_to_rows(ranges)
+
+    def chain_rows(self, chain_auth: str) -> Rows:
+        ranges = self._chains.get(chain_auth)
+        if ranges is None:
+            return slice(0, 0)
+        return _ranges_to_rows(ranges)
+
+    @property
+    def atom_rows(self) -> np.ndarray:
+        """Rows of ATOM (polymer) records, i.e. the protein-only selection."""
+        return self._atom_rows
+
+    def residues(self) -> List[ResidueKey]:
+        return list(self._residues)
+
+    def chains(self) -> List[str]:
+        return list(self._chains)
+
+
+class AtomTable:
+    """
+    Atom table with one NumPy column per field in ATOM_COLUMNS.
+
+    A base table owns its columns. Derived tables (from `take` / `apply`) keep a
+    reference to the same base columns, a row-order index into "base rows + extra
+    rows", and a small `extra` table of rows they added or modified.
+
+    Each table lazily builds its `ResidueIndex` once and tracks a running maximum atom
+    id, so new atoms can be numbered without rescanning the columns.
+    """
+
+    __slots__ = ("_base", "_extra", "_order", "_n_base", "_index", "_max_atom_id")
+
+    def __init__(
+        self,
+        columns: Dict[str, np.ndarray],
+        *,
+        extra: Optional[Dict[str, np.ndarray]] = None,
+        order: Optional[np.ndarray] = None,
+    ) -> None:
+        missing = [name for name in ATOM_COLUMNS if name not in columns]
+        if missing:
+            raise ValueError(f"Missing atom table columns: {missing}")
+        self._base = {name: columns[name] for name in ATOM_COLUMNS}
+        self._n_base = len(self._base["atom_id"])
+        self._extra = extra
+        self._order = order
+        self._index: Optional[ResidueIndex] = None
+        self._max_atom_id: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self._n_base if self._order is None else len(self._order)
+
+    def _derive(
+        self,
+        order: np.ndarray,
+        extra: Optional[Dict[str, np.ndarray]],
+        max_atom_id: Optional[int] = None,
+    ) -> "AtomTable":
+        table = AtomTable.__new__(AtomTable)
+        table._base = self._base
+        table._n_base = self._n_base
+        table._extra = extra
+        table._order = order
+        table._index = None
+        table._max_atom_id = max_atom_id
+        return table
+
+    def residue_index(self) -> ResidueIndex:
+        if self._index is None:
+            self._index = ResidueIndex(self)
+        return self._index
+
+    @property
+    def max_atom_id(self) -> int:
+        """
+        Largest atom id in this table. Derived tables inherit their parent's value
+        (raised by inserted rows), so it is an upper bound for subsets taken with `take`.
+        """
+        if self._max_atom_id is None:
+            ids = self.column("atom_id")
+            self._max_atom_id = int(ids.max()) if len(ids) else 0
+        return self._max_atom_id
+
+    def next_atom_id(self) -> int:
+        return self.max_atom_id + 1
+
+    def _pool_index(self) -> np.ndarray:
+        if self._order is None:
+            return np.arange(self._n_base, dtype=np.int64)
+        return self._order
+
+    def shares_base(self, other: "AtomTable") -> bool:
+        """True when both tables are derived from the same base columns."""
+        return self._base is other._base
+
+    def pool_layout(self) -> Tuple[np.ndarray, Dict[str, np.ndarray], Optional[Dict[str, np.ndarray]]]:
+        """
+        (order, base, extra) describing this table's rows: entries of `order` below
+        len(base rows) index the shared base columns, the others index the `extra` columns
+        (rows added or modified by `apply`) after subtracting the base size. Lets per-row
+        caches built once for the base columns be reused by every derived table.
+        """
+        return self._pool_index(), self._base, self._extra
+
+    def column(self, name: str) -> np.ndarray:
+        """Column `name` in row order (the base array itself for an unedited table)."""
+        base = self._base[name]
+        if self._order is None:
+            return base
+        if self._extra is None:
+            return base[self._order]
+        extra = self._extra[name]
+        order = self._order
+        out = np.empty(len(order), dtype=np.result_type(base, extra))
+        from_base = order < self._n_base
+        out[from_base] = base[order[from_base]]
+        out[~from_base] = extra[order[~from_base] - self._n_base]
+        return out
+
+    def value(self, name: str, index: int) -> Any:
+        if self._order is None:
+            return self._base[name][index].item()
+        p = int(self._order[index])
+        if p < self._n_base:
+            return self._base[name][p].item()
+        return self._extra[name][p - self._n_base].item()
+
+    def row(self, index: int) -> AtomRow:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return AtomRow(self, index if index >= 0 else index + len(self))
+
+    def rows(self) -> Iterator[AtomValues]:
+        """Iterate rows as AtomValues tuples (built column-wise, for writers)."""
+        values = [self.column(name).tolist() for name in ATOM_COLUMNS]
+        return (AtomValues(*row) for row in zip(*values))
+
+    def take(self, rows: Union[Rows, Sequence[int]]) -> "AtomTable":
+        """Rows at `rows` (a slice or positions in this table) as a derived table sharing columns."""
+        if isinstance(rows, slice):
+            if self._order is None:
+                order = np.arange(self._n_base, dtype=np.int64)[rows]
+            else:
+                order = self._order[rows]
+        else:
+            order = self._pool_index()[np.asarray(rows, dtype=np.int64)]
+        return self._derive(order, self._extra, self.max_atom_id)
+
+    def apply(self, edits: EditSet) -> "AtomTable":
+        """Return a derived table with `edits` applied; this table is left unchanged."""
+        n = len(self)
+        pool = self._pool_index().copy()
+        new_rows: List[Dict[str, Any]] = []
+        next_id = self._n_base + (0 if self._extra is None else len(self._extra["atom_id"]))
+
+        for pos, vals in sorted(edits.updates.items()):
+            values = self.row(pos).values()
+            values.update(vals)
+            new_rows.append(values)
+            pool[pos] = next_id
+            next_id += 1
+
+        keep = np.ones(n, dtype=bool)
+        if edits.deletes:
+            keep[np.fromiter(edits.deletes, dtype=np.int64, count=len(edits.deletes))] = False
+
+        insert_at: List[int] = []
+        insert_ids: List[int] = []
+        for after, vals in edits.inserts:
+            missing = [name for name in ATOM_COLUMNS if name not in vals]
+            if missing:
+                raise ValueError(f"Inserted row is missing columns: {missing}")
+            new_rows.append(dict(vals))
+            insert_at.append(n if after is None else after + 1)
+            insert_ids.append(next_id)
+            next_id += 1
+        if insert_at:
+            pool = np.insert(pool, insert_at, insert_ids)
+            keep = np.insert(keep, insert_at, True)
+
+        max_atom_id = self.max_atom_id
+        if new_rows:
+            max_atom_id = max(max_atom_id, max(int(r["atom_id"]) for r in new_rows))
+
+        extra = self._extra
+        if new_rows:
+            added = {name: np.array([r[name] for r in new_rows]) for name in ATOM_COLUMNS}
+            if extra is None:
+                extra = added
+            else:
+                extra = {name: np.concatenate([extra[name], added[name]]) for name in ATOM_COLUMNS}
+        return self._derive(pool[keep], extra, max_atom_id)
@@ -26,16 +26,35 @@ Notes
     auth_asym_id (chain) = "s", auth_seq_id (residue) = 52, ALA -> THR
 * The LHON variant m.11778G>A in MT-ND4 maps to p.Arg340His (R340H). In 9TI4 this is:
     auth_asym_id (chain) = "r", auth_seq_id (residue) = 340, ARG -> HIS
+* With --variants SPEC, the variants listed in a JSON/TSV spec (see variant_engine.py and
+  lhon_variants.json) are built instead of the three above, with side chains rebuilt from
+  internal-coordinate templates. Each variant writes
+  complexI_<PDB>_<name>_heavy.pdb, complexI_<PDB>_<name>_heavy_proteinOnly.pdb and
+  chain_<chain>_<name>_heavy.pdb per mutated chain.
 """
 
 from __future__ import annotations
 
 import argparse
+import bz2
+import gzip
+import itertools
 import json
+import lzma
 import math
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from typing import IO, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from atom_table import ATOM_COLUMNS, AtomRow, AtomTable, EditSet
+from binary_cif import is_binary_cif, read_bcif_categories
+from mmcif_writer import open_output, write_mmcif
+from build_manifest import MANIFEST_FILE_NAME, BuildManifest, file_sha256, source_digest, target_key
+from variant_engine import SiteEnvironment, Variant, apply_variant, load_variant_spec, repack_edits, validate_variant
 
 
 ALLOWED_CHAIN_IDS = list("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789")
@@ -58,6 +77,8 @@ class AtomRecord:
     z: float
     occupancy: float
     bfactor: float
+    label_asym: str  # _atom_site.label_asym_id ('?' if missing)
+    label_seq: str  # _atom_site.label_seq_id as text ('.' for non-polymer atoms)
 
 
 def _tokenize_cif_row(line: str) -> List[str]:
@@ -86,59 +107,207 @@ def _tokenize_cif_row(line: str) -> List[str]:
     return tokens
 
 
-def _iter_atom_site_loop(cif_path: Path) -> Tuple[List[str], Iterator[List[str]]]:
+def _tokenize_cif_columns(lines: List[str], ncols: int) -> List[np.ndarray]:
     """
-    Returns (headers, rows_iterator) for the first _atom_site loop.
+    Tokenize loop data lines (one row per line) into `ncols` NumPy string columns.
+
+    Runs of rows without quote characters are split in bulk; only rows containing quotes
+    go through the quote-aware `_tokenize_cif_row`. Rows with fewer than `ncols` tokens
+    are dropped (extra tokens are ignored), like the row-by-row parser.
+    """
+    tokens: List[str] = []
+    stride = ncols + 1
+    for has_quote, run in itertools.groupby(lines, key=lambda line: "'" in line or '"' in line):
+        run_lines = list(run)
+        if not has_quote:
+            # A NUL marker closes every line, so a row with a wrong token count shifts the
+            # markers off the expected positions even when the run's total still matches.
+            bulk = (" \0 ".join(run_lines) + " \0").split()
+            if len(bulk) == len(run_lines) * stride and bulk[ncols::stride].count("\0") == len(run_lines):
+                del bulk[ncols::stride]
+                tokens.extend(bulk)
+                continue
+            # Some rows in this run are malformed; split them one by one.
+            rows = (line.split() for line in run_lines)
+        else:
+            rows = (_tokenize_cif_row(line) for line in run_lines)
+        for fields in rows:
+            if len(fields) >= ncols:
+                tokens.extend(fields[:ncols])
+    return [np.array(tokens[j::ncols], dtype=str) for j in range(ncols)]
+
+
+def _tokenize_cif_block(lines: List[str]) -> List[str]:
     """
-    f = cif_path.open("r", encoding="utf-8", errors="replace")
+    Tokenize loop/item values that may wrap over several lines or use ;-delimited text fields.
+    """
+    tokens: List[str] = []
+    text: Optional[List[str]] = None
+    for line in lines:
+        if text is not None:
+            if line.startswith(";"):
+                tokens.append("\n".join(text).strip())
+                text = None
+                tokens.extend(_tokenize_cif_row(line[1:]))
+            else:
+                text.append(line)
+            continue
+        if line.startswith(";"):
+            text = [line[1:]]
+            continue
+        tokens.extend(_tokenize_cif_row(line))
+    return tokens
+
+
+# Compressed inputs are recognised by their magic bytes, not the file suffix.
+_COMPRESSION_MAGIC = (
+    (b"\x1f\x8b", gzip.open),
+    (b"BZh", bz2.open),
+    (b"\xfd7zXZ\x00", lzma.open),
+)
 
-    def _rows() -> Iterator[List[str]]:
-        in_loop = False
-        headers: List[str] = []
+COMPRESSION_SUFFIXES = (".gz", ".bz2", ".xz")
+
+# Loops whose rows are always written one per line (lets the bulk tokenizer be used).
+ROW_PER_LINE_CATEGORIES = {"_atom_site", "_atom_site_anisotrop"}
+
+
+def _open_cif_text(cif_path: Path) -> IO[str]:
+    with cif_path.open("rb") as f:
+        magic = f.read(6)
+    for prefix, opener in _COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            return opener(cif_path, "rt", encoding="utf-8", errors="replace")
+    return cif_path.open("r", encoding="utf-8", errors="replace")
+
+
+def cif_stem(cif_path: Path) -> str:
+    """File name without the .cif/.bcif and compression suffixes ("9TI4.cif.gz" -> "9TI4")."""
+    name = cif_path.name
+    for suffix in COMPRESSION_SUFFIXES:
+        if name.lower().endswith(suffix):
+            name = name[: -len(suffix)]
+            break
+    return Path(name).stem
+
+
+def _starts_block(line: str) -> bool:
+    return line[0] in "lLdDsS" and line.lower().startswith(("loop_", "data_", "save_"))
+
+
+def _tag_category(tag: str) -> str:
+    return tag.split(".", 1)[0]
+
+
+def read_cif_lines(cif_path: Path, categories: Iterable[str]) -> Dict[str, Tuple[List[str], List[str]]]:
+    """
+    Collect (headers, data_lines) for the requested categories in a single pass.
+
+    Both loop_ categories and single-row key/value categories are supported. The input
+    may be plain text or gzip/bz2/xz compressed; it is streamed, and reading stops as
+    soon as every requested category has been seen. Only the first data block is read.
+    """
+    wanted = set(categories)
+    found: Dict[str, Tuple[List[str], List[str]]] = {}
+    state = ""  # "", "header", "data" (loop_ rows) or "item" (key/value values)
+    category = ""
+    headers: List[str] = []
+    data: List[str] = []
+    in_text = False
+    blocks = 0
+
+    def finish() -> None:
+        if category in wanted and category not in found and headers:
+            found[category] = (headers, data)
+
+    def add_item(line: str) -> None:
+        parts = line.split(None, 1)
+        headers.append(parts[0])
+        if category in wanted and len(parts) > 1:
+            data.append(parts[1])
+
+    with _open_cif_text(cif_path) as f:
         for raw in f:
+            if in_text:
+                # Inside a ;-delimited text field everything is a value.
+                line = raw.rstrip("\r\n")
+                if category in wanted:
+                    data.append(line)
+                if line.startswith(";"):
+                    in_text = False
+                continue
             line = raw.strip()
             if not line:
                 continue
-            if line == "loop_":
-                in_loop = True
-                headers = []
+            first = line[0]
+            if state == "header" and first != "_":
+                state = "data"
+            if state in ("data", "item") and first not in "#_" and not _starts_block(line):
+                # Loop row, or the value of an item on the line(s) after its tag.
+                if category in wanted:
+                    data.append(line)
+                if first == ";":
+                    in_text = True
                 continue
-            if not in_loop:
-                continue
-            if line.startswith("_atom_site."):
-                headers.append(line)
-                continue
-            if headers and headers[0].startswith("_atom_site."):
-                # Data section for the atom_site loop.
-                if line.startswith("#"):
-                    break
-                yield _tokenize_cif_row(line)
-        f.close()
 
-    # We need to read headers first; easiest is to scan once and then re-open for rows.
-    headers: List[str] = []
-    with cif_path.open("r", encoding="utf-8", errors="replace") as scan:
-        in_loop = False
-        candidate: List[str] = []
-        for raw in scan:
-            line = raw.strip()
-            if not line:
+            # Anything else starts a new construct.
+            if state == "header":
+                # Tag line inside a loop_ header.
+                headers.append(line.split()[0])
+                category = _tag_category(headers[0])
                 continue
-            if line == "loop_":
-                in_loop = True
-                candidate = []
+            if state == "item" and _tag_category(line.split()[0]) == category:
+                add_item(line)
                 continue
-            if not in_loop:
+
+            finish()
+            state, category, headers, data = "", "", [], []
+            if wanted.issubset(found):
+                break
+            if line.startswith("data_"):
+                blocks += 1
+                if blocks > 1:
+                    break
                 continue
-            if line.startswith("_atom_site."):
-                candidate.append(line)
+            if line.lower() == "loop_":
+                state = "header"
                 continue
-            if candidate:
-                headers = candidate
-                break
-    if not headers:
+            if first == "_":
+                state = "item"
+                category = _tag_category(line.split()[0])
+                add_item(line)
+        finish()
+    return found
+
+
+def _lines_to_columns(category: str, headers: List[str], data: List[str]) -> Dict[str, np.ndarray]:
+    ncols = len(headers)
+    if category in ROW_PER_LINE_CATEGORIES:
+        return dict(zip(headers, _tokenize_cif_columns(data, ncols)))
+    tokens = _tokenize_cif_block(data)
+    tokens = tokens[: len(tokens) - len(tokens) % ncols]
+    return {h: np.array(tokens[j::ncols], dtype=str) for j, h in enumerate(headers)}
+
+
+def read_cif_categories(cif_path: Path, categories: Iterable[str]) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Read several mmCIF categories (e.g. "_atom_site", "_struct_conn",
+    "_pdbx_poly_seq_scheme") in one pass. Each category maps full item names to NumPy
+    string columns; categories missing from the file are omitted.
+    """
+    found = read_cif_lines(cif_path, categories)
+    return {cat: _lines_to_columns(cat, headers, data) for cat, (headers, data) in found.items()}
+
+
+def read_atom_site_columns(cif_path: Path) -> Dict[str, np.ndarray]:
+    """
+    Read the _atom_site loop into a columnar table: one NumPy string array per
+    _atom_site field (keyed by the full header, e.g. "_atom_site.Cartn_x").
+    """
+    columns = read_cif_categories(cif_path, ["_atom_site"]).get("_atom_site")
+    if columns is None:
         raise RuntimeError(f"Could not find _atom_site loop in {cif_path}")
-    return headers, _rows()
+    return columns
 
 
 def _altloc_rank(altloc: str) -> int:
@@ -154,19 +323,8 @@ def _altloc_rank(altloc: str) -> int:
     return 0
 
 
-def _safe_float(value: str, default: float) -> float:
-    if value in (".", "?"):
-        return default
-    return float(value)
-
-
-def _safe_int(value: str) -> int:
-    if value in (".", "?"):
-        raise ValueError("Missing integer value")
-    return int(value)
-
-
-def _build_chain_map(chain_ids: List[str]) -> Dict[str, str]:
+def _build_chain_map(chain_ids: List[str], *, strict: bool = True) -> Dict[str, str]:
+    # With strict=False, chains beyond the single-character IDs map to "" (mmCIF-only output).
     used = set()
     mapping: Dict[str, str] = {}
     for auth in chain_ids:
@@ -182,133 +340,251 @@ def _build_chain_map(chain_ids: List[str]) -> Dict[str, str]:
                 used.add(candidate)
                 break
         else:
-            raise RuntimeError(
-                "Ran out of PDB chain IDs; consider exporting mmCIF instead of PDB."
-            )
+            if strict:
+                raise RuntimeError(
+                    "Ran out of PDB chain IDs; consider exporting mmCIF instead of PDB (--format cif)."
+                )
+            mapping[auth] = ""
     return mapping
 
 
-def parse_cif_atoms(
+ATOM_SITE_REQUIRED = [
+    "_atom_site.group_PDB",
+    "_atom_site.id",
+    "_atom_site.type_symbol",
+    "_atom_site.label_alt_id",
+    "_atom_site.auth_seq_id",
+    "_atom_site.auth_comp_id",
+    "_atom_site.auth_asym_id",
+    "_atom_site.auth_atom_id",
+    "_atom_site.pdbx_PDB_ins_code",
+    "_atom_site.Cartn_x",
+    "_atom_site.Cartn_y",
+    "_atom_site.Cartn_z",
+    "_atom_site.occupancy",
+    "_atom_site.B_iso_or_equiv",
+    "_atom_site.pdbx_PDB_model_num",
+]
+
+def _column_float(values: np.ndarray, default: float) -> np.ndarray:
+    # Columns decoded from BinaryCIF are already numeric unless they contain masked values.
+    if values.dtype.kind in "fiu":
+        return values.astype(np.float64)
+    missing = (values == ".") | (values == "?")
+    if not missing.any():
+        return values.astype(np.float64)
+    out = np.full(len(values), default, dtype=np.float64)
+    out[~missing] = values[~missing].astype(np.float64)
+    return out
+
+
+def _column_int(values: np.ndarray) -> np.ndarray:
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64)
+    if ((values == ".") | (values == "?")).any():
+        raise ValueError("Missing integer value")
+    return values.astype(np.int64)
+
+
+def _column_upper(values: np.ndarray) -> np.ndarray:
+    # Few distinct values (elements, residue names): upper-case those once.
+    uniq, inverse = np.unique(values, return_inverse=True)
+    return np.char.upper(uniq)[inverse]
+
+
+def _column_optional(values: np.ndarray) -> np.ndarray:
+    return np.where((values == ".") | (values == "?"), "", values)
+
+
+def _column_label(values: Optional[np.ndarray], rows: np.ndarray) -> np.ndarray:
+    # Optional label_* column as text ("?" when the file does not have it).
+    if values is None:
+        return np.full(len(rows), "?")
+    return values[rows].astype(str)
+
+
+def _choose_altlocs(
+    keys: List[np.ndarray], occupancy: np.ndarray, altloc: np.ndarray
+) -> np.ndarray:
+    """
+    Return row indices keeping one altloc per atom key (highest occupancy; 'A' wins ties).
+
+    Keys are grouped with a lexsort; only atoms that actually have several altlocs go
+    through the sequential tie-break, in file order, like the row-by-row parser.
+    """
+    n = len(occupancy)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    codes = [np.unique(k, return_inverse=True)[1] for k in keys]
+    order = np.lexsort(codes[::-1])
+    changed = np.zeros(n, dtype=bool)
+    changed[0] = True
+    for c in codes:
+        sc = c[order]
+        changed[1:] |= sc[1:] != sc[:-1]
+    key_id = np.empty(n, dtype=np.int64)
+    key_id[order] = np.cumsum(changed) - 1
+
+    counts = np.bincount(key_id)
+    keep = counts[key_id] == 1
+    multi = np.flatnonzero(~keep)
+    if len(multi):
+        best: Dict[int, int] = {}
+        for i in multi.tolist():
+            k = int(key_id[i])
+            j = best.get(k)
+            if j is None:
+                best[k] = i
+            elif occupancy[i] > occupancy[j] + 1e-6:
+                best[k] = i
+            elif abs(occupancy[i] - occupancy[j]) <= 1e-6 and _altloc_rank(str(altloc[i])) > _altloc_rank(""):
+                best[k] = i
+        keep[np.fromiter(best.values(), dtype=np.int64, count=len(best))] = True
+    return np.flatnonzero(keep)
+
+
+def parse_cif_columns(
     cif_path: Path,
     *,
     heavy_only: bool = True,
     drop_hoh: bool = True,
     model_num: int = 1,
-) -> Tuple[List[AtomRecord], Dict[str, str]]:
-    headers, rows = _iter_atom_site_loop(cif_path)
-    col = {h: i for i, h in enumerate(headers)}
-
-    required = [
-        "_atom_site.group_PDB",
-        "_atom_site.id",
-        "_atom_site.type_symbol",
-        "_atom_site.label_alt_id",
-        "_atom_site.auth_seq_id",
-        "_atom_site.auth_comp_id",
-        "_atom_site.auth_asym_id",
-        "_atom_site.auth_atom_id",
-        "_atom_site.pdbx_PDB_ins_code",
-        "_atom_site.Cartn_x",
-        "_atom_site.Cartn_y",
-        "_atom_site.Cartn_z",
-        "_atom_site.occupancy",
-        "_atom_site.B_iso_or_equiv",
-        "_atom_site.pdbx_PDB_model_num",
-    ]
-    missing = [h for h in required if h not in col]
-    if missing:
-        raise RuntimeError(f"Missing expected _atom_site columns: {missing}")
+    strict_chain_ids: bool = True,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+    """
+    Parse the _atom_site loop of an mmCIF or BinaryCIF file into a columnar atom table.
 
-    # First pass: choose one altloc per atom key (highest occupancy).
-    chosen: Dict[Tuple[str, str, int, str, str, str], AtomRecord] = {}
+    Returns (columns, chain_map) where `columns` maps each name in ATOM_COLUMNS to a
+    NumPy array (one entry per kept atom, sorted by atom id). Filtering and altloc
+    selection match `parse_cif_atoms`.
+    """
+    if is_binary_cif(cif_path):
+        raw = read_bcif_categories(cif_path, ["_atom_site"]).get("_atom_site")
+        if raw is None:
+            raise RuntimeError(f"Could not find _atom_site category in {cif_path}")
+    else:
+        raw = read_atom_site_columns(cif_path)
+    return atom_table_from_atom_site(
+        raw,
+        heavy_only=heavy_only,
+        drop_hoh=drop_hoh,
+        model_num=model_num,
+        strict_chain_ids=strict_chain_ids,
+    )
 
-    # Keep chain appearance order (for mapping).
-    chain_order: List[str] = []
-    seen_chains = set()
 
-    for fields in rows:
-        # Skip malformed lines.
-        if len(fields) < len(headers):
-            continue
+def atom_table_from_atom_site(
+    raw: Dict[str, np.ndarray],
+    *,
+    heavy_only: bool = True,
+    drop_hoh: bool = True,
+    model_num: int = 1,
+    strict_chain_ids: bool = True,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+    """
+    Build the atom table from raw _atom_site columns (text or BinaryCIF decoded).
 
-        pdb_model = _safe_int(fields[col["_atom_site.pdbx_PDB_model_num"]])
-        if pdb_model != model_num:
-            continue
+    `strict_chain_ids=False` allows more chains than single-character PDB chain IDs
+    (the extra chains get an empty `chain_pdb`; only mmCIF output can represent them).
+    """
+    missing = [h for h in ATOM_SITE_REQUIRED if h not in raw]
+    if missing:
+        raise RuntimeError(f"Missing expected _atom_site columns: {missing}")
 
-        element = fields[col["_atom_site.type_symbol"]].upper()
-        if heavy_only and element == "H":
-            continue
+    def field(name: str) -> np.ndarray:
+        return raw[f"_atom_site.{name}"]
+
+    keep = _column_int(field("pdbx_PDB_model_num")) == model_num
+    element = _column_upper(field("type_symbol"))
+    if heavy_only:
+        keep &= element != "H"
+    resname = _column_upper(field("auth_comp_id"))
+    if drop_hoh:
+        keep &= resname != "HOH"
+    rows = np.flatnonzero(keep)
+
+    group = _column_upper(field("group_PDB")[rows])
+    chain_auth = field("auth_asym_id")[rows]
+    resseq = _column_int(field("auth_seq_id")[rows])
+    icode = _column_optional(field("pdbx_PDB_ins_code")[rows])
+    atomname = field("auth_atom_id")[rows]
+    element = element[rows]
+    resname = resname[rows]
+    occupancy = _column_float(field("occupancy")[rows], default=1.0)
+    # label_* ids are only carried through for the mmCIF writer.
+    label_asym = _column_label(raw.get("_atom_site.label_asym_id"), rows)
+    label_seq = _column_label(raw.get("_atom_site.label_seq_id"), rows)
+
+    # Chain appearance order (for mapping), before altloc selection.
+    chains, first, chain_inv = np.unique(chain_auth, return_index=True, return_inverse=True)
+    chain_order = [str(c) for c in chains[np.argsort(first, kind="stable")]]
+    chain_map = _build_chain_map(chain_order, strict=strict_chain_ids)
+    chain_pdb = np.array([chain_map[str(c)] for c in chains], dtype=str)[chain_inv]
+
+    altloc = _column_optional(field("label_alt_id")[rows])
+    # Key that identifies the same atom across altlocs.
+    sel = _choose_altlocs([group, chain_auth, resseq, icode, resname, atomname], occupancy, altloc)
+
+    atom_id = _column_int(field("id")[rows[sel]])
+    order = sel[np.argsort(atom_id, kind="stable")]
+    src = rows[order]
+    columns: Dict[str, np.ndarray] = {
+        "group": group[order],
+        "atom_id": np.sort(atom_id, kind="stable"),
+        "element": element[order],
+        "resname": resname[order],
+        "chain_auth": chain_auth[order],
+        "chain_pdb": chain_pdb[order],
+        # segid derived from auth id.
+        "segid": chain_auth[order].astype("<U4"),
+        "resseq": resseq[order],
+        "icode": icode[order],
+        "atomname": atomname[order],
+        "x": _column_float(field("Cartn_x")[src], default=0.0),
+        "y": _column_float(field("Cartn_y")[src], default=0.0),
+        "z": _column_float(field("Cartn_z")[src], default=0.0),
+        "occupancy": occupancy[order],
+        "bfactor": _column_float(field("B_iso_or_equiv")[src], default=0.0),
+        "label_asym": label_asym[order],
+        "label_seq": label_seq[order],
+    }
+    return columns, chain_map
+
+
+def parse_cif_table(
+    cif_path: Path,
+    *,
+    heavy_only: bool = True,
+    drop_hoh: bool = True,
+    model_num: int = 1,
+    strict_chain_ids: bool = True,
+) -> Tuple[AtomTable, Dict[str, str]]:
+    columns, chain_map = parse_cif_columns(
+        cif_path,
+        heavy_only=heavy_only,
+        drop_hoh=drop_hoh,
+        model_num=model_num,
+        strict_chain_ids=strict_chain_ids,
+    )
+    return AtomTable(columns), chain_map
 
-        resname = fields[col["_atom_site.auth_comp_id"]].upper()
-        if drop_hoh and resname == "HOH":
-            continue
 
-        group = fields[col["_atom_site.group_PDB"]].upper()
-        atom_id = _safe_int(fields[col["_atom_site.id"]])
-        altloc_raw = fields[col["_atom_site.label_alt_id"]]
-        altloc = "" if altloc_raw in (".", "?") else altloc_raw
-        resseq = _safe_int(fields[col["_atom_site.auth_seq_id"]])
-        chain_auth = fields[col["_atom_site.auth_asym_id"]]
-        atomname = fields[col["_atom_site.auth_atom_id"]]
-        icode_raw = fields[col["_atom_site.pdbx_PDB_ins_code"]]
-        icode = "" if icode_raw in (".", "?") else icode_raw
-        x = _safe_float(fields[col["_atom_site.Cartn_x"]], default=0.0)
-        y = _safe_float(fields[col["_atom_site.Cartn_y"]], default=0.0)
-        z = _safe_float(fields[col["_atom_site.Cartn_z"]], default=0.0)
-        occupancy = _safe_float(fields[col["_atom_site.occupancy"]], default=1.0)
-        bfactor = _safe_float(fields[col["_atom_site.B_iso_or_equiv"]], default=0.0)
-
-        if chain_auth not in seen_chains:
-            chain_order.append(chain_auth)
-            seen_chains.add(chain_auth)
-
-        # Key that identifies the same atom across altlocs.
-        key = (group, chain_auth, resseq, icode, resname, atomname)
-
-        # chain_pdb assigned later via mapping; segid derived from auth id.
-        record = AtomRecord(
-            group=group,
-            atom_id=atom_id,
-            element=element,
-            resname=resname,
-            chain_auth=chain_auth,
-            chain_pdb="?",
-            segid=chain_auth[:4],
-            resseq=resseq,
-            icode=icode,
-            atomname=atomname,
-            x=x,
-            y=y,
-            z=z,
-            occupancy=occupancy,
-            bfactor=bfactor,
-        )
+def records_from_columns(columns: Dict[str, np.ndarray]) -> List[AtomRecord]:
+    values = [columns[name].tolist() for name in ATOM_COLUMNS]
+    return [AtomRecord(*row) for row in zip(*values)]
 
-        best = chosen.get(key)
-        if best is None:
-            chosen[key] = record
-            continue
-        if record.occupancy > best.occupancy + 1e-6:
-            chosen[key] = record
-            continue
-        if abs(record.occupancy - best.occupancy) <= 1e-6:
-            if _altloc_rank(altloc) > _altloc_rank(""):
-                chosen[key] = record
-
-    # Build chain id mapping for PDB output.
-    chain_map = _build_chain_map(chain_order)
-
-    records = [
-        AtomRecord(
-            **{
-                **r.__dict__,
-                "chain_pdb": chain_map[r.chain_auth],
-            }
-        )
-        for r in chosen.values()
-    ]
-    records.sort(key=lambda r: r.atom_id)
-    return records, chain_map
+
+def parse_cif_atoms(
+    cif_path: Path,
+    *,
+    heavy_only: bool = True,
+    drop_hoh: bool = True,
+    model_num: int = 1,
+) -> Tuple[List[AtomRecord], Dict[str, str]]:
+    columns, chain_map = parse_cif_columns(
+        cif_path, heavy_only=heavy_only, drop_hoh=drop_hoh, model_num=model_num
+    )
+    return records_from_columns(columns), chain_map
 
 
 def _format_atom_name(atomname: str, element: str) -> str:
@@ -346,10 +622,6 @@ def format_pdb_line(serial: int, r: AtomRecord) -> str:
     )
 
 
-def write_pdb(path: Path, records: Iterable[AtomRecord]) -> None:
-    write_pdb_with_remarks(path, records, remarks=None)
-
-
 def _format_remark_lines(text: str, remark_num: int = 1) -> List[str]:
     prefix = f"REMARK {remark_num:3d} "
     width = 80 - len(prefix)
@@ -395,8 +667,7 @@ def _format_remark_lines(text: str, remark_num: int = 1) -> List[str]:
 def write_pdb_with_remarks(
     path: Path, records: Iterable[AtomRecord], *, remarks: Optional[List[str]]
 ) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as out:
+    with open_output(path, "wt", encoding="utf-8") as out:
         if remarks:
             for r in remarks:
                 for line in _format_remark_lines(r):
@@ -410,6 +681,223 @@ def write_pdb_with_remarks(
         out.write("END\n")
 
 
+# Width of a rendered ATOM/HETATM line (without newline) and its serial-number slot.
+_PDB_LINE_WIDTH = 80
+_SERIAL_SLOT = slice(6, 11)
+_MAX_CACHED_SERIAL = 99999
+
+
+def _fixed_point_bytes(values: np.ndarray, width: int, decimals: int) -> Optional[np.ndarray]:
+    """
+    "%{width}.{decimals}f" of every value as an (n, width) uint8 block, or None if a value
+    is not finite or does not fit. Digits come from integer arithmetic on the whole column;
+    values within rounding noise of a half-way point are rounded by Python's formatter.
+    """
+    v = np.asarray(values, dtype=np.float64)
+    n = len(v)
+    negative = np.signbit(v)
+    digits = width - (1 if decimals else 0) - negative.astype(np.int64)
+    if not np.isfinite(v).all():
+        return None
+    exact = np.abs(v) * 10**decimals
+    if (exact >= 10.0 ** digits).any():
+        return None
+    scaled = np.rint(exact).astype(np.int64)
+    for i in np.flatnonzero(np.abs(exact - np.floor(exact) - 0.5) < 1e-6).tolist():
+        scaled[i] = int(f"{abs(float(v[i])):.{decimals}f}".replace(".", ""))
+    if (scaled >= 10**digits).any():
+        return None
+
+    out = np.full((n, width), ord(" "), dtype=np.uint8)
+    col = width - 1
+    for _ in range(decimals):
+        out[:, col] = ord("0") + scaled % 10
+        scaled //= 10
+        col -= 1
+    if decimals:
+        out[:, col] = ord(".")
+        col -= 1
+    # Units digit is always written; higher digits only while something is left.
+    lead = np.full(n, col, dtype=np.int64)
+    active = np.ones(n, dtype=bool)
+    while col >= 0 and active.any():
+        out[active, col] = ord("0") + scaled[active] % 10
+        lead[active] = col
+        scaled //= 10
+        active = scaled > 0
+        col -= 1
+    out[np.flatnonzero(negative), lead[negative] - 1] = ord("-")
+    return out
+
+
+def _text_bytes(width: int, fmt: Callable[..., str], *columns: np.ndarray) -> Optional[np.ndarray]:
+    """
+    `fmt(*values)` for each distinct combination of `columns` values, gathered into an
+    (n, width) uint8 block; None if a rendered field is not exactly `width` bytes.
+    """
+    columns = tuple(np.asarray(col, dtype=str) for col in columns)
+    codes = np.zeros(len(columns[0]), dtype=np.int64)
+    for col in columns:
+        uniq, inverse = np.unique(col, return_inverse=True)
+        codes = codes * len(uniq) + inverse.reshape(-1)
+    _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    rendered = [fmt(*(str(col[i]) for col in columns)).encode("utf-8") for i in first.tolist()]
+    if any(len(b) != width for b in rendered):
+        return None
+    return np.frombuffer(b"".join(rendered), dtype=np.uint8).reshape(len(rendered), width)[inverse.reshape(-1)]
+
+
+def _render_line_block(columns: Dict[str, np.ndarray]) -> Optional[np.ndarray]:
+    # One (n, 81) uint8 row per atom, byte-identical to format_pdb_line with serial 0
+    # (newline included), assembled field by field from the columns. None if a field
+    # does not fit its columns (e.g. an out-of-range coordinate).
+    n = len(columns["x"])
+    fields = (
+        (0, _text_bytes(6, lambda g: "HETATM" if g == "HETATM" else "ATOM  ", columns["group"])),
+        (12, _text_bytes(4, _format_atom_name, columns["atomname"], columns["element"])),
+        (17, _text_bytes(3, lambda r: (r or "UNK")[:3].rjust(3), columns["resname"])),
+        (21, _text_bytes(1, lambda c: (c or " ")[:1], columns["chain_pdb"])),
+        (22, _fixed_point_bytes(columns["resseq"], 4, 0)),
+        (26, _text_bytes(1, lambda i: (i or " ")[:1], columns["icode"])),
+        (30, _fixed_point_bytes(columns["x"], 8, 3)),
+        (38, _fixed_point_bytes(columns["y"], 8, 3)),
+        (46, _fixed_point_bytes(columns["z"], 8, 3)),
+        (54, _fixed_point_bytes(columns["occupancy"], 6, 2)),
+        (60, _fixed_point_bytes(columns["bfactor"], 6, 2)),
+        (72, _text_bytes(4, lambda s: (s or "")[:4].ljust(4), columns["segid"])),
+        (76, _text_bytes(2, lambda e: (e or "").strip().upper()[:2].rjust(2), columns["element"])),
+    )
+    block = np.full((n, _PDB_LINE_WIDTH + 1), ord(" "), dtype=np.uint8)
+    for start, field_bytes in fields:
+        if field_bytes is None:
+            return None
+        block[:, start : start + field_bytes.shape[1]] = field_bytes
+    block[:, _SERIAL_SLOT.stop - 1] = ord("0")
+    block[:, _PDB_LINE_WIDTH] = ord("\n")
+    return block
+
+
+class PdbLineCache:
+    """
+    Pre-rendered PDB atom lines, kept per column set (base table columns and the extra
+    rows of derived tables). Every table derived from the same base reuses the base
+    lines; only rows added or changed by `AtomTable.apply` (the mutated residues) are
+    rendered again. Output blocks are gathered rows with the serial slot filled in.
+    """
+
+    def __init__(self, max_entries: int = 16) -> None:
+        self._entries: List[Tuple[Dict[str, np.ndarray], Optional[np.ndarray]]] = []
+        self._max_entries = max_entries
+
+    def _lines(self, columns: Dict[str, np.ndarray]) -> Optional[np.ndarray]:
+        # Column sets are matched by identity (they are shared, never mutated).
+        for cols, lines in self._entries:
+            if cols is columns:
+                return lines
+        lines = _render_line_block(columns)
+        self._entries.append((columns, lines))
+        if len(self._entries) > self._max_entries:
+            del self._entries[1]  # keep the first entry (normally the WT base)
+        return lines
+
+    def prepare(self, table: AtomTable) -> bool:
+        """Render the line sets `table` needs; False if it has to use the plain writer."""
+        if len(table) > _MAX_CACHED_SERIAL:
+            return False
+        _, base, extra = table.pool_layout()
+        if self._lines(base) is None:
+            return False
+        return extra is None or self._lines(extra) is not None
+
+    def block(self, table: AtomTable) -> Optional[np.ndarray]:
+        """(n, 81) uint8 lines for `table` with serials 1..n, or None (plain writer needed)."""
+        if not self.prepare(table):
+            return None
+        order, base, extra = table.pool_layout()
+        base_lines = self._lines(base)
+        if extra is None:
+            out = base_lines[order]
+        else:
+            n_base = len(base_lines)
+            extra_lines = self._lines(extra)
+            out = np.empty((len(order), _PDB_LINE_WIDTH + 1), dtype=np.uint8)
+            from_base = order < n_base
+            out[from_base] = base_lines[order[from_base]]
+            out[~from_base] = extra_lines[order[~from_base] - n_base]
+        _fill_serials(out)
+        return out
+
+
+def _fill_serials(block: np.ndarray) -> None:
+    # Right-aligned "%5d" serials 1..n written into columns 7-11.
+    serial = np.arange(1, len(block) + 1, dtype=np.int64)
+    width = _SERIAL_SLOT.stop - _SERIAL_SLOT.start
+    for k in range(width):
+        place = 10 ** (width - 1 - k)
+        digit = (serial // place % 10 + ord("0")).astype(np.uint8)
+        block[:, _SERIAL_SLOT.start + k] = np.where(serial >= place, digit, ord(" ")) if place > 1 else digit
+
+
+def write_pdb_cached(path: Path, table: AtomTable, *, remarks: Optional[List[str]], cache: PdbLineCache) -> None:
+    """Same output as write_pdb_with_remarks(path, table.rows(), ...) using cached lines."""
+    block = cache.block(table)
+    if block is None:
+        write_pdb_with_remarks(path, table.rows(), remarks=remarks)
+        return
+    header = "".join(line + "\n" for r in (remarks or []) for line in _format_remark_lines(r))
+    with open_output(path, "wb") as out:
+        out.write(header.encode("utf-8"))
+        out.write(block.tobytes())
+        out.write(b"END\n")
+
+
+MODEL_FORMATS = ("pdb", "cif")
+
+
+def model_paths(pdb_path: Path, formats: Sequence[str] = ("pdb",), compress: bool = False) -> List[Path]:
+    """Files written for one model named by its .pdb path: one per format, ".gz" if `compress`."""
+    gz = ".gz" if compress else ""
+    return [pdb_path.with_suffix(f".{fmt}{gz}") for fmt in formats]
+
+
+def write_model_files(
+    outputs: List[Tuple[Path, AtomTable, Optional[List[str]]]],
+    *,
+    cache: PdbLineCache,
+    formats: Sequence[str] = ("pdb",),
+    compress: bool = False,
+    threads: int = 0,
+) -> None:
+    """
+    Write several (pdb_path, table, remarks) outputs in each of `formats` (see model_paths).
+    PDB lines are rendered once (serially, the formatting is pure Python); gathering,
+    mmCIF column formatting, compression and writing run in a thread pool.
+    """
+    jobs = []
+    for pdb_path, table, remarks in outputs:
+        for fmt, path in zip(formats, model_paths(pdb_path, formats, compress)):
+            jobs.append((fmt, path, table, remarks, pdb_path.stem))
+    if "pdb" in formats:
+        for _, table, _ in outputs:
+            cache.prepare(table)
+
+    def write_one(job: Tuple[str, Path, AtomTable, Optional[List[str]], str]) -> None:
+        fmt, path, table, remarks, data_name = job
+        if fmt == "cif":
+            write_mmcif(path, table, data_name=data_name, remarks=remarks)
+        else:
+            write_pdb_cached(path, table, remarks=remarks, cache=cache)
+
+    threads = threads if threads > 0 else min(len(jobs), os.cpu_count() or 1)
+    if threads <= 1:
+        for job in jobs:
+            write_one(job)
+        return
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for f in [pool.submit(write_one, job) for job in jobs]:
+            f.result()
+
+
 def _vec_sub(a: Tuple[float, float, float], b: Tuple[float, float, float]) -> Tuple[float, float, float]:
     return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
 
@@ -462,38 +950,76 @@ def _rodrigues_rotate(
     return _vec_add(_vec_add(term1, term2), term3)
 
 
+def _residue_rows(table: AtomTable, chain_auth: str, resseq: int, icode: str) -> np.ndarray:
+    rows = table.residue_index().residue_rows(chain_auth, resseq, icode)
+    if isinstance(rows, slice):
+        return np.arange(rows.start, rows.stop, dtype=np.int64)
+    return rows
+
+
+def _atoms_by_name(table: AtomTable, rows: np.ndarray) -> Dict[str, AtomRow]:
+    return {table.value("atomname", int(i)).strip().upper(): table.row(int(i)) for i in rows}
+
+
+def _new_atom(
+    template: AtomRow,
+    *,
+    atom_id: int,
+    atomname: str,
+    element: str,
+    resname: str,
+    xyz: Tuple[float, float, float],
+) -> Dict[str, object]:
+    # New side-chain atom in the template's residue (chain/segid/label ids/occupancy/B copied).
+    return {
+        "group": "ATOM",
+        "atom_id": atom_id,
+        "element": element,
+        "resname": resname,
+        "chain_auth": template.chain_auth,
+        "chain_pdb": template.chain_pdb,
+        "segid": template.segid,
+        "resseq": template.resseq,
+        "icode": template.icode,
+        "atomname": atomname,
+        "x": xyz[0],
+        "y": xyz[1],
+        "z": xyz[2],
+        "occupancy": template.occupancy,
+        "bfactor": template.bfactor,
+        "label_asym": template.label_asym,
+        "label_seq": template.label_seq,
+    }
+
+
 def mutate_nd6_m64v(
-    records: List[AtomRecord],
+    table: AtomTable,
     *,
     chain_auth: str = "m",
     resseq: int = 64,
     icode: str = "",
-) -> List[AtomRecord]:
+) -> AtomTable:
     """
     Apply MET->VAL at (chain_auth, resseq, icode) using heavy atoms only.
     """
-    target = [r for r in records if r.chain_auth == chain_auth and r.resseq == resseq and r.icode == icode]
-    if not target:
+    target = _residue_rows(table, chain_auth, resseq, icode)
+    if len(target) == 0:
         raise RuntimeError(f"Could not find target residue {chain_auth}:{resseq}{icode} in records")
 
     # Collect coordinates for CA/CB/CG (MET).
-    atom_by_name = {r.atomname.strip().upper(): r for r in target}
+    atom_by_name = _atoms_by_name(table, target)
+    edits = EditSet()
     if "CA" not in atom_by_name or "CB" not in atom_by_name or "CG" not in atom_by_name:
         # Still do a minimal rename/remove; psfgen can rebuild missing atoms later.
-        mutated: List[AtomRecord] = []
-        for r in records:
-            if r.chain_auth != chain_auth or r.resseq != resseq or r.icode != icode:
-                mutated.append(r)
-                continue
-            if r.atomname.strip().upper() in {"SD", "CE"}:
-                continue
-            atomname = "CG1" if r.atomname.strip().upper() == "CG" else r.atomname
-            mutated.append(
-                AtomRecord(
-                    **{**r.__dict__, "resname": "VAL", "atomname": atomname}
-                )
-            )
-        return mutated
+        for i in target.tolist():
+            atom = table.value("atomname", i).strip().upper()
+            if atom in {"SD", "CE"}:
+                edits.delete(i)
+            elif atom == "CG":
+                edits.update(i, resname="VAL", atomname="CG1")
+            else:
+                edits.update(i, resname="VAL")
+        return table.apply(edits)
 
     ca = atom_by_name["CA"]
     cb = atom_by_name["CB"]
@@ -511,79 +1037,54 @@ def mutate_nd6_m64v(
     v_rot = _rodrigues_rotate(v, axis_unit, angle_rad=2.0 * math.pi / 3.0)
     cg2_xyz = _vec_add(cb_xyz, v_rot)
 
-    cg2 = AtomRecord(
-        group="ATOM",
-        atom_id=max(r.atom_id for r in records) + 1,
-        element="C",
-        resname="VAL",
-        chain_auth=cg.chain_auth,
-        chain_pdb=cg.chain_pdb,
-        segid=cg.segid,
-        resseq=resseq,
-        icode=icode,
-        atomname="CG2",
-        x=cg2_xyz[0],
-        y=cg2_xyz[1],
-        z=cg2_xyz[2],
-        occupancy=cg.occupancy,
-        bfactor=cg.bfactor,
-    )
+    cg2 = _new_atom(cg, atom_id=table.next_atom_id(), atomname="CG2", element="C", resname="VAL", xyz=cg2_xyz)
 
-    mutated_records: List[AtomRecord] = []
     inserted_cg2 = False
-    for r in records:
-        if r.chain_auth != chain_auth or r.resseq != resseq or r.icode != icode:
-            mutated_records.append(r)
-            continue
-
-        atom = r.atomname.strip().upper()
+    for i in target.tolist():
+        atom = table.value("atomname", i).strip().upper()
         if atom in {"SD", "CE"}:
+            edits.delete(i)
             continue
         if atom == "CG":
-            mutated_records.append(
-                AtomRecord(**{**r.__dict__, "resname": "VAL", "atomname": "CG1"})
-            )
+            edits.update(i, resname="VAL", atomname="CG1")
             continue
 
-        mutated_records.append(AtomRecord(**{**r.__dict__, "resname": "VAL"}))
+        edits.update(i, resname="VAL")
 
-        # Insert CG2 right after CB if possible; if CB missing, it lands after CA/C/O etc.
+        # Insert CG2 right after CB if possible; if CB missing, it lands at the end.
         if not inserted_cg2 and atom == "CB":
-            mutated_records.append(cg2)
+            edits.insert_after(i, cg2)
             inserted_cg2 = True
 
     if not inserted_cg2:
-        mutated_records.append(cg2)
+        edits.insert_after(None, cg2)
 
-    return mutated_records
+    return table.apply(edits)
 
 
 def mutate_nd1_a52t(
-    records: List[AtomRecord],
+    table: AtomTable,
     *,
     chain_auth: str = "s",
     resseq: int = 52,
     icode: str = "",
-) -> List[AtomRecord]:
+) -> AtomTable:
     """
     Apply ALA->THR at (chain_auth, resseq, icode) using heavy atoms only.
 
     Adds OG1 and CG2 atoms with approximate tetrahedral geometry around CB.
     Downstream minimization (or rebuilding the residue with psfgen + guesscoord) is recommended.
     """
-    target = [r for r in records if r.chain_auth == chain_auth and r.resseq == resseq and r.icode == icode]
-    if not target:
+    target = _residue_rows(table, chain_auth, resseq, icode)
+    if len(target) == 0:
         raise RuntimeError(f"Could not find target residue {chain_auth}:{resseq}{icode} in records")
 
-    atom_by_name = {r.atomname.strip().upper(): r for r in target}
+    atom_by_name = _atoms_by_name(table, target)
+    edits = EditSet()
+    for i in target.tolist():
+        edits.update(i, resname="THR")
     if "CA" not in atom_by_name or "CB" not in atom_by_name:
-        mutated: List[AtomRecord] = []
-        for r in records:
-            if r.chain_auth != chain_auth or r.resseq != resseq or r.icode != icode:
-                mutated.append(r)
-                continue
-            mutated.append(AtomRecord(**{**r.__dict__, "resname": "THR"}))
-        return mutated
+        return table.apply(edits)
 
     ca = atom_by_name["CA"]
     cb = atom_by_name["CB"]
@@ -624,94 +1125,49 @@ def mutate_nd1_a52t(
     og1_xyz = _vec_add(cb_xyz, _vec_scale(dir_og1, cb_og))
     cg2_xyz = _vec_add(cb_xyz, _vec_scale(dir_cg2, cb_cg))
 
-    next_id = max(r.atom_id for r in records) + 1
-    og1 = AtomRecord(
-        group="ATOM",
-        atom_id=next_id,
-        element="O",
-        resname="THR",
-        chain_auth=cb.chain_auth,
-        chain_pdb=cb.chain_pdb,
-        segid=cb.segid,
-        resseq=resseq,
-        icode=icode,
-        atomname="OG1",
-        x=og1_xyz[0],
-        y=og1_xyz[1],
-        z=og1_xyz[2],
-        occupancy=cb.occupancy,
-        bfactor=cb.bfactor,
-    )
-
-    cg2 = AtomRecord(
-        group="ATOM",
-        atom_id=next_id + 1,
-        element="C",
-        resname="THR",
-        chain_auth=cb.chain_auth,
-        chain_pdb=cb.chain_pdb,
-        segid=cb.segid,
-        resseq=resseq,
-        icode=icode,
-        atomname="CG2",
-        x=cg2_xyz[0],
-        y=cg2_xyz[1],
-        z=cg2_xyz[2],
-        occupancy=cb.occupancy,
-        bfactor=cb.bfactor,
-    )
+    next_id = table.next_atom_id()
+    og1 = _new_atom(cb, atom_id=next_id, atomname="OG1", element="O", resname="THR", xyz=og1_xyz)
+    cg2 = _new_atom(cb, atom_id=next_id + 1, atomname="CG2", element="C", resname="THR", xyz=cg2_xyz)
 
-    mutated_records: List[AtomRecord] = []
-    inserted = False
-    for r in records:
-        if r.chain_auth != chain_auth or r.resseq != resseq or r.icode != icode:
-            mutated_records.append(r)
-            continue
-
-        atom = r.atomname.strip().upper()
-        mutated_records.append(AtomRecord(**{**r.__dict__, "resname": "THR"}))
-
-        if not inserted and atom == "CB":
-            mutated_records.append(og1)
-            mutated_records.append(cg2)
-            inserted = True
-
-    if not inserted:
-        mutated_records.append(og1)
-        mutated_records.append(cg2)
-
-    return mutated_records
+    cb_rows = [i for i in target.tolist() if table.value("atomname", i).strip().upper() == "CB"]
+    after = cb_rows[0] if cb_rows else None
+    edits.insert_after(after, og1)
+    edits.insert_after(after, cg2)
+    return table.apply(edits)
 
 
 def mutate_nd4_r340h(
-    records: List[AtomRecord],
+    table: AtomTable,
     *,
     chain_auth: str = "r",
     resseq: int = 340,
     icode: str = "",
-) -> List[AtomRecord]:
+) -> AtomTable:
     """
     Apply ARG->HIS at (chain_auth, resseq, icode) using heavy atoms only.
 
     Builds an approximate imidazole ring based on the local CB/CG and existing ARG sidechain direction.
     Downstream minimization (or rebuilding the residue with psfgen + guesscoord) is recommended.
     """
-    target = [r for r in records if r.chain_auth == chain_auth and r.resseq == resseq and r.icode == icode]
-    if not target:
+    target = _residue_rows(table, chain_auth, resseq, icode)
+    if len(target) == 0:
         raise RuntimeError(f"Could not find target residue {chain_auth}:{resseq}{icode} in records")
 
-    atom_by_name = {r.atomname.strip().upper(): r for r in target}
+    atom_by_name = _atoms_by_name(table, target)
+    edits = EditSet()
+    cg_row: Optional[int] = None
+    for i in target.tolist():
+        atom = table.value("atomname", i).strip().upper()
+        if atom in {"N", "CA", "C", "O", "CB", "CG"}:
+            edits.update(i, resname="HIS")
+            if cg_row is None and atom == "CG":
+                cg_row = i
+        else:
+            # Drop ARG-specific sidechain atoms (CD/NE/CZ/NH1/NH2).
+            edits.delete(i)
     if "CB" not in atom_by_name or "CG" not in atom_by_name:
-        mutated: List[AtomRecord] = []
-        for r in records:
-            if r.chain_auth != chain_auth or r.resseq != resseq or r.icode != icode:
-                mutated.append(r)
-                continue
-            # Minimal rename; psfgen can rebuild missing atoms later.
-            keep = r.atomname.strip().upper() in {"N", "CA", "C", "O", "CB", "CG"}
-            if keep:
-                mutated.append(AtomRecord(**{**r.__dict__, "resname": "HIS"}))
-        return mutated
+        # Minimal rename; psfgen can rebuild missing atoms later.
+        return table.apply(edits)
 
     cb = atom_by_name["CB"]
     cg = atom_by_name["CG"]
@@ -722,7 +1178,8 @@ def mutate_nd4_r340h(
 
     # Use CG->CD direction when available to orient the ring; otherwise fall back to CG->CA.
     if "CD" in atom_by_name:
-        ref = _vec_sub((atom_by_name["CD"].x, atom_by_name["CD"].y, atom_by_name["CD"].z), cg_xyz)
+        cd = atom_by_name["CD"]
+        ref = _vec_sub((cd.x, cd.y, cd.z), cg_xyz)
     elif "CA" in atom_by_name:
         ca = atom_by_name["CA"]
         ref = _vec_sub((ca.x, ca.y, ca.z), cg_xyz)
@@ -759,105 +1216,223 @@ def mutate_nd4_r340h(
     pos_ne2 = _pos(36.0)
     pos_cd2 = _pos(108.0)
 
-    next_id = max(r.atom_id for r in records) + 1
-
-    nd1 = AtomRecord(
-        group="ATOM",
-        atom_id=next_id,
-        element="N",
-        resname="HIS",
-        chain_auth=cg.chain_auth,
-        chain_pdb=cg.chain_pdb,
-        segid=cg.segid,
-        resseq=resseq,
-        icode=icode,
-        atomname="ND1",
-        x=pos_nd1[0],
-        y=pos_nd1[1],
-        z=pos_nd1[2],
-        occupancy=cg.occupancy,
-        bfactor=cg.bfactor,
-    )
-    cd2 = AtomRecord(
-        group="ATOM",
-        atom_id=next_id + 1,
-        element="C",
-        resname="HIS",
-        chain_auth=cg.chain_auth,
-        chain_pdb=cg.chain_pdb,
-        segid=cg.segid,
-        resseq=resseq,
-        icode=icode,
-        atomname="CD2",
-        x=pos_cd2[0],
-        y=pos_cd2[1],
-        z=pos_cd2[2],
-        occupancy=cg.occupancy,
-        bfactor=cg.bfactor,
-    )
-    ce1 = AtomRecord(
-        group="ATOM",
-        atom_id=next_id + 2,
-        element="C",
-        resname="HIS",
-        chain_auth=cg.chain_auth,
-        chain_pdb=cg.chain_pdb,
-        segid=cg.segid,
-        resseq=resseq,
-        icode=icode,
-        atomname="CE1",
-        x=pos_ce1[0],
-        y=pos_ce1[1],
-        z=pos_ce1[2],
-        occupancy=cg.occupancy,
-        bfactor=cg.bfactor,
-    )
-    ne2 = AtomRecord(
-        group="ATOM",
-        atom_id=next_id + 3,
-        element="N",
-        resname="HIS",
-        chain_auth=cg.chain_auth,
-        chain_pdb=cg.chain_pdb,
-        segid=cg.segid,
-        resseq=resseq,
-        icode=icode,
-        atomname="NE2",
-        x=pos_ne2[0],
-        y=pos_ne2[1],
-        z=pos_ne2[2],
-        occupancy=cg.occupancy,
-        bfactor=cg.bfactor,
-    )
+    next_id = table.next_atom_id()
+    ring = [
+        _new_atom(cg, atom_id=next_id, atomname="ND1", element="N", resname="HIS", xyz=pos_nd1),
+        _new_atom(cg, atom_id=next_id + 1, atomname="CD2", element="C", resname="HIS", xyz=pos_cd2),
+        _new_atom(cg, atom_id=next_id + 2, atomname="CE1", element="C", resname="HIS", xyz=pos_ce1),
+        _new_atom(cg, atom_id=next_id + 3, atomname="NE2", element="N", resname="HIS", xyz=pos_ne2),
+    ]
+    # Insert new HIS ring atoms after CG.
+    for atom in ring:
+        edits.insert_after(cg_row, atom)
+    return table.apply(edits)
 
-    mutated_records: List[AtomRecord] = []
-    inserted = False
-    for r in records:
-        if r.chain_auth != chain_auth or r.resseq != resseq or r.icode != icode:
-            mutated_records.append(r)
-            continue
 
-        atom = r.atomname.strip().upper()
-        if atom in {"N", "CA", "C", "O", "CB", "CG"}:
-            mutated_records.append(AtomRecord(**{**r.__dict__, "resname": "HIS"}))
-            if not inserted and atom == "CG":
-                # Insert new HIS ring atoms after CG.
-                mutated_records.append(nd1)
-                mutated_records.append(cd2)
-                mutated_records.append(ce1)
-                mutated_records.append(ne2)
-                inserted = True
-        else:
-            # Drop ARG-specific sidechain atoms (CD/NE/CZ/NH1/NH2).
-            continue
+def _protein_only(table: AtomTable) -> AtomTable:
+    return table.take(table.residue_index().atom_rows)
+
+
+def _chain_only(table: AtomTable, chain_auth: str) -> AtomTable:
+    return table.take(table.residue_index().chain_rows(chain_auth))
+
+
+def _repack(table: AtomTable, chain_auth: str, resseq: int, remarks: List[str]) -> Tuple[AtomTable, List[str]]:
+    notes: List[str] = []
+    edits = repack_edits(table, chain_auth, resseq, "", environment=SiteEnvironment(table), notes=notes)
+    return table.apply(edits), remarks + notes
+
+
+PdbOutput = Tuple[Path, AtomTable, Optional[List[str]]]
+
+# Builder sources hashed into the --incremental keys (the "script version").
+_SOURCE_FILES = (
+    "build_complexI_9TI4_models.py",
+    "atom_table.py",
+    "binary_cif.py",
+    "build_manifest.py",
+    "mmcif_writer.py",
+    "rotamer_scan.py",
+    "sidechain_templates.py",
+    "variant_engine.py",
+)
+
+# WT single-chain outputs of the default build.
+_WT_CHAIN_FILES = (
+    ("s", "nd1_chain_s_WT_heavy.pdb"),
+    ("r", "nd4_chain_r_WT_heavy.pdb"),
+    ("m", "nd6_chain_m_WT_heavy.pdb"),
+)
+
+
+@dataclass(frozen=True)
+class BuiltinVariant:
+    """One of the LHON variants built by the fixed-geometry mutators above."""
+
+    name: str
+    mutate: Callable[..., AtomTable]
+    chain_auth: str
+    resseq: int
+    chain_file: str
+    remarks: Tuple[str, ...]
+
+
+BUILTIN_VARIANTS = (
+    BuiltinVariant(
+        "ND1_A52T",
+        mutate_nd1_a52t,
+        "s",
+        52,
+        "nd1_chain_s_A52T_heavy.pdb",
+        ("Mutation applied: MT-ND1 chain s resid 52 ALA->THR.", "Variant: m.3460G>A (p.Ala52Thr)."),
+    ),
+    BuiltinVariant(
+        "ND4_R340H",
+        mutate_nd4_r340h,
+        "r",
+        340,
+        "nd4_chain_r_R340H_heavy.pdb",
+        ("Mutation applied: MT-ND4 chain r resid 340 ARG->HIS.", "Variant: m.11778G>A (p.Arg340His)."),
+    ),
+    BuiltinVariant(
+        "ND6_M64V",
+        mutate_nd6_m64v,
+        "m",
+        64,
+        "nd6_chain_m_M64V_heavy.pdb",
+        ("Mutation applied: MT-ND6 chain m resid 64 MET->VAL.", "Variant: m.14484T>C (p.Met64Val)."),
+    ),
+)
+
+
+def chain_map_path(outdir: Path, pdb_id: str) -> Path:
+    return outdir / f"complexI_{pdb_id}_chain_map.json"
+
+
+def wt_output_paths(outdir: Path, pdb_id: str) -> List[Path]:
+    """WT files: full, protein-only, then the single-chain models listed in _WT_CHAIN_FILES."""
+    paths = [
+        outdir / f"complexI_{pdb_id}_WT_heavy.pdb",
+        outdir / f"complexI_{pdb_id}_WT_heavy_proteinOnly.pdb",
+    ]
+    paths += [outdir / name for _, name in _WT_CHAIN_FILES]
+    return paths
+
 
-    if not inserted:
-        mutated_records.append(nd1)
-        mutated_records.append(cd2)
-        mutated_records.append(ce1)
-        mutated_records.append(ne2)
+def _builtin_paths(outdir: Path, pdb_id: str, v: BuiltinVariant) -> List[Path]:
+    return [
+        outdir / f"complexI_{pdb_id}_{v.name}_heavy.pdb",
+        outdir / f"complexI_{pdb_id}_{v.name}_heavy_proteinOnly.pdb",
+        outdir / v.chain_file,
+    ]
+
+
+def _builtin_outputs(
+    wt: AtomTable, v: BuiltinVariant, outdir: Path, pdb_id: str, common_remarks: List[str], *, scan: bool
+) -> List[PdbOutput]:
+    table = v.mutate(wt, chain_auth=v.chain_auth, resseq=v.resseq, icode="")
+    remarks = common_remarks
+    if scan:
+        table, remarks = _repack(table, v.chain_auth, v.resseq, common_remarks)
+    remarks = remarks + list(v.remarks)
+    full, protein_only, chain = _builtin_paths(outdir, pdb_id, v)
+    return [
+        (full, table, remarks),
+        (protein_only, _protein_only(table), remarks),
+        (chain, _chain_only(table, v.chain_auth), remarks),
+    ]
+
+
+def variant_output_paths(outdir: Path, pdb_id: str, variant: Variant) -> List[Path]:
+    """Files written for one spec variant: full, protein-only, then one per mutated chain."""
+    paths = [
+        outdir / f"complexI_{pdb_id}_{variant.name}_heavy.pdb",
+        outdir / f"complexI_{pdb_id}_{variant.name}_heavy_proteinOnly.pdb",
+    ]
+    paths += [outdir / f"chain_{chain}_{variant.name}_heavy.pdb" for chain in variant.chains]
+    return paths
+
+
+_WORKER_TABLE: Optional[AtomTable] = None
+_WORKER_CACHE: Optional[PdbLineCache] = None
 
-    return mutated_records
+
+def _init_variant_worker(table: AtomTable, cache: PdbLineCache) -> None:
+    global _WORKER_TABLE, _WORKER_CACHE
+    _WORKER_TABLE = table
+    _WORKER_CACHE = cache
+
+
+def _build_variant(task: Dict) -> List[Path]:
+    variant: Variant = task["variant"]
+    notes: List[str] = []
+    table = apply_variant(_WORKER_TABLE, variant, scan=task["scan"], notes=notes)
+    remarks = list(task["remarks"])
+    remarks += [f"Mutation applied: {m.describe()} (template side chain)." for m in variant.mutations]
+    remarks += notes + list(variant.remarks)
+
+    paths = variant_output_paths(task["outdir"], task["pdb_id"], variant)
+    outputs: List[PdbOutput] = [(paths[0], table, remarks), (paths[1], _protein_only(table), remarks)]
+    for chain, path in zip(variant.chains, paths[2:]):
+        outputs.append((path, _chain_only(table, chain), remarks))
+    formats, compress = task["formats"], task["compress"]
+    write_model_files(outputs, cache=_WORKER_CACHE, formats=formats, compress=compress)
+    return [f for path in paths for f in model_paths(path, formats, compress)]
+
+
+def build_variants(
+    wt: AtomTable,
+    variants: List[Variant],
+    *,
+    outdir: Path,
+    pdb_id: str,
+    remarks: List[str],
+    jobs: int = 0,
+    scan: bool = True,
+    cache: Optional[PdbLineCache] = None,
+    formats: Sequence[str] = ("pdb",),
+    compress: bool = False,
+) -> List[Path]:
+    """
+    Build every variant from the parsed WT table. With more than one variant they run in a
+    process pool; the WT table (and its pre-rendered PDB lines) is sent to each worker
+    once (initializer), tasks only carry the variant spec.
+    """
+    if cache is None:
+        cache = PdbLineCache()
+    if "pdb" in formats:
+        cache.prepare(wt)
+    tasks = [
+        {
+            "variant": v,
+            "outdir": outdir,
+            "pdb_id": pdb_id,
+            "remarks": remarks,
+            "scan": scan,
+            "formats": tuple(formats),
+            "compress": compress,
+        }
+        for v in variants
+    ]
+    if not tasks:
+        return []
+    jobs = jobs if jobs > 0 else min(len(tasks), os.cpu_count() or 1)
+    if jobs == 1 or len(tasks) == 1:
+        _init_variant_worker(wt, cache)
+        results = [_build_variant(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_variant_worker, initargs=(wt, cache)) as pool:
+            results = list(pool.map(_build_variant, tasks))
+    return [p for paths in results for p in paths]
+
+
+def _variant_spec(variant: Variant, *, scan: bool) -> Dict:
+    return {
+        "kind": "variant",
+        "mutations": [[m.chain_auth, m.resseq, m.icode, m.from_res, m.to_res] for m in variant.mutations],
+        "remarks": list(variant.remarks),
+        "rotamer_scan": scan,
+    }
 
 
 def main(argv: Optional[List[str]] = None) -> int:
@@ -865,27 +1440,134 @@ def main(argv: Optional[List[str]] = None) -> int:
     ap.add_argument(
         "--cif",
         default=str(Path("output/playwright/chatgpt_botprompts/pdb/9TI4.cif")),
-        help="Input mmCIF (default: output/playwright/chatgpt_botprompts/pdb/9TI4.cif)",
+        help="Input mmCIF or BinaryCIF, plain or gzip/bz2/xz compressed (default: output/playwright/chatgpt_botprompts/pdb/9TI4.cif)",
     )
     ap.add_argument(
         "--outdir",
         default=str(Path("output/playwright/chatgpt_botprompts/models")),
         help="Output directory (default: output/playwright/chatgpt_botprompts/models)",
     )
+    ap.add_argument(
+        "--variants",
+        default=None,
+        help="JSON/TSV variant spec (chain:resseq:FROM>TO per mutation); builds these instead of the built-in LHON variants.",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=0,
+        help="Worker processes for --variants (default: min(#variants, CPU count)).",
+    )
+    ap.add_argument(
+        "--rotamer-scan",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help=(
+            "Pick mutated side-chain rotamers by clash score against neighbouring atoms "
+            "(default: on with --variants, off for the built-in LHON variants)."
+        ),
+    )
+    ap.add_argument(
+        "--format",
+        choices=("pdb", "cif", "both"),
+        default="pdb",
+        help=(
+            "Model file format (default: pdb). mmCIF keeps author chain IDs and full residue names, "
+            "so it also works for entries with more chains than PDB chain IDs."
+        ),
+    )
+    ap.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Write gzip-compressed model files (.pdb.gz / .cif.gz).",
+    )
+    ap.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            f"Only rebuild outputs whose inputs (CIF, builder sources, variant spec) or file contents "
+            f"changed since the last --incremental run, as recorded in <outdir>/{MANIFEST_FILE_NAME}."
+        ),
+    )
     args = ap.parse_args(argv)
 
     cif_path = Path(args.cif)
     outdir = Path(args.outdir)
 
-    pdb_id = cif_path.stem.upper()
+    pdb_id = cif_stem(cif_path).upper()
     source_url = f"https://files.rcsb.org/download/{pdb_id}.cif"
 
-    records, chain_map = parse_cif_atoms(cif_path, heavy_only=True, drop_hoh=True, model_num=1)
-    outdir.mkdir(parents=True, exist_ok=True)
-    (outdir / "complexI_9TI4_chain_map.json").write_text(
-        json.dumps(chain_map, indent=2, sort_keys=True) + "\n",
-        encoding="utf-8",
+    variants: Optional[List[Variant]] = None
+    if args.variants:
+        try:
+            variants = load_variant_spec(Path(args.variants))
+        except (OSError, ValueError) as exc:
+            raise SystemExit(f"Cannot read variant spec {args.variants}: {exc}")
+    builtin_scan = bool(args.rotamer_scan)
+    variant_scan = args.rotamer_scan is not False
+    formats = MODEL_FORMATS if args.format == "both" else (args.format,)
+    compress = bool(args.gzip)
+
+    def files(pdb_paths: List[Path]) -> List[Path]:
+        return [f for path in pdb_paths for f in model_paths(path, formats, compress)]
+
+    # Output groups ("targets"): name -> (spec, files). The WT group is always first.
+    wt_paths = wt_output_paths(outdir, pdb_id)
+    chain_map_file = chain_map_path(outdir, pdb_id)
+    targets: Dict[str, Tuple[Dict, List[Path]]] = {"WT": ({"kind": "wt"}, files(wt_paths) + [chain_map_file])}
+    if variants is None:
+        for v in BUILTIN_VARIANTS:
+            targets[v.name] = (
+                {"kind": "builtin", "rotamer_scan": builtin_scan},
+                files(_builtin_paths(outdir, pdb_id, v)),
+            )
+    else:
+        # A spec variant may not write any file of the WT outputs or of another variant
+        # (compared case-insensitively, as on macOS/Windows file systems).
+        owners = {str(path).casefold(): "WT" for path in targets["WT"][1]}
+        for v in variants:
+            if v.name.casefold() == "wt":
+                raise SystemExit(f"Variant name {v.name!r} is reserved for the WT outputs")
+            paths = files(variant_output_paths(outdir, pdb_id, v))
+            for path in paths:
+                other = owners.setdefault(str(path).casefold(), v.name)
+                if other != v.name:
+                    raise SystemExit(f"Variant {v.name!r} would overwrite {path}, written by {other!r}")
+            targets[v.name] = (_variant_spec(v, scan=variant_scan), paths)
+
+    manifest: Optional[BuildManifest] = None
+    keys: Dict[str, str] = {}
+    stale = set(targets)
+    if args.incremental:
+        manifest = BuildManifest.load(outdir)
+        cif_digest = file_sha256(cif_path)
+        code_digest = source_digest(Path(__file__).resolve().parent / name for name in _SOURCE_FILES)
+        for name, (spec, paths) in targets.items():
+            spec = dict(spec, outputs=[p.name for p in paths])
+            keys[name] = target_key(cif_digest=cif_digest, code_digest=code_digest, spec=spec)
+        stale = {name for name, (_, paths) in targets.items() if not manifest.is_current(name, keys[name], paths)}
+        for name, (_, paths) in targets.items():
+            if name not in stale:
+                for path in paths:
+                    print(f"Up to date: {path}")
+        if not stale:
+            manifest.save(keep=targets)
+            return 0
+
+    wt, chain_map = parse_cif_table(
+        cif_path,
+        heavy_only=True,
+        drop_hoh=True,
+        model_num=1,
+        strict_chain_ids="pdb" in formats,
     )
+    if variants is not None:
+        # Check every spec entry against the WT table before anything is written, so a bad
+        # entry cannot fail inside the worker pool after other files were already replaced.
+        problems = [msg for v in variants if v.name in stale for msg in validate_variant(wt, v)]
+        if problems:
+            raise SystemExit(f"Variant spec {args.variants} does not match {cif_path}:\n  " + "\n  ".join(problems))
+    outdir.mkdir(parents=True, exist_ok=True)
 
     common_remarks = [
         "Template mmCIF downloaded from RCSB PDB:",
@@ -893,153 +1575,50 @@ def main(argv: Optional[List[str]] = None) -> int:
         f"Generated from {pdb_id} (heavy atoms only; HOH removed).",
     ]
 
-    wt_full = outdir / "complexI_9TI4_WT_heavy.pdb"
-    write_pdb_with_remarks(wt_full, records, remarks=common_remarks)
-
-    wt_protein_only = outdir / "complexI_9TI4_WT_heavy_proteinOnly.pdb"
-    write_pdb_with_remarks(
-        wt_protein_only,
-        [r for r in records if r.group == "ATOM"],
-        remarks=common_remarks,
-    )
-
-    wt_nd6 = outdir / "nd6_chain_m_WT_heavy.pdb"
-    write_pdb_with_remarks(
-        wt_nd6,
-        [r for r in records if r.chain_auth == "m"],
-        remarks=common_remarks,
-    )
-
-    wt_nd1 = outdir / "nd1_chain_s_WT_heavy.pdb"
-    write_pdb_with_remarks(
-        wt_nd1,
-        [r for r in records if r.chain_auth == "s"],
-        remarks=common_remarks,
-    )
-
-    nd1_records = mutate_nd1_a52t(records, chain_auth="s", resseq=52, icode="")
-    nd1_full = outdir / "complexI_9TI4_ND1_A52T_heavy.pdb"
-    write_pdb_with_remarks(
-        nd1_full,
-        nd1_records,
-        remarks=common_remarks
-        + [
-            "Mutation applied: MT-ND1 chain s resid 52 ALA->THR.",
-            "Variant: m.3460G>A (p.Ala52Thr).",
-        ],
-    )
-
-    nd1_protein_only = outdir / "complexI_9TI4_ND1_A52T_heavy_proteinOnly.pdb"
-    write_pdb_with_remarks(
-        nd1_protein_only,
-        [r for r in nd1_records if r.group == "ATOM"],
-        remarks=common_remarks
-        + [
-            "Mutation applied: MT-ND1 chain s resid 52 ALA->THR.",
-            "Variant: m.3460G>A (p.Ala52Thr).",
-        ],
-    )
-
-    nd1_chain = outdir / "nd1_chain_s_A52T_heavy.pdb"
-    write_pdb_with_remarks(
-        nd1_chain,
-        [r for r in nd1_records if r.chain_auth == "s"],
-        remarks=common_remarks
-        + [
-            "Mutation applied: MT-ND1 chain s resid 52 ALA->THR.",
-            "Variant: m.3460G>A (p.Ala52Thr).",
-        ],
-    )
-
-    wt_nd4 = outdir / "nd4_chain_r_WT_heavy.pdb"
-    write_pdb_with_remarks(
-        wt_nd4,
-        [r for r in records if r.chain_auth == "r"],
-        remarks=common_remarks,
-    )
-
-    nd4_records = mutate_nd4_r340h(records, chain_auth="r", resseq=340, icode="")
-    nd4_full = outdir / "complexI_9TI4_ND4_R340H_heavy.pdb"
-    write_pdb_with_remarks(
-        nd4_full,
-        nd4_records,
-        remarks=common_remarks
-        + [
-            "Mutation applied: MT-ND4 chain r resid 340 ARG->HIS.",
-            "Variant: m.11778G>A (p.Arg340His).",
-        ],
-    )
-
-    nd4_protein_only = outdir / "complexI_9TI4_ND4_R340H_heavy_proteinOnly.pdb"
-    write_pdb_with_remarks(
-        nd4_protein_only,
-        [r for r in nd4_records if r.group == "ATOM"],
-        remarks=common_remarks
-        + [
-            "Mutation applied: MT-ND4 chain r resid 340 ARG->HIS.",
-            "Variant: m.11778G>A (p.Arg340His).",
-        ],
-    )
-
-    nd4_chain = outdir / "nd4_chain_r_R340H_heavy.pdb"
-    write_pdb_with_remarks(
-        nd4_chain,
-        [r for r in nd4_records if r.chain_auth == "r"],
-        remarks=common_remarks
-        + [
-            "Mutation applied: MT-ND4 chain r resid 340 ARG->HIS.",
-            "Variant: m.11778G>A (p.Arg340His).",
-        ],
-    )
-
-    mut_records = mutate_nd6_m64v(records, chain_auth="m", resseq=64, icode="")
-    mut_full = outdir / "complexI_9TI4_ND6_M64V_heavy.pdb"
-    write_pdb_with_remarks(
-        mut_full,
-        mut_records,
-        remarks=common_remarks
-        + [
-            "Mutation applied: MT-ND6 chain m resid 64 MET->VAL.",
-            "Variant: m.14484T>C (p.Met64Val).",
-        ],
-    )
+    cache = PdbLineCache()
+    outputs: List[PdbOutput] = []
+    written: List[Path] = []
 
-    mut_protein_only = outdir / "complexI_9TI4_ND6_M64V_heavy_proteinOnly.pdb"
-    write_pdb_with_remarks(
-        mut_protein_only,
-        [r for r in mut_records if r.group == "ATOM"],
-        remarks=common_remarks
-        + [
-            "Mutation applied: MT-ND6 chain m resid 64 MET->VAL.",
-            "Variant: m.14484T>C (p.Met64Val).",
-        ],
-    )
+    if "WT" in stale:
+        chain_map_file.write_text(
+            json.dumps(chain_map, indent=2, sort_keys=True) + "\n",
+            encoding="utf-8",
+        )
+        outputs.append((wt_paths[0], wt, common_remarks))
+        outputs.append((wt_paths[1], _protein_only(wt), common_remarks))
+        for (chain, _), path in zip(_WT_CHAIN_FILES, wt_paths[2:]):
+            outputs.append((path, _chain_only(wt, chain), common_remarks))
+        written += files([p for p, _, _ in outputs])
+
+    if variants is None:
+        for v in BUILTIN_VARIANTS:
+            if v.name in stale:
+                variant_outputs = _builtin_outputs(wt, v, outdir, pdb_id, common_remarks, scan=builtin_scan)
+                outputs += variant_outputs
+                written += files([p for p, _, _ in variant_outputs])
+        write_model_files(outputs, cache=cache, formats=formats, compress=compress)
+    else:
+        write_model_files(outputs, cache=cache, formats=formats, compress=compress)
+        written += build_variants(
+            wt,
+            [v for v in variants if v.name in stale],
+            outdir=outdir,
+            pdb_id=pdb_id,
+            remarks=common_remarks,
+            jobs=int(args.jobs),
+            scan=variant_scan,
+            cache=cache,
+            formats=formats,
+            compress=compress,
+        )
 
-    mut_nd6 = outdir / "nd6_chain_m_M64V_heavy.pdb"
-    write_pdb_with_remarks(
-        mut_nd6,
-        [r for r in mut_records if r.chain_auth == "m"],
-        remarks=common_remarks
-        + [
-            "Mutation applied: MT-ND6 chain m resid 64 MET->VAL.",
-            "Variant: m.14484T>C (p.Met64Val).",
-        ],
-    )
+    if manifest is not None:
+        for name in stale:
+            manifest.record(name, keys[name], targets[name][1])
+        manifest.save(keep=targets)
 
-    print(f"Wrote: {wt_full}")
-    print(f"Wrote: {wt_protein_only}")
-    print(f"Wrote: {wt_nd1}")
-    print(f"Wrote: {nd1_full}")
-    print(f"Wrote: {nd1_protein_only}")
-    print(f"Wrote: {nd1_chain}")
-    print(f"Wrote: {wt_nd4}")
-    print(f"Wrote: {nd4_full}")
-    print(f"Wrote: {nd4_protein_only}")
-    print(f"Wrote: {nd4_chain}")
-    print(f"Wrote: {wt_nd6}")
-    print(f"Wrote: {mut_full}")
-    print(f"Wrote: {mut_protein_only}")
-    print(f"Wrote: {mut_nd6}")
+    for path in written:
+        print(f"Wrote: {path}")
     return 0
 
 
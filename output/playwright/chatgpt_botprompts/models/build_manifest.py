@@ -0,0 +1,103 @@
+"""
+Build manifest for incremental runs of build_complexI_9TI4_models.py (--incremental).
+
+Each output group ("target": the WT files, or one variant's files) gets a key: the
+SHA-256 of a JSON document holding the input CIF digest, the digest of the builder's
+source files and the target's own spec (mutations, remarks, options, output names). The
+manifest in the output directory maps target names to their last key and the SHA-256 of
+each output file; a target is rebuilt when its key changed or one of its files is missing
+or no longer matches its recorded digest (e.g. after a plain run overwrote it).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+
+MANIFEST_FILE_NAME = "build_manifest.json"
+MANIFEST_VERSION = 2
+
+
+def file_sha256(path: Path, *, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_digest(paths: Iterable[Path]) -> str:
+    """Digest of the builder's source files (the "script version")."""
+    h = hashlib.sha256()
+    for path in sorted(paths, key=lambda p: p.name):
+        h.update(path.name.encode("utf-8"))
+        h.update(b"\0")
+        h.update(file_sha256(path).encode("ascii"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def target_key(*, cif_digest: str, code_digest: str, spec: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        {"cif": cif_digest, "code": code_digest, "spec": spec},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class BuildManifest:
+    """Target name -> {"key", "outputs": {file name: sha256}} stored as JSON in the output directory."""
+
+    def __init__(self, path: Path, targets: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        self.path = path
+        self.targets: Dict[str, Dict[str, Any]] = dict(targets or {})
+
+    @classmethod
+    def load(cls, outdir: Path) -> "BuildManifest":
+        path = outdir / MANIFEST_FILE_NAME
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return cls(path)
+        if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+            return cls(path)
+        targets = data.get("targets")
+        return cls(path, targets if isinstance(targets, dict) else {})
+
+    def is_current(self, name: str, key: str, outputs: List[Path]) -> bool:
+        entry = self.targets.get(name)
+        if not isinstance(entry, dict) or entry.get("key") != key:
+            return False
+        digests = entry.get("outputs")
+        if not isinstance(digests, dict) or sorted(digests) != sorted(p.name for p in outputs):
+            return False
+        for p in outputs:
+            try:
+                if file_sha256(p) != digests[p.name]:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def record(self, name: str, key: str, outputs: List[Path]) -> None:
+        self.targets[name] = {"key": key, "outputs": {p.name: file_sha256(p) for p in outputs}}
+
+    def save(self, *, keep: Optional[Iterable[str]] = None) -> None:
+        """Write atomically; with `keep`, entries for other targets are dropped."""
+        targets = self.targets
+        if keep is not None:
+            wanted = set(keep)
+            targets = {k: v for k, v in targets.items() if k in wanted}
+        payload = {"version": MANIFEST_VERSION, "targets": targets}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(payload, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        os.replace(tmp, self.path)
@@ -309,6 +309,8 @@ proc ci_parse_cli {argc argv} {
     arm_include_nd 0 \
     membrane_dist 5.0 \
     pdb_file "" \
+    dx_files {} \
+    dx_iso 0.1 \
     wt_file "" \
     mut_file "" \
     positionals {} \
@@ -327,6 +329,19 @@ proc ci_parse_cli {argc argv} {
         incr i
         dict set opts pdb_file [lindex $argv $i]
       }
+      --dx {
+        incr i
+        dict lappend opts dx_files [lindex $argv $i]
+      }
+      --dx-iso {
+        incr i
+        set v [lindex $argv $i]
+        if {[catch {expr {double($v)}} dv]} {
+          puts "WARNING: --dx-iso expects a number (got: $v); using 0.1"
+          set dv 0.1
+        }
+        dict set opts dx_iso $dv
+      }
       --wt {
         incr i
         dict set opts wt_file [lindex $argv $i]
@@ -0,0 +1,183 @@
+"""
+mmCIF (`_atom_site`) writer for AtomTable models, optionally gzip compressed.
+
+Unlike the PDB writer there is no chain-ID remapping (auth chain IDs of any length are
+written as-is), no residue-name truncation and no 99999-atom limit. `label_asym_id` and
+`label_seq_id` are the values parsed from the input file (atoms added by a mutation take
+their residue's). Rows are formatted column-wise: every column becomes a fixed-width uint8
+block (numbers via integer digit arithmetic, strings via a unique-value lookup) and the
+blocks are concatenated, so no per-atom string formatting is done.
+"""
+
+from __future__ import annotations
+
+import gzip
+from pathlib import Path
+from typing import IO, List, Optional, Sequence
+
+import numpy as np
+
+from atom_table import AtomTable
+
+
+ATOM_SITE_ITEMS = (
+    "group_PDB",
+    "id",
+    "type_symbol",
+    "label_atom_id",
+    "label_alt_id",
+    "label_comp_id",
+    "label_asym_id",
+    "label_seq_id",
+    "pdbx_PDB_ins_code",
+    "Cartn_x",
+    "Cartn_y",
+    "Cartn_z",
+    "occupancy",
+    "B_iso_or_equiv",
+    "auth_seq_id",
+    "auth_comp_id",
+    "auth_asym_id",
+    "auth_atom_id",
+    "pdbx_PDB_model_num",
+)
+
+# Characters that cannot start a bare CIF value.
+_RESERVED_START = ("_", "#", "$", "'", '"', "[", "]", ";")
+_RESERVED_WORDS = {"data_", "loop_", "save_", "global_", "stop_"}
+
+
+def open_output(path: Path, mode: str = "wb", *, encoding: Optional[str] = None, compresslevel: int = 6) -> IO:
+    """Open `path` for writing, gzip compressed when it ends in ".gz"."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".gz":
+        return gzip.open(path, mode, compresslevel=compresslevel, encoding=encoding)
+    return path.open(mode, encoding=encoding)
+
+
+def _cif_value(text: str) -> str:
+    if text == "":
+        return "?"
+    needs_quote = (
+        text.startswith(_RESERVED_START)
+        or any(c.isspace() for c in text)
+        or text.lower() in _RESERVED_WORDS
+        or text.lower().startswith(("data_", "save_"))
+    )
+    if not needs_quote:
+        return text
+    if "'" not in text:
+        return f"'{text}'"
+    if '"' not in text:
+        return f'"{text}"'
+    raise ValueError(f"Cannot quote CIF value {text!r}")
+
+
+def _text_block(values: np.ndarray) -> np.ndarray:
+    """Left-justified CIF tokens of a string column as an (n, width) uint8 block."""
+    uniq, inv = np.unique(np.asarray(values).astype(str), return_inverse=True)
+    tokens = [_cif_value(v) for v in uniq.tolist()]
+    encoded = np.array([t.encode("utf-8") for t in tokens])
+    width = max(encoded.dtype.itemsize, 1)
+    table = np.frombuffer(encoded.astype(f"S{width}").tobytes(), dtype=np.uint8).reshape(len(tokens), width).copy()
+    table[table == 0] = ord(" ")
+    return table[inv.reshape(-1)]
+
+
+def _number_block(values: np.ndarray, decimals: int = 0) -> np.ndarray:
+    """Right-justified "%.{decimals}f" of a numeric column as an (n, width) uint8 block."""
+    v = np.asarray(values, dtype=np.float64)
+    n = len(v)
+    scaled = np.rint(np.abs(v) * 10**decimals).astype(np.int64)
+    neg = (v < 0) & (scaled != 0)
+    digits = len(str(int(scaled.max()))) if n else 1
+    width = max(digits, decimals + 1) + (1 if decimals else 0) + (1 if neg.any() else 0)
+    out = np.full((n, width), ord(" "), dtype=np.uint8)
+    col = width - 1
+    for _ in range(decimals):
+        out[:, col] = ord("0") + scaled % 10
+        scaled //= 10
+        col -= 1
+    if decimals:
+        out[:, col] = ord(".")
+        col -= 1
+    lead = np.full(n, col, dtype=np.int64)
+    # Units digit is always printed; higher digits only while something is left.
+    active = np.ones(n, dtype=bool)
+    while col >= 0 and active.any():
+        out[active, col] = ord("0") + scaled[active] % 10
+        lead[active] = col
+        scaled //= 10
+        active = scaled > 0
+        col -= 1
+    out[np.flatnonzero(neg), lead[neg] - 1] = ord("-")
+    return out
+
+
+def _join_blocks(blocks: Sequence[np.ndarray]) -> bytes:
+    n = len(blocks[0])
+    parts: List[np.ndarray] = []
+    for i, block in enumerate(blocks):
+        if i:
+            parts.append(np.full((n, 1), ord(" "), dtype=np.uint8))
+        parts.append(block)
+    parts.append(np.full((n, 1), ord("\n"), dtype=np.uint8))
+    return np.concatenate(parts, axis=1).tobytes()
+
+
+def atom_site_rows(table: AtomTable, *, model_num: int = 1) -> bytes:
+    """The `_atom_site` loop rows of `table` (atom ids renumbered 1..n, like the PDB writer)."""
+    n = len(table)
+    if n == 0:
+        return b""
+    group = table.column("group")
+    resseq = table.column("resseq")
+    chain = table.column("chain_auth")
+    resname = table.column("resname")
+    atomname = table.column("atomname")
+    blocks = [
+        _text_block(group),
+        _number_block(np.arange(1, n + 1)),
+        _text_block(table.column("element")),
+        _text_block(atomname),
+        _text_block(np.full(n, ".")),
+        _text_block(resname),
+        _text_block(table.column("label_asym")),
+        _text_block(table.column("label_seq")),
+        _text_block(table.column("icode")),
+        _number_block(table.column("x"), 3),
+        _number_block(table.column("y"), 3),
+        _number_block(table.column("z"), 3),
+        _number_block(table.column("occupancy"), 2),
+        _number_block(table.column("bfactor"), 2),
+        _number_block(resseq),
+        _text_block(resname),
+        _text_block(chain),
+        _text_block(atomname),
+        _number_block(np.full(n, model_num)),
+    ]
+    return _join_blocks(blocks)
+
+
+def write_mmcif(
+    path: Path,
+    table: AtomTable,
+    *,
+    data_name: str,
+    remarks: Optional[List[str]] = None,
+) -> None:
+    """
+    Write `table` as an mmCIF `_atom_site` loop (gzip compressed for a ".gz" path).
+    Remarks go into "#" comment lines after the data block header.
+    """
+    header: List[str] = [f"data_{data_name}", "#"]
+    for remark in remarks or []:
+        header.append(f"# {remark}")
+    if remarks:
+        header.append("#")
+    header.append("loop_")
+    header += [f"_atom_site.{item}" for item in ATOM_SITE_ITEMS]
+    with open_output(path, "wb") as out:
+        out.write(("\n".join(header) + "\n").encode("utf-8"))
+        out.write(atom_site_rows(table))
+        out.write(b"#\n")
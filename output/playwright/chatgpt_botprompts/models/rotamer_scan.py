@@ -0,0 +1,190 @@
+"""
+Rotamer scan for rebuilt side chains.
+
+All chi combinations of a residue (staggered -60/180/60 for sp3 chis, ring/amide flips
+for planar groups) are built at once with `build_side_chain(..., chis=(R, nchi))` and
+scored in one vectorized pass against the heavy atoms around the site. Neighbours are
+found through `GridIndex`, a uniform grid over the structure (cells sorted once, looked
+up with searchsorted), so each site only compares against the few hundred atoms within
+reach instead of the whole complex.
+
+The score is the summed squared van der Waals overlap beyond `CLASH_TOLERANCE`; the
+first rotamer (the starting chis, e.g. the WT chi1) wins ties.
+"""
+
+from __future__ import annotations
+
+import itertools
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from sidechain_templates import DEFAULT_CHIS, build_side_chain, canonical_resname
+
+
+# Heavy-atom van der Waals radii (A); unknown elements use the carbon value.
+VDW_RADII = {"C": 1.70, "N": 1.55, "O": 1.52, "S": 1.80, "P": 1.80, "SE": 1.90, "FE": 1.40, "MG": 1.73, "ZN": 1.39}
+DEFAULT_VDW_RADIUS = 1.70
+
+# Overlap (sum of radii minus distance) tolerated before it counts as a clash.
+CLASH_TOLERANCE = 0.4
+
+# Farthest side-chain atom from CA (ARG NH*, ~7.4 A) plus margin.
+_SIDECHAIN_REACH = 8.0
+
+_STAGGERED = (-60.0, 180.0, 60.0)
+
+# Per-chi candidate values; chis not listed use _STAGGERED.
+ROTAMER_CHI_VALUES: Dict[str, Tuple[Tuple[float, ...], ...]] = {
+    "PRO": ((29.6,), (-34.8,)),  # ring pucker: not scanned
+    "PHE": (_STAGGERED, (90.0, -30.0, 30.0)),
+    "TYR": (_STAGGERED, (90.0, -30.0, 30.0)),
+    "TRP": (_STAGGERED, (-90.0, 0.0, 90.0, 180.0)),
+    "HIS": (_STAGGERED, (-90.0, 0.0, 90.0, 180.0)),
+    "ASP": (_STAGGERED, (-60.0, 0.0, 60.0, 90.0)),
+    "ASN": (_STAGGERED, (-90.0, -60.0, 0.0, 60.0, 90.0, 180.0)),
+    "GLU": (_STAGGERED, _STAGGERED, (-60.0, 0.0, 60.0, 90.0)),
+    "GLN": (_STAGGERED, _STAGGERED, (-90.0, -60.0, 0.0, 60.0, 90.0, 180.0)),
+}
+
+
+def vdw_radius(element: str) -> float:
+    return VDW_RADII.get(element.strip().upper(), DEFAULT_VDW_RADIUS)
+
+
+def rotamer_library(resname: str, start: Optional[Sequence[float]] = None) -> np.ndarray:
+    """
+    Candidate chi angles (R, nchi) for `resname`. `start` (e.g. the WT-derived chis) is
+    put first so it wins ties; the grid values follow in itertools.product order.
+    """
+    resname = canonical_resname(resname)
+    nchi = len(DEFAULT_CHIS[resname])
+    if nchi == 0:
+        return np.zeros((1, 0), dtype=np.float64)
+    values = ROTAMER_CHI_VALUES.get(resname, (_STAGGERED,) * nchi)
+    grid = np.array(list(itertools.product(*values)), dtype=np.float64)
+    first = np.asarray(DEFAULT_CHIS[resname] if start is None else start, dtype=np.float64)
+    return np.vstack([first[None, :], grid])
+
+
+class GridIndex:
+    """
+    Uniform grid over a point set. Points are sorted by cell once; `within(center, r)`
+    collects the points of the cells overlapping the query box and filters by distance.
+    """
+
+    __slots__ = ("_xyz", "_cell", "_origin", "_dims", "_order", "_keys")
+
+    def __init__(self, xyz: np.ndarray, cell: float = 6.0) -> None:
+        self._xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        self._cell = float(cell)
+        if len(self._xyz):
+            self._origin = self._xyz.min(axis=0)
+            ijk = np.floor((self._xyz - self._origin) / self._cell).astype(np.int64)
+            self._dims = ijk.max(axis=0) + 1
+        else:
+            self._origin = np.zeros(3)
+            ijk = np.zeros((0, 3), dtype=np.int64)
+            self._dims = np.ones(3, dtype=np.int64)
+        keys = self._key(ijk)
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+
+    def _key(self, ijk: np.ndarray) -> np.ndarray:
+        return (ijk[..., 0] * self._dims[1] + ijk[..., 1]) * self._dims[2] + ijk[..., 2]
+
+    def within(self, center: np.ndarray, radius: float) -> np.ndarray:
+        """Indices (ascending) of points within `radius` of `center`."""
+        if not len(self._xyz):
+            return np.zeros(0, dtype=np.int64)
+        center = np.asarray(center, dtype=np.float64)
+        lo = np.floor((center - radius - self._origin) / self._cell).astype(np.int64)
+        hi = np.floor((center + radius - self._origin) / self._cell).astype(np.int64)
+        lo = np.maximum(lo, 0)
+        hi = np.minimum(hi, self._dims - 1)
+        if (hi < lo).any():
+            return np.zeros(0, dtype=np.int64)
+        axes = [np.arange(lo[k], hi[k] + 1) for k in range(3)]
+        cells = self._key(np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3))
+        starts = np.searchsorted(self._keys, cells, side="left")
+        stops = np.searchsorted(self._keys, cells, side="right")
+        hits = [self._order[a:b] for a, b in zip(starts.tolist(), stops.tolist()) if b > a]
+        if not hits:
+            return np.zeros(0, dtype=np.int64)
+        idx = np.concatenate(hits)
+        d2 = ((self._xyz[idx] - center) ** 2).sum(axis=1)
+        return np.sort(idx[d2 <= radius * radius])
+
+
+class RotamerChoice(NamedTuple):
+    chis: np.ndarray
+    atoms: Dict[str, np.ndarray]
+    score: float
+    start_score: float
+    n_candidates: int
+
+
+def score_rotamers(
+    built: Dict[str, np.ndarray],
+    neighbor_xyz: np.ndarray,
+    neighbor_radii: np.ndarray,
+    *,
+    tolerance: float = CLASH_TOLERANCE,
+) -> np.ndarray:
+    """
+    Clash score per rotamer: `built` maps atom names to (R, 3) coordinates; returns (R,)
+    sums of squared overlaps max(0, r_i + r_j - tolerance - d_ij) over all atom pairs.
+    """
+    names = list(built)
+    if not names:
+        return np.zeros(1)
+    xyz = np.stack([built[n] for n in names], axis=1)  # (R, A, 3)
+    if len(neighbor_xyz) == 0:
+        return np.zeros(xyz.shape[0])
+    radii = np.array([vdw_radius(n[0]) for n in names])
+    diff = xyz[:, :, None, :] - neighbor_xyz[None, None, :, :]
+    dist = np.sqrt((diff * diff).sum(axis=-1))  # (R, A, K)
+    overlap = radii[None, :, None] + neighbor_radii[None, None, :] - tolerance - dist
+    np.maximum(overlap, 0.0, out=overlap)
+    return (overlap * overlap).sum(axis=(1, 2))
+
+
+def select_rotamer(
+    resname: str,
+    anchors: Dict[str, np.ndarray],
+    grid: GridIndex,
+    all_xyz: np.ndarray,
+    all_radii: np.ndarray,
+    *,
+    exclude: Sequence[int] = (),
+    start: Optional[Sequence[float]] = None,
+) -> RotamerChoice:
+    """
+    Build every candidate rotamer of `resname` on `anchors` and return the one with the
+    lowest clash score against the atoms near CA (rows in `exclude`, normally the residue
+    itself, are ignored).
+    """
+    chis = rotamer_library(resname, start)
+    # Atoms not depending on a chi (e.g. a newly built CB) come back as (3,): broadcast.
+    built = {name: np.broadcast_to(xyz, (len(chis), 3)) for name, xyz in build_side_chain(resname, anchors, chis).items()}
+    near = grid.within(anchors["CA"], _SIDECHAIN_REACH + 2 * max(VDW_RADII.values()))
+    if len(exclude):
+        near = near[~np.isin(near, np.asarray(exclude, dtype=np.int64))]
+    scores = score_rotamers(built, all_xyz[near], all_radii[near])
+    best = int(np.argmin(scores))  # first minimum: the starting chis win ties
+    atoms = {name: xyz[best] for name, xyz in built.items()}
+    return RotamerChoice(chis[best], atoms, float(scores[best]), float(scores[0]), len(chis))
+
+
+def element_radii(elements: np.ndarray) -> np.ndarray:
+    """vdW radius per atom from an element column (unique-value lookup)."""
+    uniq, inv = np.unique(elements, return_inverse=True)
+    return np.array([vdw_radius(e) for e in uniq.tolist()], dtype=np.float64)[inv]
+
+
+def describe_choice(choice: RotamerChoice) -> str:
+    chis = ", ".join(f"{c:.0f}" for c in choice.chis.tolist()) or "-"
+    return (
+        f"rotamer chi=({chis}) clash {choice.score:.2f} (start {choice.start_score:.2f}, "
+        f"{choice.n_candidates} candidates)"
+    )
@@ -0,0 +1,290 @@
+"""
+Internal-coordinate side-chain templates (heavy atoms) for the 20 standard amino acids.
+
+Each atom is placed from three already-placed reference atoms (a, b, c) by bond length
+|c-d|, bond angle b-c-d and torsion a-b-c-d (NeRF construction). Torsions that follow a
+side-chain chi angle are stored as an offset from that chi, so the same template can be
+built for any rotamer. Geometry follows the Engh & Huber-style values used by
+PeptideBuilder; rebuilt side chains are approximate and should be minimized.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+THREE_TO_ONE = {
+    "ALA": "A",
+    "ARG": "R",
+    "ASN": "N",
+    "ASP": "D",
+    "CYS": "C",
+    "GLN": "Q",
+    "GLU": "E",
+    "GLY": "G",
+    "HIS": "H",
+    "ILE": "I",
+    "LEU": "L",
+    "LYS": "K",
+    "MET": "M",
+    "PHE": "F",
+    "PRO": "P",
+    "SER": "S",
+    "THR": "T",
+    "TRP": "W",
+    "TYR": "Y",
+    "VAL": "V",
+}
+ONE_TO_THREE = {v: k for k, v in THREE_TO_ONE.items()}
+
+# Alternative residue names found in CHARMM/VMD-prepared models.
+RESNAME_ALIASES = {"HSD": "HIS", "HSE": "HIS", "HSP": "HIS", "HID": "HIS", "HIE": "HIS", "HIP": "HIS", "MSE": "MET"}
+
+BACKBONE_ATOMS = {"N", "CA", "C", "O", "OXT"}
+
+
+class ICAtom(NamedTuple):
+    name: str
+    refs: Tuple[str, str, str]
+    bond: float
+    angle: float
+    torsion: float  # degrees; offset from chi `chi` when chi > 0
+    chi: int = 0
+
+    @property
+    def element(self) -> str:
+        return self.name[0]
+
+
+CB_ATOM = ICAtom("CB", ("N", "C", "CA"), 1.52, 109.5, 122.6)
+
+_N_CA_CB = ("N", "CA", "CB")
+_CA_CB_CG = ("CA", "CB", "CG")
+_CB_CG_CD = ("CB", "CG", "CD")
+
+SIDECHAIN_TEMPLATES: Dict[str, List[ICAtom]] = {
+    "GLY": [],
+    "ALA": [],
+    "SER": [ICAtom("OG", _N_CA_CB, 1.417, 110.8, 0.0, 1)],
+    "CYS": [ICAtom("SG", _N_CA_CB, 1.808, 113.8, 0.0, 1)],
+    "VAL": [
+        ICAtom("CG1", _N_CA_CB, 1.527, 110.7, 0.0, 1),
+        ICAtom("CG2", _N_CA_CB, 1.527, 110.4, 120.0, 1),
+    ],
+    "THR": [
+        ICAtom("OG1", _N_CA_CB, 1.417, 109.2, 0.0, 1),
+        ICAtom("CG2", _N_CA_CB, 1.527, 111.1, -120.0, 1),
+    ],
+    "ILE": [
+        ICAtom("CG1", _N_CA_CB, 1.527, 110.7, 0.0, 1),
+        ICAtom("CG2", _N_CA_CB, 1.527, 110.4, -120.0, 1),
+        ICAtom("CD1", ("CA", "CB", "CG1"), 1.520, 114.0, 0.0, 2),
+    ],
+    "LEU": [
+        ICAtom("CG", _N_CA_CB, 1.530, 116.1, 0.0, 1),
+        ICAtom("CD1", _CA_CB_CG, 1.524, 110.3, 0.0, 2),
+        ICAtom("CD2", _CA_CB_CG, 1.525, 110.6, -120.0, 2),
+    ],
+    "MET": [
+        ICAtom("CG", _N_CA_CB, 1.520, 114.1, 0.0, 1),
+        ICAtom("SD", _CA_CB_CG, 1.810, 112.7, 0.0, 2),
+        ICAtom("CE", ("CB", "CG", "SD"), 1.790, 100.8, 0.0, 3),
+    ],
+    "PRO": [
+        ICAtom("CG", _N_CA_CB, 1.490, 104.2, 0.0, 1),
+        ICAtom("CD", _CA_CB_CG, 1.500, 105.0, 0.0, 2),
+    ],
+    "PHE": [
+        ICAtom("CG", _N_CA_CB, 1.500, 114.0, 0.0, 1),
+        ICAtom("CD1", _CA_CB_CG, 1.390, 120.0, 0.0, 2),
+        ICAtom("CD2", _CA_CB_CG, 1.390, 120.0, 180.0, 2),
+        ICAtom("CE1", ("CB", "CG", "CD1"), 1.390, 120.0, 180.0),
+        ICAtom("CE2", ("CB", "CG", "CD2"), 1.390, 120.0, 180.0),
+        ICAtom("CZ", ("CG", "CD1", "CE1"), 1.390, 120.0, 0.0),
+    ],
+    "TYR": [
+        ICAtom("CG", _N_CA_CB, 1.510, 113.8, 0.0, 1),
+        ICAtom("CD1", _CA_CB_CG, 1.390, 120.8, 0.0, 2),
+        ICAtom("CD2", _CA_CB_CG, 1.390, 120.8, 180.0, 2),
+        ICAtom("CE1", ("CB", "CG", "CD1"), 1.390, 121.2, 180.0),
+        ICAtom("CE2", ("CB", "CG", "CD2"), 1.390, 121.2, 180.0),
+        ICAtom("CZ", ("CG", "CD1", "CE1"), 1.390, 119.6, 0.0),
+        ICAtom("OH", ("CD1", "CE1", "CZ"), 1.390, 119.9, 180.0),
+    ],
+    "TRP": [
+        ICAtom("CG", _N_CA_CB, 1.500, 114.1, 0.0, 1),
+        ICAtom("CD1", _CA_CB_CG, 1.370, 127.1, 0.0, 2),
+        ICAtom("CD2", _CA_CB_CG, 1.430, 126.7, 180.0, 2),
+        ICAtom("NE1", ("CB", "CG", "CD1"), 1.380, 108.5, 180.0),
+        ICAtom("CE2", ("CB", "CG", "CD2"), 1.400, 108.5, 180.0),
+        ICAtom("CE3", ("CB", "CG", "CD2"), 1.400, 133.8, 0.0),
+        ICAtom("CZ2", ("CG", "CD2", "CE2"), 1.400, 120.0, 180.0),
+        ICAtom("CZ3", ("CG", "CD2", "CE3"), 1.400, 120.0, 180.0),
+        ICAtom("CH2", ("CD2", "CE2", "CZ2"), 1.400, 120.0, 0.0),
+    ],
+    "HIS": [
+        ICAtom("CG", _N_CA_CB, 1.490, 113.7, 0.0, 1),
+        ICAtom("ND1", _CA_CB_CG, 1.380, 122.9, 0.0, 2),
+        ICAtom("CD2", _CA_CB_CG, 1.360, 130.6, 180.0, 2),
+        ICAtom("CE1", ("CB", "CG", "ND1"), 1.320, 108.5, 180.0),
+        ICAtom("NE2", ("CB", "CG", "CD2"), 1.350, 108.5, 180.0),
+    ],
+    "ASP": [
+        ICAtom("CG", _N_CA_CB, 1.520, 113.1, 0.0, 1),
+        ICAtom("OD1", _CA_CB_CG, 1.250, 119.2, 0.0, 2),
+        ICAtom("OD2", _CA_CB_CG, 1.250, 118.2, 180.0, 2),
+    ],
+    "ASN": [
+        ICAtom("CG", _N_CA_CB, 1.520, 112.6, 0.0, 1),
+        ICAtom("OD1", _CA_CB_CG, 1.230, 120.9, 0.0, 2),
+        ICAtom("ND2", _CA_CB_CG, 1.330, 116.5, 180.0, 2),
+    ],
+    "GLU": [
+        ICAtom("CG", _N_CA_CB, 1.520, 113.8, 0.0, 1),
+        ICAtom("CD", _CA_CB_CG, 1.520, 113.3, 0.0, 2),
+        ICAtom("OE1", _CB_CG_CD, 1.250, 119.0, 0.0, 3),
+        ICAtom("OE2", _CB_CG_CD, 1.250, 118.1, 180.0, 3),
+    ],
+    "GLN": [
+        ICAtom("CG", _N_CA_CB, 1.520, 113.8, 0.0, 1),
+        ICAtom("CD", _CA_CB_CG, 1.520, 112.8, 0.0, 2),
+        ICAtom("OE1", _CB_CG_CD, 1.240, 120.9, 0.0, 3),
+        ICAtom("NE2", _CB_CG_CD, 1.330, 116.5, 180.0, 3),
+    ],
+    "LYS": [
+        ICAtom("CG", _N_CA_CB, 1.520, 113.8, 0.0, 1),
+        ICAtom("CD", _CA_CB_CG, 1.520, 111.8, 0.0, 2),
+        ICAtom("CE", _CB_CG_CD, 1.520, 111.7, 0.0, 3),
+        ICAtom("NZ", ("CG", "CD", "CE"), 1.490, 111.7, 0.0, 4),
+    ],
+    "ARG": [
+        ICAtom("CG", _N_CA_CB, 1.520, 113.8, 0.0, 1),
+        ICAtom("CD", _CA_CB_CG, 1.520, 111.8, 0.0, 2),
+        ICAtom("NE", _CB_CG_CD, 1.460, 111.7, 0.0, 3),
+        ICAtom("CZ", ("CG", "CD", "NE"), 1.330, 124.8, 0.0, 4),
+        ICAtom("NH1", ("CD", "NE", "CZ"), 1.330, 120.6, 0.0),
+        ICAtom("NH2", ("CD", "NE", "CZ"), 1.330, 119.6, 180.0),
+    ],
+}
+
+# Most common rotamer per residue (degrees, chi1..chiN).
+DEFAULT_CHIS: Dict[str, Tuple[float, ...]] = {
+    "GLY": (),
+    "ALA": (),
+    "SER": (-63.3,),
+    "CYS": (-62.2,),
+    "VAL": (177.2,),
+    "THR": (60.0,),
+    "ILE": (-60.0, 170.0),
+    "LEU": (-60.1, 174.9),
+    "MET": (-64.4, -179.6, 70.0),
+    "PRO": (29.6, -34.8),
+    "PHE": (-64.7, 93.3),
+    "TYR": (-64.3, 100.0),
+    "TRP": (-66.4, 96.3),
+    "HIS": (-63.2, -75.7),
+    "ASP": (-66.4, -46.7),
+    "ASN": (-65.5, -58.3),
+    "GLU": (-63.8, -179.8, -6.2),
+    "GLN": (-60.2, -69.6, -50.5),
+    "LYS": (-64.5, -178.1, -179.6, 179.6),
+    "ARG": (-65.2, -179.2, -179.3, -178.7),
+}
+
+
+def canonical_resname(name: str) -> str:
+    """Three-letter residue name from a 1- or 3-letter code (aliases like HSD map to HIS)."""
+    key = name.strip().upper()
+    if len(key) == 1:
+        if key not in ONE_TO_THREE:
+            raise ValueError(f"Unknown amino acid code: {name!r}")
+        return ONE_TO_THREE[key]
+    key = RESNAME_ALIASES.get(key, key)
+    if key not in SIDECHAIN_TEMPLATES:
+        raise ValueError(f"No side-chain template for residue {name!r}")
+    return key
+
+
+def n_chis(resname: str) -> int:
+    return len(DEFAULT_CHIS[resname])
+
+
+def place_atom(
+    a: np.ndarray,
+    b: np.ndarray,
+    c: np.ndarray,
+    bond: float,
+    angle_deg: float,
+    torsion_deg: np.ndarray,
+) -> np.ndarray:
+    """
+    NeRF placement of atom d bonded to c, vectorized over leading dimensions.
+
+    a, b, c broadcast against each other ((..., 3)); torsion_deg broadcasts against their
+    leading dimensions. Returns d with |c-d| = bond, angle(b, c, d) = angle and
+    dihedral(a, b, c, d) = torsion.
+    """
+    theta = np.radians(angle_deg)
+    phi = np.radians(np.asarray(torsion_deg, dtype=np.float64))
+    bc = c - b
+    bc = bc / np.linalg.norm(bc, axis=-1, keepdims=True)
+    n = np.cross(b - a, bc)
+    n = n / np.linalg.norm(n, axis=-1, keepdims=True)
+    m = np.cross(n, bc)
+    d0 = -bond * np.cos(theta)
+    d1 = bond * np.sin(theta) * np.cos(phi)
+    d2 = bond * np.sin(theta) * np.sin(phi)
+    return c + d0 * bc + d1[..., None] * m + d2[..., None] * n
+
+
+def dihedral(a: Sequence[float], b: Sequence[float], c: Sequence[float], d: Sequence[float]) -> float:
+    """Dihedral angle a-b-c-d in degrees."""
+    p0, p1, p2, p3 = (np.asarray(p, dtype=np.float64) for p in (a, b, c, d))
+    b0 = p0 - p1
+    b1 = p2 - p1
+    b2 = p3 - p2
+    b1 = b1 / np.linalg.norm(b1)
+    v = b0 - np.dot(b0, b1) * b1
+    w = b2 - np.dot(b2, b1) * b1
+    x = np.dot(v, w)
+    y = np.dot(np.cross(b1, v), w)
+    return float(np.degrees(np.arctan2(y, x)))
+
+
+def build_side_chain(
+    resname: str,
+    anchors: Dict[str, np.ndarray],
+    chis: Optional[np.ndarray] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Build side-chain heavy atoms of `resname` onto a backbone.
+
+    `anchors` must hold N, CA and C (and may hold CB, which is then kept). `chis` is
+    (nchi,) for one conformation or (R, nchi) for R rotamers at once; the default is
+    DEFAULT_CHIS. Returns {atom name: (3,) or (R, 3) coordinates} in template order,
+    starting with CB when it had to be built (not for GLY).
+    """
+    resname = canonical_resname(resname)
+    if chis is None:
+        chis = np.asarray(DEFAULT_CHIS[resname], dtype=np.float64)
+    chis = np.asarray(chis, dtype=np.float64)
+    if chis.shape[-1:] != (n_chis(resname),):
+        raise ValueError(f"{resname} needs {n_chis(resname)} chi angles, got shape {chis.shape}")
+    lead = chis.shape[:-1]
+
+    placed: Dict[str, np.ndarray] = {k: np.asarray(v, dtype=np.float64) for k, v in anchors.items()}
+    built: Dict[str, np.ndarray] = {}
+    if resname == "GLY":
+        return built
+    if "CB" not in placed:
+        placed["CB"] = place_atom(placed["N"], placed["C"], placed["CA"], CB_ATOM.bond, CB_ATOM.angle, CB_ATOM.torsion)
+        built["CB"] = placed["CB"]
+
+    for atom in SIDECHAIN_TEMPLATES[resname]:
+        torsion = np.full(lead, atom.torsion) if atom.chi == 0 else chis[..., atom.chi - 1] + atom.torsion
+        a, b, c = (placed[r] for r in atom.refs)
+        placed[atom.name] = place_atom(a, b, c, atom.bond, atom.angle, torsion)
+        built[atom.name] = placed[atom.name]
+    return built
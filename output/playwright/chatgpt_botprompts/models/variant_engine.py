@@ -0,0 +1,393 @@
+"""
+Spec-driven point-mutation engine for the 9TI4 model builder.
+
+A variant spec lists one variant per entry; each variant is one or more point mutations
+written as ``chain:resseq[icode]:FROM>TO`` with 1- or 3-letter residue codes, e.g.
+``m:64:M>V`` or ``r:340:ARG>HIS``. Supported files:
+
+  - JSON: a list (or {"variants": [...]}) of strings or objects
+    {"name": "ND6_M64V", "mutations": ["m:64:M>V"], "remarks": ["Variant: m.14484T>C (p.Met64Val)."]}
+  - TSV: ``name<TAB>mutations<TAB>remark`` per line (mutations joined by "+" or ","; name and
+    remark optional; "#" starts a comment; a header line starting with "name" is skipped)
+
+Variant names (given or derived from the mutations) become part of the output file names
+and may only contain letters, digits and ``_.+-``.
+
+Mutated side chains are rebuilt from the internal-coordinate templates in
+sidechain_templates.py: backbone atoms (and CB unless the target is GLY) are kept, the
+remaining side-chain atoms are replaced. When both residues have a gamma atom, the WT
+chi1 is the starting rotamer; by default every rotamer of the new residue is then scored
+for clashes with its neighbours (rotamer_scan.py) and the best one is built.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from atom_table import AtomTable, EditSet
+from rotamer_scan import GridIndex, RotamerChoice, describe_choice, element_radii, select_rotamer
+from sidechain_templates import (
+    BACKBONE_ATOMS,
+    DEFAULT_CHIS,
+    THREE_TO_ONE,
+    build_side_chain,
+    canonical_resname,
+    dihedral,
+)
+
+
+_MUTATION_RE = re.compile(
+    r"^(?P<chain>[^:\s]+):(?P<resseq>-?\d+)(?P<icode>[A-Za-z]?):(?P<src>[A-Za-z]{1,3})>(?P<dst>[A-Za-z]{1,3})$"
+)
+
+# Variant names become parts of output file names.
+_VARIANT_NAME_RE = re.compile(r"^[A-Za-z0-9_.+-]+$")
+
+# Gamma atoms that define chi1 (first one present is used).
+_GAMMA_ATOMS = ("CG", "CG1", "OG", "OG1", "SG")
+
+
+@dataclass(frozen=True)
+class PointMutation:
+    chain_auth: str
+    resseq: int
+    icode: str
+    from_res: str
+    to_res: str
+
+    @property
+    def label(self) -> str:
+        """Short label like "m_M64V" (used for default variant names)."""
+        return f"{self.chain_auth}_{THREE_TO_ONE[self.from_res]}{self.resseq}{self.icode}{THREE_TO_ONE[self.to_res]}"
+
+    def describe(self) -> str:
+        return f"chain {self.chain_auth} resid {self.resseq}{self.icode} {self.from_res}->{self.to_res}"
+
+
+@dataclass(frozen=True)
+class Variant:
+    name: str
+    mutations: Tuple[PointMutation, ...]
+    remarks: Tuple[str, ...] = ()
+
+    @property
+    def chains(self) -> List[str]:
+        return sorted({m.chain_auth for m in self.mutations})
+
+
+def parse_mutation(text: str) -> PointMutation:
+    m = _MUTATION_RE.match(text.strip())
+    if not m:
+        raise ValueError(f"Bad mutation {text!r}; expected chain:resseq:FROM>TO (e.g. m:64:M>V)")
+    return PointMutation(
+        chain_auth=m.group("chain"),
+        resseq=int(m.group("resseq")),
+        icode=m.group("icode"),
+        from_res=canonical_resname(m.group("src")),
+        to_res=canonical_resname(m.group("dst")),
+    )
+
+
+def _split_mutations(text: str) -> List[str]:
+    return [t for t in re.split(r"[+,;\s]+", text.strip()) if t]
+
+
+def _make_variant(mutations: List[str], name: Optional[str], remarks: List[str]) -> Variant:
+    if not mutations:
+        raise ValueError("Variant has no mutations")
+    parsed = tuple(parse_mutation(t) for t in mutations)
+    name = name or "_".join(m.label for m in parsed)
+    if not _VARIANT_NAME_RE.match(name):
+        raise ValueError(f"Bad variant name {name!r}; use letters, digits and _.+- only")
+    return Variant(name=name, mutations=parsed, remarks=tuple(remarks))
+
+
+def _json_variant(entry: object) -> Variant:
+    if isinstance(entry, str):
+        return _make_variant(_split_mutations(entry), None, [])
+    if not isinstance(entry, dict):
+        raise ValueError(f"expected a mutation string or an object, got {type(entry).__name__}")
+    muts = entry.get("mutations", entry.get("mutation", []))
+    if isinstance(muts, str):
+        muts = _split_mutations(muts)
+    if not isinstance(muts, list) or not all(isinstance(t, str) for t in muts):
+        raise ValueError("mutations must be a string or a list of strings")
+    remarks = entry.get("remarks", [])
+    if isinstance(remarks, str):
+        remarks = [remarks]
+    if not isinstance(remarks, list) or not all(isinstance(t, str) for t in remarks):
+        raise ValueError("remarks must be a string or a list of strings")
+    name = entry.get("name")
+    if name is not None and not isinstance(name, str):
+        raise ValueError("name must be a string")
+    return _make_variant(muts, name, remarks)
+
+
+def load_variant_spec(path: Path) -> List[Variant]:
+    """Read a JSON or TSV variant spec (JSON when the file starts with "[" or "{")."""
+    text = path.read_text(encoding="utf-8")
+    variants: List[Variant] = []
+    if text.lstrip().startswith(("[", "{")):
+        data = json.loads(text)
+        entries = data.get("variants", []) if isinstance(data, dict) else data
+        if not isinstance(entries, list):
+            raise ValueError(f"{path}: expected a list of variants")
+        for n, entry in enumerate(entries, start=1):
+            try:
+                variants.append(_json_variant(entry))
+            except ValueError as exc:
+                raise ValueError(f"{path}: entry {n}: {exc}") from None
+    else:
+        for lineno, raw in enumerate(text.splitlines(), start=1):
+            line = raw.split("#", 1)[0].rstrip()
+            if not line.strip():
+                continue
+            fields = [f.strip() for f in line.split("\t")]
+            if fields[0].lower() == "name":
+                continue
+            if len(fields) == 1:
+                name, muts, remark = None, fields[0], ""
+            else:
+                name, muts = fields[0] or None, fields[1]
+                remark = fields[2] if len(fields) > 2 else ""
+            try:
+                variants.append(_make_variant(_split_mutations(muts), name, [remark] if remark else []))
+            except ValueError as exc:
+                raise ValueError(f"{path}:{lineno}: {exc}") from None
+
+    names = [v.name for v in variants]
+    dupes = sorted({n for n in names if names.count(n) > 1})
+    if dupes:
+        raise ValueError(f"Duplicate variant names in {path}: {dupes}")
+    return variants
+
+
+def _residue_atoms(table: AtomTable, mutation: PointMutation) -> Tuple[np.ndarray, Dict[str, int]]:
+    rows = table.residue_index().residue_rows(mutation.chain_auth, mutation.resseq, mutation.icode)
+    if isinstance(rows, slice):
+        rows = np.arange(rows.start, rows.stop, dtype=np.int64)
+    if len(rows) == 0:
+        raise RuntimeError(
+            f"Could not find target residue {mutation.chain_auth}:{mutation.resseq}{mutation.icode} in table"
+        )
+    names = {table.value("atomname", int(i)).strip().upper(): int(i) for i in rows}
+    return rows, names
+
+
+def _row_xyz(table: AtomTable, row: int) -> np.ndarray:
+    return np.array([table.value("x", row), table.value("y", row), table.value("z", row)])
+
+
+def side_chain_context(
+    table: AtomTable, mutation: PointMutation
+) -> Tuple[np.ndarray, Dict[str, int], Dict[str, np.ndarray], np.ndarray]:
+    """
+    Validate the site and return (rows, atom_rows_by_name, anchors, chis) for building
+    the new side chain: anchors hold N/CA/C (+CB when it is kept) and chis the starting
+    chi angles (WT chi1 carried over when possible).
+    """
+    rows, by_name = _residue_atoms(table, mutation)
+    resname = str(table.value("resname", int(rows[0]))).strip().upper()
+    try:
+        resname = canonical_resname(resname)
+    except ValueError:
+        pass  # non-standard residue: reported as a mismatch below
+    if resname != mutation.from_res:
+        raise RuntimeError(
+            f"Residue {mutation.chain_auth}:{mutation.resseq}{mutation.icode} is {resname}, "
+            f"spec expects {mutation.from_res}"
+        )
+    missing = [a for a in ("N", "CA", "C") if a not in by_name]
+    if missing:
+        raise RuntimeError(f"Backbone atoms {missing} missing at {mutation.describe()}")
+
+    anchors = {a: _row_xyz(table, by_name[a]) for a in ("N", "CA", "C")}
+    keep_cb = "CB" in by_name and mutation.to_res != "GLY"
+    if keep_cb:
+        anchors["CB"] = _row_xyz(table, by_name["CB"])
+
+    chis = np.array(DEFAULT_CHIS[mutation.to_res], dtype=np.float64)
+    gamma = next((g for g in _GAMMA_ATOMS if g in by_name), None)
+    # PRO chis describe the ring closure onto N and are never taken from the WT residue.
+    if keep_cb and gamma is not None and len(chis) and mutation.to_res != "PRO":
+        chis[0] = dihedral(anchors["N"], anchors["CA"], anchors["CB"], _row_xyz(table, by_name[gamma]))
+    return rows, by_name, anchors, chis
+
+
+class SiteEnvironment:
+    """Coordinates, vdW radii and grid index of one table, shared by its rotamer scans."""
+
+    __slots__ = ("xyz", "radii", "grid")
+
+    def __init__(self, table: AtomTable) -> None:
+        self.xyz = np.stack([table.column("x"), table.column("y"), table.column("z")], axis=1).astype(np.float64)
+        self.radii = element_radii(table.column("element"))
+        self.grid = GridIndex(self.xyz)
+
+
+def _choose_side_chain(
+    table: AtomTable,
+    mutation: PointMutation,
+    *,
+    chis: Optional[np.ndarray],
+    scan: bool,
+    environment: Optional[SiteEnvironment],
+) -> Tuple[np.ndarray, Dict[str, int], Dict[str, np.ndarray], Dict[str, np.ndarray], Optional[RotamerChoice]]:
+    rows, by_name, anchors, start_chis = side_chain_context(table, mutation)
+    if chis is not None or not scan:
+        built = build_side_chain(mutation.to_res, anchors, start_chis if chis is None else chis)
+        return rows, by_name, anchors, built, None
+    env = environment if environment is not None else SiteEnvironment(table)
+    choice = select_rotamer(
+        mutation.to_res,
+        anchors,
+        env.grid,
+        env.xyz,
+        env.radii,
+        exclude=rows,
+        start=start_chis,
+    )
+    return rows, by_name, anchors, choice.atoms, choice
+
+
+def mutation_edits(
+    table: AtomTable,
+    mutation: PointMutation,
+    *,
+    chis: Optional[np.ndarray] = None,
+    scan: bool = True,
+    environment: Optional[SiteEnvironment] = None,
+    notes: Optional[List[str]] = None,
+) -> EditSet:
+    """
+    Edit set replacing the side chain at `mutation` with the template of `to_res`.
+
+    Backbone atoms (and CB unless the target is GLY) are renamed in place, other side-chain
+    atoms are deleted, and new atoms are inserted after the last kept atom of the residue.
+    The side chain uses `chis` when given, else the best-scoring rotamer (`scan`), else the
+    starting chis. The chosen rotamer is described in `notes` when a list is passed.
+    """
+    rows, by_name, anchors, built, choice = _choose_side_chain(
+        table, mutation, chis=chis, scan=scan, environment=environment
+    )
+    if notes is not None and choice is not None:
+        notes.append(f"Rotamer for {mutation.describe()}: {describe_choice(choice)}.")
+
+    keep = set(BACKBONE_ATOMS)
+    if "CB" in anchors:
+        keep.add("CB")
+    edits = EditSet()
+    last_kept: Optional[int] = None
+    for i in rows.tolist():
+        atom = table.value("atomname", i).strip().upper()
+        if atom in keep:
+            edits.update(i, resname=mutation.to_res)
+            last_kept = i
+        else:
+            edits.delete(i)
+
+    template = table.row(by_name["CA"])
+    next_id = table.next_atom_id()
+    for k, (name, xyz) in enumerate(built.items()):
+        edits.insert_after(
+            last_kept,
+            {
+                "group": "ATOM",
+                "atom_id": next_id + k,
+                "element": name[0],
+                "resname": mutation.to_res,
+                "chain_auth": template.chain_auth,
+                "chain_pdb": template.chain_pdb,
+                "segid": template.segid,
+                "resseq": template.resseq,
+                "icode": template.icode,
+                "atomname": name,
+                "x": float(xyz[0]),
+                "y": float(xyz[1]),
+                "z": float(xyz[2]),
+                "occupancy": template.occupancy,
+                "bfactor": template.bfactor,
+                "label_asym": template.label_asym,
+                "label_seq": template.label_seq,
+            },
+        )
+    return edits
+
+
+def repack_edits(
+    table: AtomTable,
+    chain_auth: str,
+    resseq: int,
+    icode: str = "",
+    *,
+    environment: Optional[SiteEnvironment] = None,
+    notes: Optional[List[str]] = None,
+) -> EditSet:
+    """
+    Edit set moving the side-chain atoms of an existing residue to its best-scoring
+    rotamer. Only coordinates change (atom order, names and ids are kept), so it can follow
+    the fixed-geometry mutators in build_complexI_9TI4_models.py.
+    """
+    rows = table.residue_index().residue_rows(chain_auth, resseq, icode)
+    if isinstance(rows, slice):
+        rows = np.arange(rows.start, rows.stop, dtype=np.int64)
+    if len(rows) == 0:
+        raise RuntimeError(f"Could not find target residue {chain_auth}:{resseq}{icode} in table")
+    resname = canonical_resname(table.value("resname", int(rows[0])))
+    site = PointMutation(chain_auth, resseq, icode, resname, resname)
+    _, by_name, _, built, choice = _choose_side_chain(
+        table, site, chis=None, scan=True, environment=environment
+    )
+    if notes is not None and choice is not None:
+        notes.append(f"Side chain repacked at chain {chain_auth} resid {resseq}{icode} {resname}: {describe_choice(choice)}.")
+    edits = EditSet()
+    for name, xyz in built.items():
+        row = by_name.get(name)
+        if row is not None and name != "CB":
+            edits.update(row, x=float(xyz[0]), y=float(xyz[1]), z=float(xyz[2]))
+    return edits
+
+
+def validate_variant(table: AtomTable, variant: Variant) -> List[str]:
+    """
+    Check every mutation of `variant` against `table` without building anything; returns
+    one message per problem (missing residue or backbone atoms, FROM residue mismatch).
+    A later mutation of an already mutated site is checked against the earlier TO residue.
+    """
+    problems: List[str] = []
+    mutated: Dict[Tuple[str, int, str], str] = {}
+    for mutation in variant.mutations:
+        site = (mutation.chain_auth, mutation.resseq, mutation.icode)
+        if site in mutated:
+            if mutated[site] != mutation.from_res:
+                problems.append(
+                    f"{variant.name}: Residue {mutation.chain_auth}:{mutation.resseq}{mutation.icode} is "
+                    f"{mutated[site]} after the earlier mutation, spec expects {mutation.from_res}"
+                )
+        else:
+            try:
+                side_chain_context(table, mutation)
+            except RuntimeError as exc:
+                problems.append(f"{variant.name}: {exc}")
+        mutated[site] = mutation.to_res
+    return problems
+
+
+def apply_variant(
+    table: AtomTable,
+    variant: Variant,
+    *,
+    scan: bool = True,
+    notes: Optional[List[str]] = None,
+) -> AtomTable:
+    """Apply every mutation of `variant` to `table` (in spec order) and return the new table."""
+    out = table
+    for mutation in variant.mutations:
+        out = out.apply(mutation_edits(out, mutation, scan=scan, notes=notes))
+    return out
@@ -5,6 +5,9 @@
 #
 # Usage (explicit file):
 #   vmd -e vmd_view_complexI_9TI4_features.tcl -args /path/to/model.pdb
+#
+# Usage (with occupancy maps from simulation/occupancy_grid.py, in the frame of the model):
+#   vmd -e vmd_view_complexI_9TI4_features.tcl -args /path/to/model.pdb --dx water.dx --dx o2.dx --dx-iso 0.1
 
 set _ci_script_dir [file dirname [info script]]
 source [file join $_ci_script_dir "ci_showhide.tcl"]
@@ -162,6 +165,10 @@ proc main {} {
 
   mol new $pdb_file type pdb waitfor all
   set molid [molinfo top]
+  set dx_files [dict get $cli_opts dx_files]
+  foreach dx_file $dx_files {
+    mol addfile $dx_file type dx waitfor all molid $molid
+  }
 
   # Clear any lingering OpenGL drawing objects (helps if you source the script in an existing VMD session).
   catch {graphics $molid delete all}
@@ -170,9 +177,10 @@ proc main {} {
   ci_reset
 
 	  # Recenter coordinates near the origin so resetview doesn't throw the complex into a corner
-	  # (PDB coords are in an absolute reference frame).
+	  # (PDB coords are in an absolute reference frame). Skipped when --dx maps are loaded:
+	  # volumetric data does not move with the atoms.
 	  set pcenter [_center_of_selection $molid "protein and name CA"]
-	  if {$pcenter ne ""} {
+	  if {$pcenter ne "" && [llength $dx_files] == 0} {
 	    set shift [list \
 	      [expr {-1.0*[lindex $pcenter 0]}] \
 	      [expr {-1.0*[lindex $pcenter 1]}] \
@@ -398,6 +406,14 @@ proc main {} {
     _label_at_atom $molid $seltext $label $colorname
   }
 
+  # Occupancy maps (--dx): one transparent isosurface per map at --dx-iso (not toggled by --show/--hide).
+  set dx_colors {0 1 7 4}
+  set dx_iso [dict get $cli_opts dx_iso]
+  for {set v 0} {$v < [llength $dx_files]} {incr v} {
+    set colorid [lindex $dx_colors [expr {$v % [llength $dx_colors]}]]
+    ci_add_rep $molid [list Isosurface $dx_iso $v 0 0 1 1] "all" [list ColorID $colorid] Transparent
+  }
+
   # Apply initial visibility based on CLI toggles.
   ci_apply_visibility $show_parts $nd_list $arm_mode
 
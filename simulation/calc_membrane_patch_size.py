@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 import argparse
-import math
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Iterable
 
+import numpy as np
+
+from membrane_frame_cache import CACHE_FILE_NAME, MembraneFrame, cache_status_text, load_reference_frame, pca_basis
+from pdb_atom_table import PdbAtomTable, parse_resname_list, read_pdb_atom_table
+
 
 DEFAULT_REFERENCE_LIPID_RESNAMES = {"CDL", "PEE", "PLX", "DGT"}
 DEFAULT_REFERENCE_PDB = Path("output/playwright/chatgpt_botprompts/models/complexI_9TI4_WT_heavy.pdb")
@@ -37,42 +41,6 @@ DEFAULT_EXCLUDE_RESNAMES = {
 }
 
 
-@dataclass
-class MinMax:
-    minx: float = math.inf
-    miny: float = math.inf
-    minz: float = math.inf
-    maxx: float = -math.inf
-    maxy: float = -math.inf
-    maxz: float = -math.inf
-
-    def update(self, x: float, y: float, z: float) -> None:
-        if x < self.minx:
-            self.minx = x
-        if y < self.miny:
-            self.miny = y
-        if z < self.minz:
-            self.minz = z
-        if x > self.maxx:
-            self.maxx = x
-        if y > self.maxy:
-            self.maxy = y
-        if z > self.maxz:
-            self.maxz = z
-
-    def valid(self) -> bool:
-        return self.minx != math.inf
-
-    def dx(self) -> float:
-        return self.maxx - self.minx
-
-    def dy(self) -> float:
-        return self.maxy - self.miny
-
-    def dz(self) -> float:
-        return self.maxz - self.minz
-
-
 def _split_csv(values: Iterable[str]) -> set[str]:
     out: set[str] = set()
     for item in values:
@@ -84,171 +52,124 @@ def _split_csv(values: Iterable[str]) -> set[str]:
     return out
 
 
-def iter_pdb_atoms(path: Path):
-    with path.open("r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            if not (line.startswith("ATOM") or line.startswith("HETATM")):
-                continue
-            if len(line) < 54:
-                continue
-            # Read up to 4 chars (VMD/CHARMM-style can use 4-letter residue names).
-            resname = line[17:21].strip().upper()
-            chain = line[21:22].strip().upper()
-            atomname = line[12:16].strip().upper()
-            try:
-                x = float(line[30:38])
-                y = float(line[38:46])
-                z = float(line[46:54])
-            except ValueError:
-                continue
-            yield resname, chain, atomname, x, y, z
-
-
-def _dot(a: tuple[float, float, float], b: tuple[float, float, float]) -> float:
-    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
-
-
-def _cross(a: tuple[float, float, float], b: tuple[float, float, float]) -> tuple[float, float, float]:
-    return (
-        a[1] * b[2] - a[2] * b[1],
-        a[2] * b[0] - a[0] * b[2],
-        a[0] * b[1] - a[1] * b[0],
-    )
-
-
-def _norm(a: tuple[float, float, float]) -> float:
-    return math.sqrt(_dot(a, a))
-
-
-def _scale(a: tuple[float, float, float], s: float) -> tuple[float, float, float]:
-    return (a[0] * s, a[1] * s, a[2] * s)
+def _parse_chain_list(chains: str) -> set[str]:
+    parts = [p.strip().upper() for p in chains.replace(",", " ").split() if p.strip()]
+    return set("".join(parts))
 
 
-def _normalize(a: tuple[float, float, float]) -> tuple[float, float, float]:
-    n = _norm(a)
-    if n == 0.0:
-        raise ValueError("Cannot normalize zero-length vector")
-    return _scale(a, 1.0 / n)
+@dataclass(frozen=True)
+class PatchSizeResult:
+    """Membrane patch sizing result.
 
+    For mode 'xy' the extents are axis-aligned (extent_u=dx, extent_v=dy) and `frame`
+    is None; otherwise extents are measured along the frame's in-plane u/v axes.
+    """
 
-def _jacobi_eigen_3x3(
-    a: list[list[float]],
+    mode: str
+    frame: MembraneFrame | None
+    extent_selection: str
+    atoms_used: int
+    nd_ca_atoms: int
+    bbox_min: tuple[float, float, float] | None
+    bbox_max: tuple[float, float, float] | None
+    extent_u: float
+    extent_v: float
+    extent_n: float
+    margin: float
+    patch_x: float
+    patch_y: float
+
+
+def compute_patch_size(
+    atoms: PdbAtomTable,
     *,
-    max_iter: int = 50,
-    eps: float = 1e-12,
-) -> tuple[list[float], list[list[float]]]:
-    """Eigen-decomposition of a real symmetric 3x3 matrix using Jacobi rotations.
-
-    Returns (eigenvalues, eigenvectors_matrix), where eigenvectors are columns of V.
+    mode: str = "lipid_plane",
+    extent: str = "nd",
+    nd_chains: set[str] | None = None,
+    margin: float = 25.0,
+    exclude_resnames: set[str] | None = None,
+    frame: MembraneFrame | None = None,
+) -> PatchSizeResult:
+    """Size a membrane patch for a preloaded structure.
+
+    `mode` is 'lipid_plane' (requires `frame`, e.g. from `load_reference_frame`),
+    'nd_plane' (PCA of ND CA atoms) or 'xy'. ND chains match case-insensitively, as in
+    the CLI. Raises ValueError when the selection is too small.
     """
-    v = [
-        [1.0, 0.0, 0.0],
-        [0.0, 1.0, 0.0],
-        [0.0, 0.0, 1.0],
-    ]
-
-    def max_offdiag(m: list[list[float]]):
-        pairs = [(0, 1), (0, 2), (1, 2)]
-        p, q = max(pairs, key=lambda ij: abs(m[ij[0]][ij[1]]))
-        return p, q, abs(m[p][q])
-
-    for _ in range(max_iter):
-        p, q, off = max_offdiag(a)
-        if off < eps:
-            break
-
-        app = a[p][p]
-        aqq = a[q][q]
-        apq = a[p][q]
-        if apq == 0.0:
-            continue
-
-        phi = 0.5 * math.atan2(2.0 * apq, (aqq - app))
-        c = math.cos(phi)
-        s = math.sin(phi)
-
-        for i in range(3):
-            if i == p or i == q:
-                continue
-            aip = a[i][p]
-            aiq = a[i][q]
-            a[i][p] = a[p][i] = c * aip - s * aiq
-            a[i][q] = a[q][i] = s * aip + c * aiq
-
-        a[p][p] = c * c * app - 2.0 * s * c * apq + s * s * aqq
-        a[q][q] = s * s * app + 2.0 * s * c * apq + c * c * aqq
-        a[p][q] = a[q][p] = 0.0
-
-        for i in range(3):
-            vip = v[i][p]
-            viq = v[i][q]
-            v[i][p] = c * vip - s * viq
-            v[i][q] = s * vip + c * viq
-
-    eigvals = [a[0][0], a[1][1], a[2][2]]
-    return eigvals, v
-
-
-def _pca_basis(points: list[tuple[float, float, float]]):
-    if len(points) < 3:
-        raise ValueError("Need at least 3 points for PCA")
-
-    n = float(len(points))
-    mean = (sum(p[0] for p in points) / n, sum(p[1] for p in points) / n, sum(p[2] for p in points) / n)
-
-    cov = [[0.0, 0.0, 0.0] for _ in range(3)]
-    for x, y, z in points:
-        dx = x - mean[0]
-        dy = y - mean[1]
-        dz = z - mean[2]
-        cov[0][0] += dx * dx
-        cov[0][1] += dx * dy
-        cov[0][2] += dx * dz
-        cov[1][1] += dy * dy
-        cov[1][2] += dy * dz
-        cov[2][2] += dz * dz
-    cov[0][0] /= n
-    cov[0][1] /= n
-    cov[0][2] /= n
-    cov[1][1] /= n
-    cov[1][2] /= n
-    cov[2][2] /= n
-    cov[1][0] = cov[0][1]
-    cov[2][0] = cov[0][2]
-    cov[2][1] = cov[1][2]
-
-    eigvals, v = _jacobi_eigen_3x3(cov)
-    eig = [
-        (eigvals[0], (v[0][0], v[1][0], v[2][0])),
-        (eigvals[1], (v[0][1], v[1][1], v[2][1])),
-        (eigvals[2], (v[0][2], v[1][2], v[2][2])),
-    ]
-    eig.sort(key=lambda t: t[0])  # ascending
-
-    nvec = _normalize(eig[0][1])
-    uvec = _normalize(eig[2][1])
-    if abs(_dot(uvec, nvec)) > 0.9:
-        uvec = _normalize(eig[1][1])
-    vvec = _normalize(_cross(nvec, uvec))
-    uvec = _normalize(_cross(vvec, nvec))
-
-    return mean, uvec, vvec, nvec, [e[0] for e in eig]
-
+    exclude = set(DEFAULT_EXCLUDE_RESNAMES) if exclude_resnames is None else set(exclude_resnames)
+    nd = {c.upper() for c in (nd_chains if nd_chains is not None else _parse_chain_list("s,i,j,r,l,m"))}
+    keep = atoms.select(exclude_resnames=exclude)
 
-def _parse_chain_list(chains: str) -> set[str]:
-    parts = [p.strip().upper() for p in chains.replace(",", " ").split() if p.strip()]
-    return set("".join(parts))
+    if mode == "xy":
+        if len(keep) < 1:
+            raise ValueError(
+                "No atoms contributed to the bounding box. Try --include-lipids or adjust --exclude-resnames."
+            )
+        pts = atoms.xyz[keep]
+        lo = pts.min(axis=0)
+        hi = pts.max(axis=0)
+        dx, dy, dz = (float(hi[k] - lo[k]) for k in range(3))
+        return PatchSizeResult(
+            mode=mode,
+            frame=None,
+            extent_selection="protein",
+            atoms_used=len(keep),
+            nd_ca_atoms=0,
+            bbox_min=(float(lo[0]), float(lo[1]), float(lo[2])),
+            bbox_max=(float(hi[0]), float(hi[1]), float(hi[2])),
+            extent_u=dx,
+            extent_v=dy,
+            extent_n=dz,
+            margin=float(margin),
+            patch_x=dx + 2.0 * float(margin),
+            patch_y=dy + 2.0 * float(margin),
+        )
 
+    in_nd = np.isin(np.char.upper(atoms.chain[keep]), list(nd))
+    nd_all = keep[in_nd]
+    nd_ca = nd_all[atoms.atomname[nd_all] == "CA"]
+    if len(nd_all) < 1:
+        raise ValueError(
+            f"No ND atoms found (chains={sorted(c.lower() for c in nd)}). Check --nd-chains or input PDB."
+        )
 
-def _parse_resname_list(values: Iterable[str]) -> set[str]:
-    out: set[str] = set()
-    for item in values:
-        for part in str(item).replace(";", ",").split(","):
-            part = part.strip()
-            if not part:
-                continue
-            out.add(part.upper())
-    return out
+    if mode == "nd_plane":
+        if len(nd_ca) < 3:
+            raise ValueError(
+                f"Not enough ND CA atoms to infer membrane plane (chains={sorted(c.lower() for c in nd)}; "
+                f"found {len(nd_ca)})."
+            )
+        frame = MembraneFrame.from_basis(pca_basis(atoms.xyz[nd_ca].tolist()))
+    elif mode == "lipid_plane":
+        if frame is None:
+            raise ValueError("lipid_plane mode needs a reference frame (see load_reference_frame).")
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+
+    sel = keep if extent == "protein" else nd_all
+    if len(sel) < 1:
+        raise ValueError("No atoms selected for extent calculation.")
+    pts = atoms.xyz[sel]
+    uu = pts @ np.asarray(frame.u)
+    vv = pts @ np.asarray(frame.v)
+    nn = pts @ np.asarray(frame.n)
+    du = float(uu.max() - uu.min())
+    dv = float(vv.max() - vv.min())
+    return PatchSizeResult(
+        mode=mode,
+        frame=frame,
+        extent_selection=extent,
+        atoms_used=len(sel),
+        nd_ca_atoms=len(nd_ca),
+        bbox_min=None,
+        bbox_max=None,
+        extent_u=du,
+        extent_v=dv,
+        extent_n=float(nn.max() - nn.min()),
+        margin=float(margin),
+        patch_x=du + 2.0 * float(margin),
+        patch_y=dv + 2.0 * float(margin),
+    )
 
 
 def main() -> int:
@@ -298,6 +219,16 @@ def main() -> int:
             "(can be provided multiple times). Default: CDL,PEE,PLX,DGT."
         ),
     )
+    ap.add_argument(
+        "--frame-cache",
+        default=None,
+        help=f"JSON cache of fitted reference frames (default: {CACHE_FILE_NAME} next to --reference-pdb).",
+    )
+    ap.add_argument(
+        "--no-frame-cache",
+        action="store_true",
+        help="Always refit the reference lipid plane (do not read or write the frame cache).",
+    )
     ap.add_argument(
         "--exclude-resnames",
         action="append",
@@ -323,117 +254,72 @@ def main() -> int:
     if args.include_lipids:
         exclude -= {"POP", "POPC", "TYC", "CDL", "PEE", "PLX", "DGT"}
 
-    if args.mode == "xy":
-        mm = MinMax()
-        atoms = 0
-        for resname, _chain, _atomname, x, y, z in iter_pdb_atoms(pdb_path):
-            if resname in exclude:
-                continue
-            atoms += 1
-            mm.update(x, y, z)
-
-        if atoms < 1 or not mm.valid():
-            raise SystemExit(
-                "No atoms contributed to the bounding box. Try --include-lipids or adjust --exclude-resnames."
-            )
-
-        dx = mm.dx()
-        dy = mm.dy()
-        dz = mm.dz()
-        patch_x = dx + 2.0 * float(args.margin)
-        patch_y = dy + 2.0 * float(args.margin)
-
-        print(f"PDB: {pdb_path}")
-        print("Mode: xy (axis-aligned)")
-        print(f"Included atoms: {atoms}")
-        print(f"Complex min (A): x={mm.minx:.3f} y={mm.miny:.3f} z={mm.minz:.3f}")
-        print(f"Complex max (A): x={mm.maxx:.3f} y={mm.maxy:.3f} z={mm.maxz:.3f}")
-        print(f"Complex extents (A): dx={dx:.3f} dy={dy:.3f} dz={dz:.3f}")
-        print(f"Margin (A): {float(args.margin):.3f} per side")
-        print(f"Recommended membrane patch (A): x={patch_x:.3f} y={patch_y:.3f}")
-        return 0
-
     nd_chains = _parse_chain_list(args.nd_chains)
-    nd_ca: list[tuple[float, float, float]] = []
-    nd_all: list[tuple[float, float, float]] = []
-    prot_all: list[tuple[float, float, float]] = []
-
-    for resname, chain, atomname, x, y, z in iter_pdb_atoms(pdb_path):
-        if resname in exclude:
-            continue
-        prot_all.append((x, y, z))
-        if chain in nd_chains:
-            nd_all.append((x, y, z))
-            if atomname == "CA":
-                nd_ca.append((x, y, z))
-
-    if len(nd_all) < 1:
-        raise SystemExit(
-            f"No ND atoms found (chains={sorted(c.lower() for c in nd_chains)}). Check --nd-chains or input PDB."
-        )
-
-    if args.mode == "nd_plane":
-        if len(nd_ca) < 3:
-            raise SystemExit(
-                f"Not enough ND CA atoms to infer membrane plane (chains={sorted(c.lower() for c in nd_chains)}; "
-                f"found {len(nd_ca)})."
-            )
-        _mean, u, v, nvec, eigs = _pca_basis(nd_ca)
-        plane_label = "nd_plane (ND PCA inferred)"
-        ref_info = ""
-    else:
+    frame = None
+    ref_info = ""
+    if args.mode == "lipid_plane":
         # lipid_plane mode: infer membrane plane from native lipid atoms in a reference PDB.
         ref_pdb = Path(args.reference_pdb)
         if not ref_pdb.exists():
             raise SystemExit(f"Missing --reference-pdb: {ref_pdb}")
 
         ref_lipids = set(DEFAULT_REFERENCE_LIPID_RESNAMES)
-        ref_lipids |= _parse_resname_list(args.reference_lipids)
-        ref_points: list[tuple[float, float, float]] = []
-        for resname, _chain, _atomname, x, y, z in iter_pdb_atoms(ref_pdb):
-            if resname in ref_lipids:
-                ref_points.append((x, y, z))
-        if len(ref_points) < 3:
-            raise SystemExit(
-                f"Not enough reference lipid atoms to fit plane in {ref_pdb} "
-                f"(resnames={sorted(ref_lipids)}; atoms={len(ref_points)})."
+        ref_lipids |= parse_resname_list(args.reference_lipids)
+        try:
+            frame, cache_status = load_reference_frame(
+                ref_pdb,
+                ref_lipids,
+                cache_path=Path(args.frame_cache) if args.frame_cache else None,
+                use_cache=not args.no_frame_cache,
             )
-        _mean, u, v, nvec, eigs = _pca_basis(ref_points)
-        plane_label = "lipid_plane (reference lipid PCA)"
-        ref_info = f"\nReference PDB: {ref_pdb}\nRef lipids: {','.join(sorted(ref_lipids))}"
-
-    points_for_extent = prot_all if args.extent == "protein" else nd_all
-    if len(points_for_extent) < 1:
-        raise SystemExit("No atoms selected for extent calculation.")
-
-    min_u = min_v = math.inf
-    max_u = max_v = -math.inf
-    for p in points_for_extent:
-        uu = _dot(u, p)
-        vv = _dot(v, p)
-        min_u = min(min_u, uu)
-        max_u = max(max_u, uu)
-        min_v = min(min_v, vv)
-        max_v = max(max_v, vv)
-
-    du = max_u - min_u
-    dv = max_v - min_v
-    patch_x = du + 2.0 * float(args.margin)
-    patch_y = dv + 2.0 * float(args.margin)
+        except ValueError as exc:
+            raise SystemExit(f"{exc} Reference: {ref_pdb}")
+        cache_info = cache_status_text(cache_status)
+        ref_info = (
+            f"\nReference PDB: {ref_pdb}\nRef lipids: {','.join(sorted(ref_lipids))}\nFrame cache: {cache_info}"
+        )
+
+    try:
+        result = compute_patch_size(
+            read_pdb_atom_table(pdb_path),
+            mode=args.mode,
+            extent=args.extent,
+            nd_chains=nd_chains,
+            margin=float(args.margin),
+            exclude_resnames=exclude,
+            frame=frame,
+        )
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+
+    if result.mode == "xy":
+        mn = result.bbox_min
+        mx = result.bbox_max
+        print(f"PDB: {pdb_path}")
+        print("Mode: xy (axis-aligned)")
+        print(f"Included atoms: {result.atoms_used}")
+        print(f"Complex min (A): x={mn[0]:.3f} y={mn[1]:.3f} z={mn[2]:.3f}")
+        print(f"Complex max (A): x={mx[0]:.3f} y={mx[1]:.3f} z={mx[2]:.3f}")
+        print(f"Complex extents (A): dx={result.extent_u:.3f} dy={result.extent_v:.3f} dz={result.extent_n:.3f}")
+        print(f"Margin (A): {result.margin:.3f} per side")
+        print(f"Recommended membrane patch (A): x={result.patch_x:.3f} y={result.patch_y:.3f}")
+        return 0
 
+    plane_label = "nd_plane (ND PCA inferred)" if result.mode == "nd_plane" else "lipid_plane (reference lipid PCA)"
+    nvec = result.frame.n
     print(f"PDB: {pdb_path}")
     print(f"Mode: {plane_label}")
     if ref_info:
         print(ref_info)
     print(f"ND chains: {','.join(sorted(c.lower() for c in nd_chains))}")
-    if args.mode == "nd_plane":
-        print(f"ND CA atoms used: {len(nd_ca)}")
-    print(f"Plane eigvals: {', '.join(f'{x:.6f}' for x in eigs)}")
+    if result.mode == "nd_plane":
+        print(f"ND CA atoms used: {result.nd_ca_atoms}")
+    print(f"Plane eigvals: {', '.join(f'{x:.6f}' for x in result.frame.eigenvalues)}")
     print(f"Membrane normal (unit): nx={nvec[0]:.6f} ny={nvec[1]:.6f} nz={nvec[2]:.6f}")
-    print(f"Extent selection: {args.extent}")
-    print(f"Extents in membrane plane (A): du={du:.3f} dv={dv:.3f}")
-    print(f"Margin (A): {float(args.margin):.3f} per side")
-    print(f"Recommended membrane patch (A): x={patch_x:.3f} y={patch_y:.3f}")
+    print(f"Extent selection: {result.extent_selection}")
+    print(f"Extents in membrane plane (A): du={result.extent_u:.3f} dv={result.extent_v:.3f}")
+    print(f"Margin (A): {result.margin:.3f} per side")
+    print(f"Recommended membrane patch (A): x={result.patch_x:.3f} y={result.patch_y:.3f}")
 
     return 0
 
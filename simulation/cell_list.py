@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import itertools
+
+import numpy as np
+
+
+# Above this many grid cells the dense cell-start table is replaced by a binary search
+# over the sorted cell keys (keeps memory bounded for very sparse/large boxes).
+MAX_DENSE_CELLS = 1 << 24
+
+
+class CellList:
+    """Uniform cell list over a fixed set of points for fixed-radius neighbour queries.
+
+    Points are binned once into cubic cells of `cell_size` A and sorted by cell key.
+    Queries visit the neighbouring cells of each query point, so building and querying
+    are both linear in the number of points for a cutoff close to the cell size.
+    """
+
+    def __init__(self, points: np.ndarray, cell_size: float) -> None:
+        if cell_size <= 0.0:
+            raise ValueError("cell_size must be positive")
+        self.points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+        self.cell_size = float(cell_size)
+        if len(self.points) == 0:
+            self.origin = np.zeros(3)
+            self.shape = np.ones(3, dtype=np.int64)
+        else:
+            self.origin = self.points.min(axis=0)
+            self.shape = np.floor((self.points.max(axis=0) - self.origin) / self.cell_size).astype(np.int64) + 1
+
+        keys = self._keys(self._cells(self.points))
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.order]
+        n_cells = int(np.prod(self.shape))
+        self._dense = n_cells <= MAX_DENSE_CELLS
+        if self._dense:
+            counts = np.bincount(keys, minlength=n_cells)
+            self._starts = np.concatenate(([0], np.cumsum(counts)))
+
+    def _cells(self, pts: np.ndarray) -> np.ndarray:
+        return np.floor((pts - self.origin) / self.cell_size).astype(np.int64)
+
+    def _keys(self, cells: np.ndarray) -> np.ndarray:
+        return (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + cells[:, 2]
+
+    def _cell_ranges(self, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if self._dense:
+            return self._starts[keys], self._starts[keys + 1]
+        lo = np.searchsorted(self.sorted_keys, keys, side="left")
+        hi = np.searchsorted(self.sorted_keys, keys, side="right")
+        return lo, hi
+
+    def query_pairs(
+        self,
+        queries: np.ndarray,
+        cutoff: float,
+        *,
+        chunk_size: int = 200_000,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (query_index, point_index, distance_sq) for all pairs within `cutoff`."""
+        queries = np.ascontiguousarray(queries, dtype=np.float64).reshape(-1, 3)
+        cutoff_sq = float(cutoff) * float(cutoff)
+        reach = int(np.ceil(float(cutoff) / self.cell_size))
+        offsets = np.array(list(itertools.product(range(-reach, reach + 1), repeat=3)), dtype=np.int64)
+
+        out_q: list[np.ndarray] = []
+        out_p: list[np.ndarray] = []
+        out_d: list[np.ndarray] = []
+        if len(self.points) == 0:
+            empty_i = np.zeros(0, dtype=np.int64)
+            return empty_i, empty_i, np.zeros(0)
+
+        for start in range(0, len(queries), chunk_size):
+            q = queries[start : start + chunk_size]
+            qcells = self._cells(q)
+            # Queries far outside the grid cannot have neighbours.
+            near = np.all((qcells >= -reach) & (qcells < self.shape + reach), axis=1)
+            qidx = np.flatnonzero(near)
+            qcells = qcells[qidx]
+            for off in offsets:
+                cells = qcells + off
+                inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+                if not inside.any():
+                    continue
+                qi = qidx[inside]
+                lo, hi = self._cell_ranges(self._keys(cells[inside]))
+                counts = hi - lo
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+                qi = np.repeat(qi, counts)
+                first = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+                pj = self.order[first + np.arange(total)]
+                diff = q[qi] - self.points[pj]
+                d2 = np.einsum("ij,ij->i", diff, diff)
+                keep = d2 <= cutoff_sq
+                out_q.append(qi[keep] + start)
+                out_p.append(pj[keep])
+                out_d.append(d2[keep])
+
+        if not out_q:
+            empty_i = np.zeros(0, dtype=np.int64)
+            return empty_i, empty_i, np.zeros(0)
+        return np.concatenate(out_q), np.concatenate(out_p), np.concatenate(out_d)
+
+    def any_within(self, queries: np.ndarray, cutoff: float) -> np.ndarray:
+        """Boolean mask: query point has at least one indexed point within `cutoff`."""
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        qi, _pj, _d2 = self.query_pairs(queries, cutoff)
+        mask = np.zeros(len(queries), dtype=bool)
+        mask[qi] = True
+        return mask
+
+    def count_within(self, queries: np.ndarray, cutoff: float) -> np.ndarray:
+        """Number of indexed points within `cutoff` of each query point."""
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        qi, _pj, _d2 = self.query_pairs(queries, cutoff)
+        return np.bincount(qi, minlength=len(queries))
@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from dcd_reader import DcdChunk, DcdTrajectory, add_frame_range_args, check_atom_count, map_chunks
+from pdb_atom_table import PdbAtomTable, read_pdb_atom_table
+from superpose import fitted_rmsd
+
+
+# Column layout of NAMD colvars trajectory files (cvm::it_width, cv_width, cv_prec); the
+# readers in this repo (fespa_knp.py, analyzesmd.cpp) rely on it, analyzesmd by offset.
+COLVARS_STEP_WIDTH = 12
+COLVARS_VALUE_WIDTH = 21
+COLVARS_VALUE_PREC = 14
+
+CV_KINDS = {"distance": 2, "rmsd": 1, "coordnum": 2, "angle": 3}  # kind -> number of atom groups
+
+ELEMENT_MASSES = {
+    "H": 1.008,
+    "C": 12.011,
+    "N": 14.007,
+    "O": 15.999,
+    "P": 30.974,
+    "S": 32.06,
+    "FE": 55.845,
+    "MG": 24.305,
+    "ZN": 65.38,
+    "NA": 22.990,
+    "K": 39.098,
+    "CL": 35.45,
+    "CA": 40.078,
+}
+
+# Largest (frames x n1 x n2) pair-distance block evaluated at once for coordination numbers.
+COORDNUM_BLOCK = 1 << 22
+
+
+@dataclass(frozen=True)
+class CvSpec:
+    """One collective variable.
+
+    `groups` index into the atoms read per chunk (`CvTask.atoms`); `masses` holds the
+    per-atom masses of each group (group centers are centers of mass, as in colvars).
+    `reference` is the (n, 3) reference of an rmsd CV.
+    """
+
+    name: str
+    kind: str
+    groups: tuple[np.ndarray, ...]
+    masses: tuple[np.ndarray, ...]
+    reference: np.ndarray | None = None
+    cutoff: float = 4.0
+    expnum: int = 6
+    expden: int = 12
+
+
+@dataclass(frozen=True)
+class CvTask:
+    """Per-run context for the chunk workers: the union of all CV atoms and the CVs."""
+
+    atoms: np.ndarray
+    cvs: tuple[CvSpec, ...]
+
+
+def parse_selection(table: PdbAtomTable, text: str) -> np.ndarray:
+    """Atom indices for a selection like "chain=m resid=60-70,75 name=CA,CB".
+
+    Keys: chain, segid, resname, name, resid (values comma-separated, resid also as
+    ranges); all given keys must match. Chains/segids are case-sensitive.
+    """
+    filters: dict[str, set[str]] = {}
+    resids: set[int] = set()
+    for token in text.split():
+        key, sep, value = token.partition("=")
+        key = key.lower()
+        if not sep or not value or key not in ("chain", "segid", "resname", "name", "resid"):
+            raise ValueError(f"Bad selection term {token!r} in {text!r} (use chain=, segid=, resname=, name=, resid=)")
+        values = [v for v in value.split(",") if v]
+        if key == "resid":
+            for v in values:
+                lo, dash, hi = v.partition("-")
+                try:
+                    first, last = int(lo), int(hi if dash else lo)
+                except ValueError:
+                    raise ValueError(f"Bad resid {v!r} in {text!r}") from None
+                resids.update(range(first, last + 1))
+        else:
+            filters.setdefault(key, set()).update(values)
+    if not filters and not resids:
+        raise ValueError("Empty selection")
+    idx = table.select(
+        resnames=filters.get("resname"),
+        atomnames=filters.get("name"),
+        chains=filters.get("chain"),
+        segids=filters.get("segid"),
+    )
+    if resids:
+        idx = idx[np.isin(table.resseq[idx], list(resids))]
+    if len(idx) == 0:
+        raise ValueError(f"Selection matches no atoms: {text!r}")
+    return idx
+
+
+def atom_masses(table: PdbAtomTable, idx: np.ndarray) -> np.ndarray:
+    elements = [e.upper() for e in table.element[idx].tolist()]
+    unknown = sorted({e for e in elements if e not in ELEMENT_MASSES})
+    if unknown:
+        raise ValueError(f"No mass for element(s): {', '.join(unknown)}")
+    return np.array([ELEMENT_MASSES[e] for e in elements], dtype=np.float64)
+
+
+def centers_of_mass(xyz: np.ndarray, masses: np.ndarray) -> np.ndarray:
+    """(frames, 3) mass-weighted centers of (frames, n, 3) coordinates."""
+    return np.einsum("n,fni->fi", masses / masses.sum(), xyz)
+
+
+def coordination_number(xyz1: np.ndarray, xyz2: np.ndarray, cutoff: float, expnum: int, expden: int) -> np.ndarray:
+    """Colvars coordNum: sum over atom pairs of (1 - (d/d0)^n) / (1 - (d/d0)^m), per frame.
+
+    Frames are processed in blocks so the pair-distance array stays below COORDNUM_BLOCK.
+    """
+    n_frames = xyz1.shape[0]
+    block = max(1, COORDNUM_BLOCK // max(1, xyz1.shape[1] * xyz2.shape[1]))
+    out = np.empty(n_frames)
+    for f0 in range(0, n_frames, block):
+        a = xyz1[f0 : f0 + block, :, None, :]
+        b = xyz2[f0 : f0 + block, None, :, :]
+        x = ((a - b) ** 2).sum(axis=3) / (cutoff * cutoff)
+        num = 1.0 - x ** (expnum / 2)
+        den = 1.0 - x ** (expden / 2)
+        # At d == d0 the switching function tends to n/m.
+        at_cutoff = np.abs(den) < 1e-12
+        f = np.where(at_cutoff, expnum / expden, num / np.where(at_cutoff, 1.0, den))
+        out[f0 : f0 + block] = f.sum(axis=(1, 2))
+    return out
+
+
+def evaluate_cvs(xyz: np.ndarray, cvs: tuple[CvSpec, ...]) -> np.ndarray:
+    """(frames, n_cvs) values for (frames, n_atoms, 3) coordinates of `CvTask.atoms`."""
+    xyz = np.asarray(xyz, dtype=np.float64)
+    values = np.empty((xyz.shape[0], len(cvs)))
+    for k, cv in enumerate(cvs):
+        if cv.kind == "distance":
+            c1, c2 = (centers_of_mass(xyz[:, g], m) for g, m in zip(cv.groups, cv.masses))
+            values[:, k] = np.linalg.norm(c2 - c1, axis=1)
+        elif cv.kind == "angle":
+            c1, c2, c3 = (centers_of_mass(xyz[:, g], m) for g, m in zip(cv.groups, cv.masses))
+            u = c1 - c2
+            v = c3 - c2
+            cos = (u * v).sum(axis=1) / (np.linalg.norm(u, axis=1) * np.linalg.norm(v, axis=1))
+            values[:, k] = np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+        elif cv.kind == "coordnum":
+            g1, g2 = cv.groups
+            values[:, k] = coordination_number(xyz[:, g1], xyz[:, g2], cv.cutoff, cv.expnum, cv.expden)
+        elif cv.kind == "rmsd":
+            values[:, k] = fitted_rmsd(xyz[:, cv.groups[0]], cv.reference)
+        else:
+            raise ValueError(f"Unknown CV kind: {cv.kind}")
+    return values
+
+
+def cv_chunk(chunk: DcdChunk, task: CvTask) -> tuple[np.ndarray, np.ndarray]:
+    """(frames, values) of one chunk."""
+    return np.asarray(chunk.frames, dtype=np.int64), evaluate_cvs(chunk.xyz, task.cvs)
+
+
+def build_task(
+    table: PdbAtomTable,
+    specs: list[list[str]],
+    *,
+    reference: PdbAtomTable | None = None,
+    cutoff: float = 4.0,
+    expnum: int = 6,
+    expden: int = 12,
+) -> CvTask:
+    """Turn `KIND NAME SEL [SEL ...]` specs into a `CvTask` over the union of their atoms."""
+    reference = reference or table
+    if len(reference) != len(table):
+        raise ValueError(f"Reference has {len(reference)} atoms, system has {len(table)}")
+    parsed: list[tuple[str, str, list[np.ndarray]]] = []
+    names: set[str] = set()
+    for spec in specs:
+        if len(spec) < 2 or spec[0].lower() not in CV_KINDS:
+            raise ValueError(f"CV spec must start with one of {', '.join(CV_KINDS)} and a name (got: {' '.join(spec)})")
+        kind, name, sels = spec[0].lower(), spec[1], spec[2:]
+        if len(sels) != CV_KINDS[kind]:
+            raise ValueError(f"{kind} CV {name!r} needs {CV_KINDS[kind]} selection(s), got {len(sels)}")
+        if name in names:
+            raise ValueError(f"Duplicate CV name: {name}")
+        names.add(name)
+        parsed.append((kind, name, [parse_selection(table, s) for s in sels]))
+
+    atoms = np.unique(np.concatenate([g for _k, _n, groups in parsed for g in groups]))
+    cvs: list[CvSpec] = []
+    for kind, name, groups in parsed:
+        if kind == "rmsd" and len(groups[0]) < 3:
+            raise ValueError(f"rmsd CV {name!r} needs at least 3 atoms")
+        cvs.append(
+            CvSpec(
+                name=name,
+                kind=kind,
+                groups=tuple(np.searchsorted(atoms, g) for g in groups),
+                masses=tuple(atom_masses(table, g) for g in groups),
+                reference=reference.xyz[groups[0]] if kind == "rmsd" else None,
+                cutoff=cutoff,
+                expnum=expnum,
+                expden=expden,
+            )
+        )
+    return CvTask(atoms=atoms, cvs=tuple(cvs))
+
+
+def write_colvars_traj(path: Path, names: list[str], steps: np.ndarray, values: np.ndarray) -> None:
+    """Write CV values in the fixed-width NAMD `.colvars.traj` layout."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    label = "# " + "step".ljust(COLVARS_STEP_WIDTH - 2)
+    label += "".join("  " + n.ljust(COLVARS_VALUE_WIDTH) for n in names)
+    value_fmt = f"  %{COLVARS_VALUE_WIDTH}.{COLVARS_VALUE_PREC}e"
+    with path.open("w", encoding="utf-8", newline="\n") as fout:
+        fout.write(label.rstrip() + "\n")
+        for step, row in zip(np.asarray(steps).tolist(), np.asarray(values).tolist()):
+            fout.write(f"{step:{COLVARS_STEP_WIDTH}d}" + "".join(value_fmt % v for v in row) + "\n")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=(
+            "Evaluate collective variables offline over a NAMD DCD trajectory and write them in the NAMD\n"
+            "colvars trajectory layout (.colvars.traj), so fespa_knp.py / analyzesmd can use new CVs without\n"
+            "rerunning MD.\n\n"
+            "CVs (one --cv per column, in order):\n"
+            "  --cv distance NAME SEL1 SEL2        distance between centers of mass (A)\n"
+            "  --cv rmsd NAME SEL                  RMSD to --ref after optimal fit (A)\n"
+            "  --cv coordnum NAME SEL1 SEL2        colvars coordNum switching sum (--cutoff/--expnum/--expden)\n"
+            "  --cv angle NAME SEL1 SEL2 SEL3      angle at SEL2 between centers of mass (degrees)\n"
+            'Selections are quoted key=value terms, e.g. "chain=m resid=64 name=CA" or "resname=8Q1".\n\n'
+            "Each chunk of frames is evaluated with batched numpy operations in a worker process. Steps are\n"
+            "ISTART + k * NSAVC from the DCD header, matching the MD step column NAMD writes.\n"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    ap.add_argument("--pdb", required=True, help="System PDB with the same atoms/order as the DCD.")
+    ap.add_argument("--dcd", required=True, help="NAMD DCD trajectory.")
+    ap.add_argument("--out", required=True, help="Output file (e.g. job.colvars.traj).")
+    ap.add_argument(
+        "--cv",
+        nargs="+",
+        action="append",
+        required=True,
+        metavar="KIND NAME SEL",
+        help="Collective variable: KIND NAME SEL [SEL ...] (can be repeated; columns follow the order given).",
+    )
+    ap.add_argument("--ref", default=None, help="Reference PDB for rmsd CVs (same atoms/order; default: --pdb).")
+    ap.add_argument("--cutoff", type=float, default=4.0, help="coordnum cutoff d0 in A (default: 4.0, as colvars).")
+    ap.add_argument("--expnum", type=int, default=6, help="coordnum numerator exponent (default: 6).")
+    ap.add_argument("--expden", type=int, default=12, help="coordnum denominator exponent (default: 12).")
+    ap.add_argument(
+        "--with-initial",
+        action="store_true",
+        help="Also write the --pdb coordinates as the first row, at step ISTART - NSAVC (NAMD's initial line).",
+    )
+    add_frame_range_args(ap)
+    args = ap.parse_args()
+
+    if args.cutoff <= 0.0 or args.expnum <= 0 or args.expden <= args.expnum:
+        raise SystemExit("coordnum needs --cutoff > 0 and 0 < --expnum < --expden")
+    dcd = Path(args.dcd)
+    if not dcd.exists():
+        raise SystemExit(f"Missing --dcd: {dcd}")
+    table = read_pdb_atom_table(Path(args.pdb))
+    reference = read_pdb_atom_table(Path(args.ref)) if args.ref else None
+    try:
+        task = build_task(
+            table,
+            args.cv,
+            reference=reference,
+            cutoff=args.cutoff,
+            expnum=args.expnum,
+            expden=args.expden,
+        )
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+
+    with DcdTrajectory(dcd) as traj:
+        check_atom_count(traj, args.pdb, len(table))
+        header = traj.header
+    frames: list[np.ndarray] = []
+    values: list[np.ndarray] = []
+    for f, v in map_chunks(
+        dcd,
+        cv_chunk,
+        task,
+        chunk_size=args.chunk_size,
+        start=args.start,
+        stop=args.stop,
+        stride=args.stride,
+        atoms=task.atoms,
+        jobs=args.jobs,
+    ):
+        frames.append(f)
+        values.append(v)
+    if not frames:
+        raise SystemExit(f"No frames selected from {dcd}")
+    frame_idx = np.concatenate(frames)
+    steps = header.istart + frame_idx * header.nsavc
+    table_values = np.concatenate(values)
+    if args.with_initial:
+        initial = evaluate_cvs(table.xyz[task.atoms][None], task.cvs)
+        steps = np.concatenate([[max(header.istart - header.nsavc, 0)], steps])
+        table_values = np.concatenate([initial, table_values])
+
+    out = Path(args.out)
+    names = [cv.name for cv in task.cvs]
+    write_colvars_traj(out, names, steps, table_values)
+
+    print(f"DCD:    {dcd}  (frames: {len(frame_idx)}; steps {int(steps[0])}..{int(steps[-1])})")
+    for cv, col in zip(task.cvs, table_values.T):
+        sizes = "/".join(str(len(g)) for g in cv.groups)
+        print(f"  {cv.name:<16} {cv.kind:<9} atoms {sizes:<12} mean {col.mean():.4f}  min {col.min():.4f}  max {col.max():.4f}")
+    print(f"Wrote: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import argparse
+import lzma
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from cell_list import CellList
+from dcd_reader import AKMA_PS, DcdChunk, DcdTrajectory, add_frame_range_args, check_atom_count, chunk_ranges, map_chunks
+from pdb_atom_table import PdbAtomTable, parse_resname_list, read_pdb_atom_table, write_pdb_subset
+from place_membrane_patch import DEFAULT_LIPID_RESNAMES, ION_RESNAMES, WATER_RESNAMES
+
+
+# Compact trajectory layout (little-endian):
+#   header   MAGIC + HEADER fields
+#   atoms    int64[n_atoms]   indices of the stored atoms in the source system
+#   blocks   compressed payloads of `block_size` frames each (last one may be shorter)
+#   index    uint64[n_blocks, 2]  (offset, nbytes) of every block
+#   footer   FOOTER: index offset, n_blocks
+# A block payload is the int32 quantized coordinates (frames, atoms, 3), delta encoded
+# (first frame along the atoms, later frames against the previous frame) and split into
+# byte planes, followed by float64 (frames, 6) unit cells when present.
+MAGIC = b"NDQTRJ01"
+HEADER = struct.Struct("<8sIIIIdqqdI")  # magic, n_atoms, n_frames, block_size, codec, scale, istart, nsavc, delta, has_cell
+FOOTER = struct.Struct("<QQ")
+CODECS = {"zlib": 0, "lzma": 1}
+
+
+@dataclass(frozen=True)
+class EncodeTask:
+    """Per-run context for the block encoders."""
+
+    scale: float
+    codec: str
+    level: int
+
+
+def _compress(payload: bytes, codec: str, level: int) -> bytes:
+    if codec == "zlib":
+        return zlib.compress(payload, level)
+    return lzma.compress(payload, preset=level)
+
+
+def _decompress(data: bytes | memoryview, codec: str) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return lzma.decompress(data)
+
+
+def quantize(xyz: np.ndarray, scale: float) -> np.ndarray:
+    """Fixed-point int32 coordinates (units of `scale` A)."""
+    q = np.rint(np.asarray(xyz, dtype=np.float64) / scale)
+    if q.size and np.abs(q).max() >= 2**31:
+        raise ValueError(f"Coordinates exceed the int32 range at scale {scale:g} A")
+    return q.astype("<i4")
+
+
+def encode_block(xyz: np.ndarray, unit_cells: np.ndarray | None, task: EncodeTask) -> bytes:
+    """Compressed payload of one block of (frames, atoms, 3) coordinates."""
+    q = quantize(xyz, task.scale)
+    d = np.empty_like(q)
+    d[0] = np.diff(q[0], axis=0, prepend=0)
+    d[1:] = q[1:] - q[:-1]
+    planes = d.reshape(-1).view(np.uint8).reshape(-1, 4).T
+    payload = planes.tobytes()
+    if unit_cells is not None:
+        payload += np.asarray(unit_cells, dtype="<f8").tobytes()
+    return _compress(payload, task.codec, task.level)
+
+
+def decode_block(data: bytes | memoryview, n_frames: int, n_atoms: int, codec: str, has_unit_cell: bool) -> tuple[np.ndarray, np.ndarray | None]:
+    """(quantized int64 (frames, atoms, 3), unit cells or None) of one block."""
+    payload = _decompress(data, codec)
+    n = n_frames * n_atoms * 3
+    planes = np.frombuffer(payload, dtype=np.uint8, count=4 * n).reshape(4, n)
+    d = np.ascontiguousarray(planes.T).view("<i4").reshape(n_frames, n_atoms, 3)
+    q = np.cumsum(d, axis=0, dtype=np.int64)
+    q += np.cumsum(d[0], axis=0, dtype=np.int64) - d[0]
+    cells = None
+    if has_unit_cell:
+        cells = np.frombuffer(payload, dtype="<f8", offset=4 * n, count=6 * n_frames).reshape(n_frames, 6)
+    return q, cells
+
+
+def _encode_chunk(chunk: DcdChunk, task: EncodeTask) -> bytes:
+    return encode_block(chunk.xyz, chunk.unit_cells, task)
+
+
+def export_compact(
+    dcd: Path,
+    out: Path,
+    atoms: np.ndarray | None = None,
+    *,
+    scale: float = 0.01,
+    block_size: int = 100,
+    codec: str = "zlib",
+    level: int = 6,
+    start: int = 0,
+    stop: int | None = None,
+    stride: int = 1,
+    jobs: int = 0,
+) -> int:
+    """Write frames start:stop:stride of `atoms` from a DCD as a compact trajectory; returns frames written.
+
+    Blocks are encoded in parallel (`map_chunks`, one block per chunk) and written in
+    frame order; `map_chunks` keeps at most 2 * jobs blocks in flight, so memory does not
+    grow with trajectory length.
+    """
+    if scale <= 0.0 or block_size <= 0:
+        raise ValueError("scale and block_size must be positive")
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r} (use {', '.join(CODECS)})")
+    with DcdTrajectory(dcd) as traj:
+        h = traj.header
+        n_src = traj.n_atoms
+        frames = range(traj.n_frames)[start:stop:stride]
+    atoms = np.arange(n_src, dtype=np.int64) if atoms is None else np.asarray(atoms, dtype=np.int64)
+    task = EncodeTask(scale=float(scale), codec=codec, level=int(level))
+    first = frames.start if len(frames) else 0
+    index: list[tuple[int, int]] = []
+    out.parent.mkdir(parents=True, exist_ok=True)
+    fields = (len(atoms), block_size, CODECS[codec], scale, h.istart + first * h.nsavc, h.nsavc * frames.step, h.delta, int(h.has_unit_cell))
+    with out.open("wb") as fout:
+        # The frame count is written last, so an interrupted export is never read as complete.
+        fout.write(HEADER.pack(MAGIC, fields[0], 0, *fields[1:]))
+        fout.write(atoms.astype("<i8").tobytes())
+        for data in map_chunks(dcd, _encode_chunk, task, chunk_size=block_size, start=start, stop=stop, stride=stride, atoms=atoms, jobs=jobs):
+            index.append((fout.tell(), len(data)))
+            fout.write(data)
+        index_offset = fout.tell()
+        fout.write(np.asarray(index, dtype="<u8").reshape(-1, 2).tobytes())
+        fout.write(FOOTER.pack(index_offset, len(index)))
+        fout.seek(0)
+        fout.write(HEADER.pack(MAGIC, fields[0], len(frames), *fields[1:]))
+    return len(frames)
+
+
+class CompactTrajectory:
+    """Reader for trajectories written by `export_compact`.
+
+    The file is memory-mapped; only the blocks covering the requested frames are
+    decompressed, and the last decoded block is cached, so sequential `frame()` calls
+    cost one decompression per block. Coordinates are returned as float32 like
+    `DcdTrajectory`.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._raw = np.memmap(self.path, dtype=np.uint8, mode="r")
+        if len(self._raw) < HEADER.size + FOOTER.size or bytes(self._raw[:8]) != MAGIC:
+            raise ValueError(f"{self.path}: not a compact trajectory file")
+        (_magic, n_atoms, n_frames, block_size, codec, scale, istart, nsavc, delta, has_cell) = HEADER.unpack_from(self._raw, 0)
+        self.n_atoms = n_atoms
+        self.n_frames = n_frames
+        self.block_size = block_size
+        self.codec = {v: k for k, v in CODECS.items()}[codec]
+        self.scale = scale
+        self.istart = istart
+        self.nsavc = nsavc
+        self.delta = delta
+        self.has_unit_cell = bool(has_cell)
+        self.atom_indices = np.frombuffer(self._raw, dtype="<i8", count=n_atoms, offset=HEADER.size)
+        index_offset, n_blocks = FOOTER.unpack_from(self._raw, len(self._raw) - FOOTER.size)
+        self._index = np.frombuffer(self._raw, dtype="<u8", count=2 * n_blocks, offset=index_offset).reshape(-1, 2)
+        if n_blocks != -(-n_frames // block_size):
+            raise ValueError(f"{self.path}: block index does not match {n_frames} frames (incomplete export?)")
+        self._cached: tuple[int, np.ndarray, np.ndarray | None] | None = None
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def __enter__(self) -> "CompactTrajectory":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._cached = None
+        self.atom_indices = None
+        self._index = None
+        self._raw = None
+
+    def _block(self, b: int) -> tuple[np.ndarray, np.ndarray | None]:
+        if self._cached is None or self._cached[0] != b:
+            offset, nbytes = (int(v) for v in self._index[b])
+            n = min(self.block_size, self.n_frames - b * self.block_size)
+            q, cells = decode_block(memoryview(self._raw[offset : offset + nbytes]), n, self.n_atoms, self.codec, self.has_unit_cell)
+            self._cached = (b, q, cells)
+        return self._cached[1], self._cached[2]
+
+    def _gather(self, frames: range) -> tuple[np.ndarray, np.ndarray | None]:
+        idx = np.asarray(frames, dtype=np.int64)
+        xyz = np.empty((len(idx), self.n_atoms, 3), dtype=np.float32)
+        cells = np.empty((len(idx), 6)) if self.has_unit_cell else None
+        blocks = idx // self.block_size
+        for b in np.unique(blocks).tolist():
+            sel = np.flatnonzero(blocks == b)
+            q, c = self._block(b)
+            local = idx[sel] - b * self.block_size
+            xyz[sel] = q[local] * self.scale
+            if cells is not None:
+                cells[sel] = c[local]
+        return xyz, cells
+
+    def frame(self, index: int) -> np.ndarray:
+        """Coordinates of frame `index` as (n_atoms, 3) float32."""
+        if not -self.n_frames <= index < self.n_frames:
+            raise IndexError(f"frame {index} out of range for {self.n_frames} frames")
+        return self._gather(range(self.n_frames)[index : index + 1 or None])[0][0]
+
+    def frames(self, start: int | None = None, stop: int | None = None, stride: int = 1) -> np.ndarray:
+        """(n_frames, n_atoms, 3) float32 for frames start:stop:stride."""
+        return self._gather(range(self.n_frames)[start:stop:stride])[0]
+
+    def unit_cells(self, start: int | None = None, stop: int | None = None, stride: int = 1) -> np.ndarray | None:
+        """(n_frames, 6) unit cells as (a, b, c, alpha, beta, gamma), or None."""
+        return self._gather(range(self.n_frames)[start:stop:stride])[1]
+
+    def times_ps(self, frames: range | None = None) -> np.ndarray:
+        """Simulation time of each stored frame in ps (steps of the source DCD)."""
+        idx = np.arange(self.n_frames) if frames is None else np.asarray(frames)
+        return (self.istart + idx * self.nsavc) * self.delta * AKMA_PS
+
+    def read_chunk(self, frames: range) -> DcdChunk:
+        xyz, cells = self._gather(frames)
+        return DcdChunk(frames=frames, xyz=xyz, unit_cells=cells)
+
+    def iter_chunks(self, chunk_size: int, *, start: int = 0, stop: int | None = None, stride: int = 1) -> Iterator[DcdChunk]:
+        """Yield `DcdChunk`s like `DcdTrajectory.iter_chunks` (block-aligned sizes decode each block once)."""
+        for frames in chunk_ranges(self.n_frames, chunk_size, start=start, stop=stop, stride=stride):
+            yield self.read_chunk(frames)
+
+
+def protein_and_shell(
+    table: PdbAtomTable,
+    *,
+    chains: set[str] | None = None,
+    extra_resnames: set[str] | None = None,
+    shell_resnames: set[str] | None = None,
+    within: float = 5.0,
+    heavy_only: bool = False,
+) -> np.ndarray:
+    """Protein atoms (plus `extra_resnames`) and whole solvent residues within `within` A of them in `table`."""
+    non_protein = WATER_RESNAMES | ION_RESNAMES | DEFAULT_LIPID_RESNAMES
+    keep = np.zeros(len(table), dtype=bool)
+    protein = table.select(exclude_resnames=non_protein, chains=chains, heavy_only=heavy_only)
+    keep[protein[table.record[protein] == "ATOM"]] = True
+    if extra_resnames:
+        keep[table.select(resnames=extra_resnames, heavy_only=heavy_only)] = True
+    if within > 0.0 and keep.any():
+        shell = table.select(resnames=shell_resnames or (WATER_RESNAMES | ION_RESNAMES))
+        near = shell[CellList(table.xyz[keep], within).any_within(table.xyz[shell], within)]
+        residues = table.residue_ids()
+        in_shell = np.isin(residues, residues[near])
+        if heavy_only:
+            in_shell &= table.heavy_mask()
+        keep |= in_shell
+    return np.flatnonzero(keep)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=(
+            "Export a NAMD DCD (or an atom subset of it: protein plus nearby solvent) to a compact trajectory:\n"
+            "fixed-point coordinates (default 0.01 A), delta encoded between frames, compressed per block\n"
+            "(zlib or lzma), with a block index for random access. A PDB of the stored atoms is written next\n"
+            "to it. Read it back with `CompactTrajectory` (frames as (n_atoms, 3) float32 arrays).\n"
+        )
+    )
+    ap.add_argument("--pdb", required=True, help="System PDB with the same atoms/order as the DCD.")
+    ap.add_argument("--dcd", required=True, help="NAMD DCD trajectory.")
+    ap.add_argument("--out", required=True, help="Output compact trajectory (e.g. run1.qtrj).")
+    ap.add_argument("--out-pdb", default=None, help="PDB of the stored atoms (default: --out with .pdb suffix).")
+    ap.add_argument("--all-atoms", action="store_true", help="Store every atom (ignore the selection options).")
+    ap.add_argument("--chains", default=None, help="Comma-separated protein chains to keep (default: all; case-sensitive).")
+    ap.add_argument(
+        "--keep-resnames",
+        action="append",
+        default=[],
+        help="Extra residue names kept whole (e.g. 8Q1,OXY; can be repeated).",
+    )
+    ap.add_argument("--within", type=float, default=5.0, help="Keep water/ion residues within this many A of the kept atoms in --pdb (0: none; default: 5).")
+    ap.add_argument("--heavy-only", action="store_true", help="Drop hydrogens.")
+    ap.add_argument("--scale", type=float, default=0.01, help="Quantization step in A (default: 0.01).")
+    ap.add_argument("--codec", choices=sorted(CODECS), default="zlib", help="Block compression (default: zlib).")
+    ap.add_argument("--level", type=int, default=6, help="Compression level / lzma preset (default: 6).")
+    ap.add_argument("--block-size", type=int, default=100, help="Frames per compressed block (default: 100).")
+    add_frame_range_args(ap, chunk_size=None, tasks="blocks")
+    args = ap.parse_args()
+
+    dcd = Path(args.dcd)
+    if not dcd.exists():
+        raise SystemExit(f"Missing --dcd: {dcd}")
+    table = read_pdb_atom_table(Path(args.pdb))
+    with DcdTrajectory(dcd) as traj:
+        check_atom_count(traj, args.pdb, len(table))
+        dcd_frame_bytes = traj.header.frame_size
+
+    if args.all_atoms:
+        atoms = np.arange(len(table), dtype=np.int64)
+    else:
+        chains = {c.strip() for c in args.chains.split(",") if c.strip()} if args.chains else None
+        atoms = protein_and_shell(
+            table,
+            chains=chains,
+            extra_resnames=parse_resname_list(args.keep_resnames) if args.keep_resnames else None,
+            within=args.within,
+            heavy_only=args.heavy_only,
+        )
+    if len(atoms) == 0:
+        raise SystemExit("No atoms selected")
+
+    out = Path(args.out)
+    out_pdb = Path(args.out_pdb) if args.out_pdb else out.with_suffix(".pdb")
+    try:
+        n_frames = export_compact(
+            dcd,
+            out,
+            atoms,
+            scale=args.scale,
+            block_size=args.block_size,
+            codec=args.codec,
+            level=args.level,
+            start=args.start,
+            stop=args.stop,
+            stride=args.stride,
+            jobs=args.jobs,
+        )
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    write_pdb_subset(out_pdb, table, atoms)
+
+    size = out.stat().st_size
+    src = n_frames * dcd_frame_bytes
+    subset = n_frames * len(atoms) * 12
+    print(f"DCD:        {dcd}  (frames exported: {n_frames}; atoms: {len(atoms)}/{len(table)})")
+    print(f"Encoding:   {args.scale:g} A fixed point, {args.codec} level {args.level}, {args.block_size} frames/block")
+    if n_frames:
+        print(f"Size:       {size / 1e6:.2f} MB  ({src / max(size, 1):.1f}x smaller than the DCD frames, {subset / max(size, 1):.1f}x than float32 of the subset)")
+    print(f"Wrote: {out}")
+    print(f"Wrote: {out_pdb}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from cell_list import CellList
+from dcd_reader import DcdChunk, DcdTrajectory, add_frame_range_args, check_atom_count, map_chunks
+from pdb_atom_table import PdbAtomTable, read_pdb_atom_table
+from place_membrane_patch import DEFAULT_LIPID_RESNAMES, ION_RESNAMES, WATER_RESNAMES
+
+
+ResidueKey = tuple[str, int, str]  # (chain, resseq, icode)
+
+# The LHON sites built by build_complexI_9TI4_models.py (ND1 A52T, ND4 R340H, ND6 M64V).
+DEFAULT_FOCUS = "s:52,r:340,m:64"
+
+
+@dataclass(frozen=True)
+class ContactTask:
+    """Per-system context for the chunk workers.
+
+    `atoms` are the protein heavy atoms read per chunk and `residue` their index into the
+    shared residue key list (the same for every compared system). Only contacts with at
+    least one residue in `focus` (bool per residue; None = all) are counted; residues of
+    the same chain closer than `min_separation` in sequence are skipped.
+    """
+
+    atoms: np.ndarray
+    residue: np.ndarray
+    res_chain: np.ndarray
+    res_seq: np.ndarray
+    n_residues: int
+    cutoff: float
+    min_separation: int
+    focus: np.ndarray | None
+
+
+@dataclass
+class ContactCounts:
+    """Sparse COO residue-pair contact counts: pair (rows[k], cols[k]) seen in counts[k] frames."""
+
+    rows: np.ndarray
+    cols: np.ndarray
+    counts: np.ndarray
+    n_frames: int
+
+    @classmethod
+    def from_codes(cls, codes: np.ndarray, n_residues: int, n_frames: int, weights: np.ndarray | None = None) -> "ContactCounts":
+        uniq, inv = np.unique(codes, return_inverse=True)
+        counts = np.bincount(inv.reshape(-1), weights=weights, minlength=len(uniq)).astype(np.int64)
+        return cls(uniq // n_residues, uniq % n_residues, counts, n_frames)
+
+    @classmethod
+    def merge(cls, parts: list["ContactCounts"], n_residues: int) -> "ContactCounts":
+        """Sum partial matrices (from chunks/workers) into one."""
+        if not parts:
+            empty = np.zeros(0, dtype=np.int64)
+            return cls(empty, empty, empty, 0)
+        codes = np.concatenate([p.rows * n_residues + p.cols for p in parts])
+        weights = np.concatenate([p.counts for p in parts]).astype(np.float64)
+        return cls.from_codes(codes, n_residues, sum(p.n_frames for p in parts), weights)
+
+    def frequency(self) -> np.ndarray:
+        return self.counts / max(self.n_frames, 1)
+
+
+def contact_chunk(chunk: DcdChunk, task: ContactTask) -> ContactCounts:
+    """Residue pairs with any heavy-atom pair within `cutoff`, counted once per frame."""
+    n = task.n_residues
+    query = np.arange(len(task.atoms)) if task.focus is None else np.flatnonzero(task.focus[task.residue])
+    codes: list[np.ndarray] = []
+    for f in range(len(chunk)):
+        xyz = np.asarray(chunk.xyz[f], dtype=np.float64)
+        index = CellList(xyz, cell_size=task.cutoff)
+        qi, pj, _d2 = index.query_pairs(xyz[query], task.cutoff)
+        ri = task.residue[query[qi]]
+        rj = task.residue[pj]
+        a = np.minimum(ri, rj)
+        b = np.maximum(ri, rj)
+        keep = a != b
+        if task.min_separation > 0:
+            near_in_seq = (task.res_chain[a] == task.res_chain[b]) & (
+                np.abs(task.res_seq[a] - task.res_seq[b]) < task.min_separation
+            )
+            keep &= ~near_in_seq
+        codes.append(np.unique(a[keep] * n + b[keep]))
+    all_codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+    return ContactCounts.from_codes(all_codes, n, len(chunk))
+
+
+def residue_keys(table: PdbAtomTable, atoms: np.ndarray) -> list[ResidueKey]:
+    return list(zip(table.chain[atoms].tolist(), table.resseq[atoms].tolist(), table.icode[atoms].tolist()))
+
+
+def heavy_protein_atoms(table: PdbAtomTable) -> np.ndarray:
+    # psfgen/NAMD PDBs write solvent and lipids as ATOM records too.
+    idx = table.select(exclude_resnames=WATER_RESNAMES | ION_RESNAMES | DEFAULT_LIPID_RESNAMES, heavy_only=True)
+    return idx[table.record[idx] == "ATOM"]
+
+
+def _parse_focus(text: str) -> list[ResidueKey]:
+    sites: list[ResidueKey] = []
+    for part in text.replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        chain, _, seq = part.partition(":")
+        digits = seq.rstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+        try:
+            sites.append((chain, int(digits), seq[len(digits) :]))
+        except ValueError:
+            raise ValueError(f"Bad focus residue {part!r} (expected chain:resseq, e.g. m:64)")
+    return sites
+
+
+def focus_mask(
+    table: PdbAtomTable,
+    atoms: np.ndarray,
+    residue: np.ndarray,
+    n_residues: int,
+    sites: list[ResidueKey],
+    radius: float,
+) -> np.ndarray:
+    """Residues with any heavy atom within `radius` of a focus residue (in `table` coordinates)."""
+    keys = residue_keys(table, atoms)
+    site_set = set(sites)
+    at_site = np.array([k in site_set for k in keys], dtype=bool)
+    missing = site_set - set(k for k, hit in zip(keys, at_site.tolist()) if hit)
+    if missing:
+        raise ValueError(f"Focus residue(s) not found: {sorted(missing)}")
+    index = CellList(table.xyz[atoms[at_site]], cell_size=radius)
+    near = index.any_within(table.xyz[atoms], radius)
+    mask = np.zeros(n_residues, dtype=bool)
+    mask[residue[near]] = True
+    return mask
+
+
+def system_counts(
+    table: PdbAtomTable,
+    dcd: Path | None,
+    task: ContactTask,
+    *,
+    start: int = 0,
+    stop: int | None = None,
+    stride: int = 1,
+    chunk_size: int = 100,
+    jobs: int = 0,
+) -> ContactCounts:
+    """Contact counts over a DCD (parallel chunks, merged at the end) or the single PDB frame."""
+    if dcd is None:
+        chunk = DcdChunk(frames=range(1), xyz=table.xyz[task.atoms][None], unit_cells=None)
+        return contact_chunk(chunk, task)
+    parts = list(
+        map_chunks(
+            dcd,
+            contact_chunk,
+            task,
+            chunk_size=chunk_size,
+            start=start,
+            stop=stop,
+            stride=stride,
+            atoms=task.atoms,
+            jobs=jobs,
+        )
+    )
+    return ContactCounts.merge(parts, task.n_residues)
+
+
+def contact_difference(a: ContactCounts, b: ContactCounts, n_residues: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Frequencies of `a` and `b` over the union of their pairs as (rows, cols, freq_a, freq_b),
+    ranked by |freq_b - freq_a| (ties in pair order)."""
+    codes_a = a.rows * n_residues + a.cols
+    codes_b = b.rows * n_residues + b.cols
+    codes = np.union1d(codes_a, codes_b)
+    fa = np.zeros(len(codes))
+    fb = np.zeros(len(codes))
+    fa[np.searchsorted(codes, codes_a)] = a.frequency()
+    fb[np.searchsorted(codes, codes_b)] = b.frequency()
+    order = np.lexsort((codes, -np.abs(fb - fa)))
+    codes = codes[order]
+    return codes // n_residues, codes % n_residues, fa[order], fb[order]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=(
+            "Residue-residue contact frequencies (heavy atoms within --cutoff) for WT and variant systems, and a\n"
+            "ranked difference map against the first system.\n\n"
+            "Each system is a PDB (single frame, e.g. builder models) or a PDB + NAMD DCD. Per frame, a cell list\n"
+            "over the protein heavy atoms finds contacts around the --focus residues; frames run in parallel\n"
+            "chunks that return sparse (row, col, count) matrices, merged at the end.\n"
+        )
+    )
+    ap.add_argument(
+        "--system",
+        nargs="+",
+        action="append",
+        required=True,
+        metavar="LABEL PDB [DCD]",
+        help="System label, PDB and optional DCD (same atoms/order); the first --system is the reference (WT).",
+    )
+    ap.add_argument("--out-dir", required=True, help="Output directory.")
+    ap.add_argument("--cutoff", type=float, default=4.5, help="Heavy-atom contact distance in A (default: 4.5).")
+    ap.add_argument(
+        "--focus",
+        default=DEFAULT_FOCUS,
+        help=f"Comma-separated chain:resseq sites; only contacts near them are counted (default: {DEFAULT_FOCUS}; 'all' = whole complex).",
+    )
+    ap.add_argument("--focus-radius", type=float, default=12.0, help="Residues within this distance of a site count (default: 12).")
+    ap.add_argument(
+        "--min-separation",
+        type=int,
+        default=3,
+        help="Skip same-chain pairs closer than this in sequence (default: 3, i.e. i/i+1/i+2).",
+    )
+    ap.add_argument("--top", type=int, default=25, help="Rows of the ranked difference printed per variant (default: 25).")
+    add_frame_range_args(ap, chunk_size=100)
+    args = ap.parse_args()
+
+    if args.cutoff <= 0.0 or args.focus_radius <= 0.0:
+        raise SystemExit("Cutoffs must be positive.")
+    systems: list[tuple[str, Path, Path | None]] = []
+    for spec in args.system:
+        if len(spec) not in (2, 3):
+            raise SystemExit(f"--system expects LABEL PDB [DCD] (got: {' '.join(spec)})")
+        systems.append((spec[0], Path(spec[1]), Path(spec[2]) if len(spec) == 3 else None))
+    for label, pdb, dcd in systems:
+        for path in (pdb, dcd):
+            if path is not None and not path.exists():
+                raise SystemExit(f"Missing file for {label}: {path}")
+
+    tables = [read_pdb_atom_table(pdb) for _label, pdb, _dcd in systems]
+    atoms = [heavy_protein_atoms(t) for t in tables]
+    # One residue key list shared by all systems (mutated residues keep their chain/resseq key).
+    keys: dict[ResidueKey, int] = {}
+    resnames: list[list[str]] = []
+    for t, idx in zip(tables, atoms):
+        for key in residue_keys(t, idx):
+            keys.setdefault(key, len(keys))
+    key_list = list(keys)
+    n_res = len(key_list)
+    res_chain = np.unique(np.array([k[0] for k in key_list]), return_inverse=True)[1].reshape(-1)
+    res_seq = np.array([k[1] for k in key_list], dtype=np.int64)
+    for t, idx in zip(tables, atoms):
+        names = [""] * n_res
+        for key, name in zip(residue_keys(t, idx), t.resname[idx].tolist()):
+            names[keys[key]] = name
+        resnames.append(names)
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    residues = [np.array([keys[k] for k in residue_keys(t, idx)], dtype=np.int64) for t, idx in zip(tables, atoms)]
+    # One focus region for all systems (union over their own coordinates), so a longer WT
+    # side chain at the site does not change which contacts are compared.
+    focus = None
+    if args.focus.strip().lower() != "all":
+        try:
+            sites = _parse_focus(args.focus)
+            focus = np.zeros(n_res, dtype=bool)
+            for t, idx, residue in zip(tables, atoms, residues):
+                focus |= focus_mask(t, idx, residue, n_res, sites, args.focus_radius)
+        except ValueError as exc:
+            raise SystemExit(str(exc))
+
+    results: list[ContactCounts] = []
+    for (label, pdb, dcd), t, idx, residue in zip(systems, tables, atoms, residues):
+        try:
+            if dcd is not None:
+                with DcdTrajectory(dcd) as traj:
+                    check_atom_count(traj, pdb, len(t))
+            task = ContactTask(
+                atoms=idx,
+                residue=residue,
+                res_chain=res_chain,
+                res_seq=res_seq,
+                n_residues=n_res,
+                cutoff=float(args.cutoff),
+                min_separation=int(args.min_separation),
+                focus=focus,
+            )
+            counts = system_counts(
+                t,
+                dcd,
+                task,
+                start=args.start,
+                stop=args.stop,
+                stride=args.stride,
+                chunk_size=args.chunk_size,
+                jobs=args.jobs,
+            )
+        except ValueError as exc:
+            raise SystemExit(f"{label}: {exc}")
+        if counts.n_frames == 0:
+            raise SystemExit(f"{label}: no frames selected")
+        np.savez_compressed(
+            out_dir / f"{label}_contacts.npz",
+            rows=counts.rows,
+            cols=counts.cols,
+            counts=counts.counts,
+            n_frames=counts.n_frames,
+            chains=np.array([k[0] for k in key_list]),
+            resseq=res_seq,
+            icode=np.array([k[2] for k in key_list]),
+        )
+        results.append(counts)
+        print(f"{label}: {dcd or pdb}  (frames: {counts.n_frames}; residue pairs: {len(counts.counts)})")
+
+    ref_label = systems[0][0]
+    focus_text = "all" if focus is None else f"{args.focus} (radius {args.focus_radius:g} A; {int(focus.sum())} residues)"
+    print(f"Cutoff: {args.cutoff:g} A  focus: {focus_text}  min separation: {args.min_separation}")
+    for s in range(1, len(systems)):
+        label = systems[s][0]
+        rows, cols, fa, fb = contact_difference(results[0], results[s], n_res)
+        path = out_dir / f"{label}_vs_{ref_label}_contacts.csv"
+        lines = [f"chain_a,resseq_a,icode_a,resname_a,chain_b,resseq_b,icode_b,resname_b,freq_{ref_label},freq_{label},diff"]
+        for i, j, a, b in zip(rows.tolist(), cols.tolist(), fa.tolist(), fb.tolist()):
+            ca, sa, ia = key_list[i]
+            cb, sb, ib = key_list[j]
+            name_a = resnames[s][i] or resnames[0][i]
+            name_b = resnames[s][j] or resnames[0][j]
+            lines.append(f"{ca},{sa},{ia},{name_a},{cb},{sb},{ib},{name_b},{a:.4f},{b:.4f},{b - a:+.4f}")
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        changed = int(np.count_nonzero(fb != fa))
+        print(f"{label} vs {ref_label}: {len(rows)} pairs, {changed} changed; largest changes:")
+        for line in lines[1 : 1 + min(args.top, changed)]:
+            f = line.split(",")
+            print(f"  {f[0]}:{f[1]}{f[2]} {f[3]:<4} - {f[4]}:{f[5]}{f[6]} {f[7]:<4}  {f[8]} -> {f[9]}  ({f[10]})")
+        print(f"Wrote: {path}")
+    for label, _pdb, _dcd in systems:
+        print(f"Wrote: {out_dir / f'{label}_contacts.npz'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
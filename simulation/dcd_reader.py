@@ -0,0 +1,418 @@
+from __future__ import annotations
+
+import argparse
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import numpy as np
+
+
+# CHARMM/NAMD DCD layout (Fortran unformatted records, each framed by a length marker):
+#   [84]  "CORD" + 20 int32 control words      [84]
+#   [len] ntitle int32 + ntitle * 80-char lines [len]
+#   [4]   natom int32                           [4]
+#   per frame: optional [48] 6 float64 unit cell [48], then [4n] x [4n] [4n] y [4n] [4n] z [4n]
+HEADER_RECORD_SIZE = 84
+TITLE_LINE_SIZE = 80
+UNIT_CELL_SIZE = 48
+
+# AKMA time unit in ps (NAMD writes DELTA in AKMA units).
+AKMA_PS = 0.04888821
+
+AtomSelection = slice | np.ndarray | list[int] | None
+
+
+@dataclass(frozen=True)
+class DcdHeader:
+    """Header fields of one DCD file (counts as written by NAMD, byte layout for the frames)."""
+
+    n_atoms: int
+    n_frames_header: int
+    istart: int
+    nsavc: int
+    delta: float
+    has_unit_cell: bool
+    has_4d: bool
+    n_fixed: int
+    charmm_version: int
+    titles: list[str]
+    byteorder: str
+    marker_size: int
+    frame_offset: int
+    frame_size: int
+
+    @property
+    def timestep_ps(self) -> float:
+        """Time between saved frames in ps (nsavc * DELTA converted from AKMA units)."""
+        return self.nsavc * self.delta * AKMA_PS
+
+
+def _detect_markers(raw: np.ndarray) -> tuple[str, int]:
+    """Byte order and record-marker width (4 or 8 bytes) from the first record marker."""
+    # 8-byte markers first: the low half of a little-endian 64-bit 84 also reads as 84.
+    for marker in (8, 4):
+        for order in ("<", ">"):
+            if len(raw) >= marker and int(raw[:marker].view(f"{order}i{marker}")[0]) == HEADER_RECORD_SIZE:
+                return order, marker
+    raise ValueError("Not a DCD file (first record marker is not 84)")
+
+
+def _read_record(raw: np.ndarray, offset: int, order: str, marker: int) -> tuple[np.ndarray, int]:
+    """Return (payload bytes, offset after the record) of the Fortran record at `offset`."""
+    mdt = f"{order}i{marker}"
+    if offset + marker > len(raw):
+        raise ValueError("Truncated DCD header")
+    size = int(raw[offset : offset + marker].view(mdt)[0])
+    end = offset + marker + size
+    if size < 0 or end + marker > len(raw) or int(raw[end : end + marker].view(mdt)[0]) != size:
+        raise ValueError(f"Corrupt DCD record at byte {offset}")
+    return raw[offset + marker : end], end + marker
+
+
+def parse_dcd_header(raw: np.ndarray) -> DcdHeader:
+    """Parse the header records of a DCD given as a uint8 array (e.g. a memmap)."""
+    order, marker = _detect_markers(raw)
+    i4 = f"{order}i4"
+
+    payload, offset = _read_record(raw, 0, order, marker)
+    if payload[:4].tobytes() != b"CORD":
+        raise ValueError("Not a coordinate DCD (missing CORD tag)")
+    icntrl = payload[4:84].view(i4)
+    charmm_version = int(icntrl[19])
+    if charmm_version:
+        delta = float(payload[40:44].view(f"{order}f4")[0])
+        has_unit_cell = bool(icntrl[10])
+        has_4d = bool(icntrl[11])
+    else:
+        # X-PLOR style header: DELTA is a float64 spanning two control words, no extra blocks.
+        delta = float(payload[40:48].view(f"{order}f8")[0])
+        has_unit_cell = False
+        has_4d = False
+
+    payload, offset = _read_record(raw, offset, order, marker)
+    n_titles = int(payload[:4].view(i4)[0]) if len(payload) >= 4 else 0
+    text = payload[4 : 4 + n_titles * TITLE_LINE_SIZE].tobytes()
+    titles = [
+        text[k : k + TITLE_LINE_SIZE].decode("ascii", errors="replace").rstrip("\x00 ")
+        for k in range(0, len(text), TITLE_LINE_SIZE)
+    ]
+
+    payload, offset = _read_record(raw, offset, order, marker)
+    n_atoms = int(payload[:4].view(i4)[0])
+    n_fixed = int(icntrl[8])
+    if n_fixed:
+        # Free-atom index record; fixed-atom frames after the first are shorter.
+        _, offset = _read_record(raw, offset, order, marker)
+
+    coord_record = 4 * n_atoms + 2 * marker
+    frame_size = 3 * coord_record + (coord_record if has_4d else 0)
+    if has_unit_cell:
+        frame_size += UNIT_CELL_SIZE + 2 * marker
+    return DcdHeader(
+        n_atoms=n_atoms,
+        n_frames_header=int(icntrl[0]),
+        istart=int(icntrl[1]),
+        nsavc=int(icntrl[2]),
+        delta=delta,
+        has_unit_cell=has_unit_cell,
+        has_4d=has_4d,
+        n_fixed=n_fixed,
+        charmm_version=charmm_version,
+        titles=titles,
+        byteorder=order,
+        marker_size=marker,
+        frame_offset=offset,
+        frame_size=frame_size,
+    )
+
+
+def _unit_cell_lengths_angles(cells: np.ndarray) -> np.ndarray:
+    """Convert DCD unit-cell records (A, gamma, B, beta, alpha, C) to (a, b, c, alpha, beta, gamma).
+
+    NAMD >= 2.5 stores the angle cosines rather than degrees; values all within [-1, 1]
+    are taken as cosines (a 1-degree cell angle is not a realistic box).
+    """
+    out = cells[:, [0, 2, 5, 4, 3, 1]].astype(np.float64)
+    angles = out[:, 3:]
+    if len(angles) and np.all(np.abs(angles) <= 1.0):
+        out[:, 3:] = np.degrees(np.arccos(np.clip(angles, -1.0, 1.0)))
+    return out
+
+
+def chunk_ranges(n_frames: int, chunk_size: int, *, start: int = 0, stop: int | None = None, stride: int = 1) -> list[range]:
+    """Split frames start:stop:stride into consecutive ranges of at most `chunk_size` frames.
+
+    The ranges are plain `range` objects (picklable), so they can be handed to worker
+    processes that each open the trajectory themselves.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    frames = range(n_frames)[start:stop:stride]
+    return [frames[k : k + chunk_size] for k in range(0, len(frames), chunk_size)]
+
+
+@dataclass
+class DcdChunk:
+    """One block of frames from `DcdTrajectory.iter_chunks`.
+
+    `xyz` is (n_frames, n_atoms, 3) float32; unless atoms were picked by an index array it
+    is a read-only view of the file mapping. `unit_cells` is (n_frames, 6) as
+    (a, b, c, alpha, beta, gamma) or None when the file has no unit-cell records.
+    """
+
+    frames: range
+    xyz: np.ndarray
+    unit_cells: np.ndarray | None
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+
+class DcdTrajectory:
+    """Memory-mapped NAMD/CHARMM DCD trajectory.
+
+    The file is mapped read-only once; frames are exposed as strided float32 views of the
+    x/y/z records (no copy, no per-frame parsing), so a 10^5-frame trajectory costs only
+    the pages that are actually touched. The frame count is taken from the file size,
+    which also covers NAMD runs that were stopped before the header count was updated; a
+    trailing partial frame is ignored.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._raw = np.memmap(self.path, dtype=np.uint8, mode="r")
+        self.header = parse_dcd_header(self._raw)
+        h = self.header
+        if h.n_fixed:
+            raise ValueError(f"{self.path}: DCD files with fixed atoms ({h.n_fixed}) are not supported")
+        self.n_atoms = h.n_atoms
+        self.n_frames = max(0, (len(self._raw) - h.frame_offset) // h.frame_size) if h.n_atoms else 0
+        self._xyz = self._coordinate_view()
+        self._cells = self._unit_cell_view()
+
+    def _coordinate_view(self) -> np.ndarray:
+        # (frames, atoms, 3): x/y/z of one atom are one coordinate record apart.
+        h = self.header
+        m = h.marker_size
+        first_x = h.frame_offset + (UNIT_CELL_SIZE + 2 * m if h.has_unit_cell else 0) + m
+        return np.ndarray(
+            shape=(self.n_frames, h.n_atoms, 3),
+            dtype=f"{h.byteorder}f4",
+            buffer=self._raw,
+            offset=first_x,
+            strides=(h.frame_size, 4, 4 * h.n_atoms + 2 * m),
+        )
+
+    def _unit_cell_view(self) -> np.ndarray | None:
+        h = self.header
+        if not h.has_unit_cell:
+            return None
+        return np.ndarray(
+            shape=(self.n_frames, 6),
+            dtype=f"{h.byteorder}f8",
+            buffer=self._raw,
+            offset=h.frame_offset + h.marker_size,
+            strides=(h.frame_size, 8),
+        )
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def __enter__(self) -> "DcdTrajectory":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Drop the mapping (views returned earlier keep it alive until they are released)."""
+        self._xyz = None
+        self._cells = None
+        self._raw = None
+
+    @property
+    def has_unit_cell(self) -> bool:
+        return self.header.has_unit_cell
+
+    def frame(self, index: int, atoms: AtomSelection = None) -> np.ndarray:
+        """Coordinates of frame `index` as (n_atoms, 3) float32 (a view unless `atoms` is an index array)."""
+        if not -self.n_frames <= index < self.n_frames:
+            raise IndexError(f"frame {index} out of range for {self.n_frames} frames")
+        return _select_atoms(self._xyz[index], atoms, axis=0)
+
+    def frames(
+        self,
+        start: int | None = None,
+        stop: int | None = None,
+        stride: int = 1,
+        atoms: AtomSelection = None,
+    ) -> np.ndarray:
+        """(n_frames, n_atoms, 3) float32 for frames start:stop:stride.
+
+        Slices keep this a view of the mapping; an index-array atom selection gathers
+        only the selected atoms (one float32 copy of the result, not of the frames).
+        """
+        return _select_atoms(self._xyz[start:stop:stride], atoms, axis=1)
+
+    def unit_cells(self, start: int | None = None, stop: int | None = None, stride: int = 1) -> np.ndarray | None:
+        """(n_frames, 6) unit cells as (a, b, c, alpha, beta, gamma) in A/degrees, or None."""
+        if self._cells is None:
+            return None
+        return _unit_cell_lengths_angles(self._cells[start:stop:stride])
+
+    def times_ps(self, frames: range | None = None) -> np.ndarray:
+        """Simulation time of each frame in ps (ISTART + k * NSAVC steps)."""
+        h = self.header
+        idx = np.arange(self.n_frames) if frames is None else np.asarray(frames)
+        return (h.istart + idx * h.nsavc) * h.delta * AKMA_PS
+
+    def read_chunk(self, frames: range, atoms: AtomSelection = None) -> DcdChunk:
+        """Frames of `frames` (a range from `chunk_ranges`) with their unit cells."""
+        sl = slice(frames.start, frames.stop, frames.step)
+        cells = None if self._cells is None else _unit_cell_lengths_angles(self._cells[sl])
+        return DcdChunk(frames=frames, xyz=_select_atoms(self._xyz[sl], atoms, axis=1), unit_cells=cells)
+
+    def iter_chunks(
+        self,
+        chunk_size: int,
+        *,
+        start: int = 0,
+        stop: int | None = None,
+        stride: int = 1,
+        atoms: AtomSelection = None,
+    ) -> Iterator[DcdChunk]:
+        """Yield consecutive `DcdChunk`s of at most `chunk_size` frames.
+
+        Peak memory is one chunk of the selected atoms, independent of trajectory length.
+        """
+        for frames in chunk_ranges(self.n_frames, chunk_size, start=start, stop=stop, stride=stride):
+            yield self.read_chunk(frames, atoms)
+
+
+def _select_atoms(xyz: np.ndarray, atoms: AtomSelection, *, axis: int) -> np.ndarray:
+    if atoms is None:
+        return xyz
+    if isinstance(atoms, slice):
+        return xyz[(slice(None),) * axis + (atoms,)]
+    return np.take(xyz, np.asarray(atoms, dtype=np.int64), axis=axis)
+
+
+# Trajectory and per-chunk task shared by chunk workers (set once per worker process by the pool initializer).
+_WORKER_TRAJ: DcdTrajectory | None = None
+_WORKER_TASK: tuple[Callable[[DcdChunk, Any], Any], Any, AtomSelection] | None = None
+
+
+def _init_chunk_worker(path: Path, fn: Callable[[DcdChunk, Any], Any], context: Any, atoms: AtomSelection) -> None:
+    global _WORKER_TRAJ, _WORKER_TASK
+    _WORKER_TRAJ = DcdTrajectory(path)
+    _WORKER_TASK = (fn, context, atoms)
+
+
+def _run_chunk(frames: range) -> Any:
+    fn, context, atoms = _WORKER_TASK
+    return fn(_WORKER_TRAJ.read_chunk(frames, atoms), context)
+
+
+def map_chunks(
+    path: Path,
+    fn: Callable[[DcdChunk, Any], Any],
+    context: Any = None,
+    *,
+    chunk_size: int = 1000,
+    start: int = 0,
+    stop: int | None = None,
+    stride: int = 1,
+    atoms: AtomSelection = None,
+    jobs: int = 0,
+) -> Iterator[Any]:
+    """Yield `fn(chunk, context)` for every chunk of frames start:stop:stride, in frame order.
+
+    Chunks are evaluated in worker processes (`jobs` <= 0: min(#chunks, CPU count)); each
+    worker maps the DCD once and receives only frame ranges, so nothing but `context` and
+    the per-chunk results is pickled. `fn` must be a module-level function and should
+    reduce the chunk (the coordinates are views of the worker's mapping). At most
+    2 * jobs chunks are in flight, so a slow chunk holds back at most that many finished
+    results. `jobs=1` runs in this process without a pool.
+    """
+    with DcdTrajectory(path) as traj:
+        ranges = chunk_ranges(len(traj), chunk_size, start=start, stop=stop, stride=stride)
+        if jobs == 1 or len(ranges) <= 1:
+            for frames in ranges:
+                yield fn(traj.read_chunk(frames, atoms), context)
+            return
+    jobs = jobs if jobs > 0 else min(len(ranges), os.cpu_count() or 1)
+    pending: deque[Future] = deque()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_chunk_worker, initargs=(Path(path), fn, context, atoms)) as pool:
+        try:
+            for frames in ranges:
+                if len(pending) >= 2 * jobs:
+                    yield pending.popleft().result()
+                pending.append(pool.submit(_run_chunk, frames))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def add_frame_range_args(parser: argparse.ArgumentParser, *, chunk_size: int | None = 1000, tasks: str = "chunks") -> None:
+    """Add the --start/--stop/--stride, --chunk-size and --jobs options shared by the trajectory tools.
+
+    `chunk_size` is the --chunk-size default (None: no --chunk-size option); `tasks` names
+    the parallel work units in the --jobs help.
+    """
+    parser.add_argument("--start", type=int, default=0, help="First frame (default: 0).")
+    parser.add_argument("--stop", type=int, default=None, help="Stop before this frame (default: end).")
+    parser.add_argument("--stride", type=int, default=1, help="Frame stride (default: 1).")
+    if chunk_size is not None:
+        parser.add_argument(
+            "--chunk-size", type=int, default=chunk_size, help=f"Frames per worker task (default: {chunk_size})."
+        )
+    parser.add_argument("--jobs", type=int, default=0, help=f"Worker processes (default: min(#{tasks}, CPU count)).")
+
+
+def check_atom_count(traj: DcdTrajectory, pdb: Path | str, n_atoms: int) -> None:
+    """Exit with a message unless `traj` has the `n_atoms` atoms of `pdb` (CLI check before any analysis)."""
+    if traj.n_atoms != n_atoms:
+        raise SystemExit(f"Atom count mismatch: {pdb} has {n_atoms} atoms, {traj.path} has {traj.n_atoms}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=(
+            "Print the header of a NAMD/CHARMM DCD trajectory (atoms, frames, timestep, unit cell).\n\n"
+            "The reader itself (`DcdTrajectory`) is meant to be imported by the trajectory analyses.\n"
+        )
+    )
+    ap.add_argument("dcd", help="DCD trajectory file.")
+    ap.add_argument("--frame", type=int, default=None, help="Also print the unit cell and bbox of this frame.")
+    args = ap.parse_args()
+
+    with DcdTrajectory(Path(args.dcd)) as traj:
+        h = traj.header
+        print(f"DCD:        {traj.path}")
+        print(f"Atoms:      {h.n_atoms}")
+        print(f"Frames:     {traj.n_frames}  (header: {h.n_frames_header})")
+        print(f"ISTART/NSAVC: {h.istart}/{h.nsavc}  (DELTA={h.delta:.6g} AKMA; {h.timestep_ps:.4g} ps/frame)")
+        print(f"Unit cell:  {'yes' if h.has_unit_cell else 'no'}")
+        print(f"Layout:     {'little' if h.byteorder == '<' else 'big'}-endian, {8 * h.marker_size}-bit markers")
+        for title in h.titles:
+            print(f"Title:      {title}")
+        if args.frame is not None:
+            xyz = traj.frame(args.frame)
+            lo = xyz.min(axis=0)
+            hi = xyz.max(axis=0)
+            print(f"Frame {args.frame}: bbox min=({lo[0]:.3f}, {lo[1]:.3f}, {lo[2]:.3f}) max=({hi[0]:.3f}, {hi[1]:.3f}, {hi[2]:.3f})")
+            cells = traj.unit_cells(args.frame, args.frame + 1)
+            if cells is not None and len(cells):
+                a, b, c, alpha, beta, gamma = cells[0].tolist()
+                print(f"Frame {args.frame}: cell a={a:.3f} b={b:.3f} c={c:.3f} alpha={alpha:.2f} beta={beta:.2f} gamma={gamma:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
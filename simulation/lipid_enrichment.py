@@ -0,0 +1,357 @@
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from cell_list import CellList
+from dcd_reader import DcdChunk, DcdTrajectory, add_frame_range_args, check_atom_count, map_chunks
+from pdb_atom_table import PdbAtomTable, parse_resname_list, read_pdb_atom_table
+from place_membrane_patch import DEFAULT_LIPID_RESNAMES
+
+
+@dataclass(frozen=True)
+class LipidSelection:
+    """Atoms of one system taking part in the RDF/enrichment counts (fixed for the run).
+
+    `atoms` is the DCD atom selection read per chunk: the ND heavy atoms first (their
+    subunit index in `subunit`), then the lipid heavy atoms (their lipid residue in
+    `lipid`; `lipid_type` maps each lipid residue to an index into `types`).
+    """
+
+    atoms: np.ndarray
+    n_ref: int
+    subunit: np.ndarray
+    chains: tuple[str, ...]
+    lipid: np.ndarray
+    lipid_type: np.ndarray
+    types: tuple[str, ...]
+    r_max: float
+    bin_width: float
+    shell: float
+
+    @property
+    def n_bins(self) -> int:
+        return int(np.ceil(self.r_max / self.bin_width - 1e-9))
+
+
+def select_lipid_atoms(
+    system: PdbAtomTable,
+    *,
+    chains: list[str],
+    lipid_resnames: set[str],
+    r_max: float,
+    bin_width: float,
+    shell: float,
+) -> LipidSelection:
+    """Pick the ND-chain heavy atoms (ATOM records, chain IDs case-sensitive) and lipid heavy atoms."""
+    if bin_width <= 0.0 or r_max <= 0.0 or shell <= 0.0:
+        raise ValueError("--r-max, --bin-width and --shell must be positive")
+    ref_parts: list[np.ndarray] = []
+    subunit_parts: list[np.ndarray] = []
+    for k, chain in enumerate(chains):
+        idx = np.flatnonzero((system.record == "ATOM") & (system.chain == chain) & system.heavy_mask())
+        if len(idx) == 0:
+            raise ValueError(f"No ATOM heavy atoms in chain {chain}")
+        ref_parts.append(idx)
+        subunit_parts.append(np.full(len(idx), k, dtype=np.int64))
+    ref = np.concatenate(ref_parts)
+    lipid_atoms = system.select(resnames=lipid_resnames, heavy_only=True)
+    if len(lipid_atoms) == 0:
+        raise ValueError(f"No lipid atoms found (resnames={sorted(lipid_resnames)})")
+    _uniq, first, residue = np.unique(system.residue_ids()[lipid_atoms], return_index=True, return_inverse=True)
+    residue = residue.reshape(-1).astype(np.int64)
+    types, lipid_type = np.unique(system.resname[lipid_atoms[first]], return_inverse=True)
+    return LipidSelection(
+        atoms=np.concatenate([ref, lipid_atoms]),
+        n_ref=len(ref),
+        subunit=np.concatenate(subunit_parts),
+        chains=tuple(chains),
+        lipid=residue,
+        lipid_type=lipid_type.reshape(-1).astype(np.int64),
+        types=tuple(types.tolist()),
+        r_max=float(r_max),
+        bin_width=float(bin_width),
+        shell=float(shell),
+    )
+
+
+def cell_volumes(unit_cells: np.ndarray) -> np.ndarray:
+    """Volumes (A^3) of (frames, 6) unit cells given as (a, b, c, alpha, beta, gamma)."""
+    a, b, c = unit_cells[:, 0], unit_cells[:, 1], unit_cells[:, 2]
+    ca, cb, cg = (np.cos(np.radians(unit_cells[:, k])) for k in (3, 4, 5))
+    return a * b * c * np.sqrt(np.maximum(1.0 - ca**2 - cb**2 - cg**2 + 2.0 * ca * cb * cg, 0.0))
+
+
+def lipid_chunk(chunk: DcdChunk, sel: LipidSelection) -> dict[str, np.ndarray]:
+    """Pair-distance histograms and per-frame shell counts of one chunk.
+
+    Per frame, a cell list over the lipid heavy atoms answers the ND-atom queries up to
+    max(r_max, shell). `hist` is (subunits, lipid types, bins) summed over the chunk;
+    `shell` is (frames, subunits + 1, lipid types): lipids with any heavy atom within
+    `shell` of the subunit (last row: of any ND chain).
+    """
+    xyz = chunk.xyz
+    ref_xyz = np.asarray(xyz[:, : sel.n_ref], dtype=np.float64)
+    lipid_xyz = xyz[:, sel.n_ref :]
+    n_sub = len(sel.chains)
+    n_types = len(sel.types)
+    n_lipids = len(sel.lipid_type)
+    n_bins = sel.n_bins
+    cutoff = max(sel.r_max, sel.shell)
+    hist = np.zeros(n_sub * n_types * n_bins, dtype=np.int64)
+    shell = np.zeros((len(chunk), n_sub + 1, n_types), dtype=np.int64)
+    for f in range(len(chunk)):
+        index = CellList(lipid_xyz[f], cell_size=cutoff)
+        qi, pj, d2 = index.query_pairs(ref_xyz[f], cutoff)
+        if len(qi) == 0:
+            continue
+        sub = sel.subunit[qi]
+        lip = sel.lipid[pj]
+        typ = sel.lipid_type[lip]
+        b = np.floor(np.sqrt(d2) / sel.bin_width).astype(np.int64)
+        ok = b < n_bins
+        hist += np.bincount(((sub * n_types + typ) * n_bins + b)[ok], minlength=len(hist))
+        near = d2 <= sel.shell * sel.shell
+        pairs = np.unique(sub[near] * n_lipids + lip[near])
+        shell[f, :n_sub] = np.bincount(
+            (pairs // n_lipids) * n_types + sel.lipid_type[pairs % n_lipids],
+            minlength=n_sub * n_types,
+        ).reshape(n_sub, n_types)
+        shell[f, n_sub] = np.bincount(sel.lipid_type[np.unique(pairs % n_lipids)], minlength=n_types)
+    volumes = cell_volumes(chunk.unit_cells) if chunk.unit_cells is not None else np.zeros(0)
+    return {
+        "frame": np.asarray(chunk.frames, dtype=np.int64),
+        "hist": hist.reshape(n_sub, n_types, n_bins),
+        "shell": shell,
+        "inv_volume_sum": np.array([np.sum(1.0 / volumes[volumes > 0.0])]),
+        "n_volume": np.array([int(np.count_nonzero(volumes > 0.0))]),
+    }
+
+
+@dataclass
+class LipidResult:
+    frames: np.ndarray
+    time_ps: np.ndarray
+    hist: np.ndarray  # (subunits, types, bins) summed over frames
+    shell: np.ndarray  # (frames, subunits + 1, types)
+    mean_inv_volume: float  # <1/V> over frames (0 when the DCD has no unit cells)
+
+
+def analyze_lipids(
+    dcd: Path,
+    sel: LipidSelection,
+    *,
+    start: int = 0,
+    stop: int | None = None,
+    stride: int = 1,
+    chunk_size: int = 200,
+    jobs: int = 0,
+) -> LipidResult:
+    """Stream a DCD through `lipid_chunk`; histograms are summed as the chunks arrive."""
+    hist = np.zeros((len(sel.chains), len(sel.types), sel.n_bins), dtype=np.int64)
+    frames: list[np.ndarray] = []
+    shell: list[np.ndarray] = []
+    inv_volume = 0.0
+    n_volume = 0
+    for part in map_chunks(
+        dcd,
+        lipid_chunk,
+        sel,
+        chunk_size=chunk_size,
+        start=start,
+        stop=stop,
+        stride=stride,
+        atoms=sel.atoms,
+        jobs=jobs,
+    ):
+        hist += part["hist"]
+        frames.append(part["frame"])
+        shell.append(part["shell"])
+        inv_volume += float(part["inv_volume_sum"][0])
+        n_volume += int(part["n_volume"][0])
+    if not frames:
+        raise ValueError(f"No frames selected from {dcd}")
+    frame_idx = np.concatenate(frames)
+    with DcdTrajectory(dcd) as traj:
+        time_ps = traj.times_ps(frame_idx)
+    return LipidResult(
+        frames=frame_idx,
+        time_ps=time_ps,
+        hist=hist,
+        shell=np.concatenate(shell),
+        mean_inv_volume=inv_volume / n_volume if n_volume else 0.0,
+    )
+
+
+def radial_distribution(
+    hist: np.ndarray,
+    n_ref: np.ndarray,
+    n_target: np.ndarray,
+    n_frames: int,
+    mean_inv_volume: float,
+    bin_width: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """(bin centers, g(r)) from summed pair histograms (..., bins).
+
+    g(r) = H(r) / (frames * N_ref * <N_target / V> * shell volume), i.e. normalized by the
+    box-average density of the target atoms; `n_ref` and `n_target` broadcast against
+    the leading axes of `hist`.
+    """
+    edges = np.arange(hist.shape[-1] + 1) * bin_width
+    shell_volumes = 4.0 / 3.0 * np.pi * np.diff(edges**3)
+    norm = n_frames * np.asarray(n_ref, dtype=np.float64)[..., None] * (np.asarray(n_target, dtype=np.float64)[..., None] * mean_inv_volume) * shell_volumes
+    with np.errstate(divide="ignore", invalid="ignore"):
+        g = np.where(norm > 0.0, hist / norm, 0.0)
+    return 0.5 * (edges[1:] + edges[:-1]), g
+
+
+def enrichment_index(shell: np.ndarray, type_totals: np.ndarray) -> np.ndarray:
+    """Depletion-enrichment index per (..., type) from summed shell counts.
+
+    DE = (n_type_shell / n_all_shell) / (N_type / N_all): the lipid-type fraction next
+    to the subunit over its fraction in the whole membrane (1: no preference, > 1:
+    enriched, < 1: depleted). NaN where no lipid was ever inside the shell.
+    """
+    shell = np.asarray(shell, dtype=np.float64)
+    totals = np.asarray(type_totals, dtype=np.float64)
+    local = shell.sum(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(local > 0.0, shell / local, np.nan) / (totals / totals.sum())
+
+
+def write_rdf(path: Path, r: np.ndarray, g: np.ndarray, labels: list[str], types: tuple[str, ...]) -> None:
+    """CSV with r and one g(r) column per (label, lipid type); `g` is (labels, types, bins)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    columns = [f"g_{label}_{t}" for label in labels for t in types]
+    table = np.column_stack([r, g.reshape(-1, len(r)).T])
+    np.savetxt(path, table, fmt=["%.3f"] + ["%.5f"] * len(columns), delimiter=",", header=",".join(["r"] + columns), comments="")
+
+
+def write_shell_series(path: Path, result: LipidResult, labels: list[str], types: tuple[str, ...]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    columns = [f"n_{label}_{t}" for label in labels for t in types]
+    table = np.column_stack([result.frames, result.time_ps, result.shell.reshape(len(result.frames), -1)])
+    np.savetxt(path, table, fmt=["%d", "%.3f"] + ["%d"] * len(columns), delimiter=",", header=",".join(["frame", "time_ps"] + columns), comments="")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=(
+            "Lipid recruitment around the ND subunits over a NAMD DCD trajectory: ND-lipid radial distribution\n"
+            "functions g(r) per subunit and lipid type, and depletion-enrichment (DE) indices of each lipid type\n"
+            "(e.g. CDL, PEE, PLX, DGT vs bulk POPC) within --shell of each subunit.\n\n"
+            "Per frame, a cell list over the lipid heavy atoms gives all ND-lipid atom pairs up to --r-max;\n"
+            "chunks of frames are binned in parallel (integer histograms and per-frame shell counts) and the\n"
+            "histograms are normalized once at the end. Distances are not minimum-imaged, so the protein\n"
+            "should be centered in the box (wrapped trajectories).\n"
+        )
+    )
+    ap.add_argument("--pdb", required=True, help="System PDB with the same atoms/order as the DCD.")
+    ap.add_argument("--dcd", required=True, help="NAMD DCD trajectory (unit cells are needed for g(r)).")
+    ap.add_argument("--out-prefix", required=True, help="Writes <prefix>_rdf.csv, <prefix>_enrichment.csv and <prefix>_shell_counts.csv.")
+    ap.add_argument(
+        "--nd-chains",
+        default="s,i,j,r,l,m",
+        help="Comma-separated chain IDs for ND1..ND6, case-sensitive (default: s,i,j,r,l,m).",
+    )
+    ap.add_argument(
+        "--lipid-resnames",
+        action="append",
+        default=[],
+        help=f"Comma-separated lipid residue names (default: {','.join(sorted(DEFAULT_LIPID_RESNAMES))}).",
+    )
+    ap.add_argument("--r-max", type=float, default=15.0, help="Largest g(r) distance in A (default: 15).")
+    ap.add_argument("--bin-width", type=float, default=0.2, help="g(r) bin width in A (default: 0.2).")
+    ap.add_argument("--shell", type=float, default=7.0, help="Lipids with a heavy atom within this many A of a subunit count as bound (default: 7).")
+    ap.add_argument("--volume", type=float, default=None, help="Box volume in A^3 for g(r) when the DCD has no unit cells.")
+    add_frame_range_args(ap, chunk_size=200)
+    args = ap.parse_args()
+
+    dcd = Path(args.dcd)
+    if not dcd.exists():
+        raise SystemExit(f"Missing --dcd: {dcd}")
+    chains = list(dict.fromkeys(c.strip() for c in args.nd_chains.replace(",", " ").split() if c.strip()))
+    if not chains:
+        raise SystemExit("--nd-chains is empty")
+    lipid_resnames = parse_resname_list(args.lipid_resnames) if args.lipid_resnames else DEFAULT_LIPID_RESNAMES
+    system = read_pdb_atom_table(Path(args.pdb))
+    try:
+        sel = select_lipid_atoms(
+            system,
+            chains=chains,
+            lipid_resnames=lipid_resnames,
+            r_max=args.r_max,
+            bin_width=args.bin_width,
+            shell=args.shell,
+        )
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    with DcdTrajectory(dcd) as traj:
+        check_atom_count(traj, args.pdb, len(system))
+        if not traj.has_unit_cell and args.volume is None:
+            raise SystemExit(f"{dcd} has no usable unit cells; pass --volume for the g(r) normalization")
+
+    try:
+        result = analyze_lipids(
+            dcd,
+            sel,
+            start=args.start,
+            stop=args.stop,
+            stride=args.stride,
+            chunk_size=args.chunk_size,
+            jobs=args.jobs,
+        )
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    if result.mean_inv_volume == 0 and args.volume is None:
+        # The cell flag can be set with only zero-volume cells in the selected frames.
+        raise SystemExit(f"{dcd} has no usable unit cells; pass --volume for the g(r) normalization")
+    n_frames = len(result.frames)
+    mean_inv_volume = result.mean_inv_volume or 1.0 / args.volume
+
+    labels = list(chains) + ["nd"]
+    n_types = len(sel.types)
+    n_ref = np.bincount(sel.subunit, minlength=len(chains))
+    n_ref = np.append(n_ref, n_ref.sum())
+    type_atoms = np.bincount(sel.lipid_type[sel.lipid], minlength=n_types)
+    type_lipids = np.bincount(sel.lipid_type, minlength=n_types)
+    hist = np.concatenate([result.hist, result.hist.sum(axis=0, keepdims=True)])
+    r, g = radial_distribution(hist, n_ref[:, None], type_atoms[None, :], n_frames, mean_inv_volume, sel.bin_width)
+
+    shell_sum = result.shell.sum(axis=0)
+    de = enrichment_index(shell_sum, type_lipids)
+    prefix = Path(args.out_prefix)
+    rdf_path = prefix.with_name(f"{prefix.name}_rdf.csv")
+    de_path = prefix.with_name(f"{prefix.name}_enrichment.csv")
+    series_path = prefix.with_name(f"{prefix.name}_shell_counts.csv")
+    write_rdf(rdf_path, r, g, labels, sel.types)
+    write_shell_series(series_path, result, labels, sel.types)
+    lines = ["subunit,lipid,n_lipids_total,mean_in_shell,fraction_in_shell,fraction_total,de_index"]
+    for s, label in enumerate(labels):
+        local = shell_sum[s].sum()
+        for t, name in enumerate(sel.types):
+            frac = shell_sum[s, t] / local if local else float("nan")
+            lines.append(
+                f"{label},{name},{type_lipids[t]},{shell_sum[s, t] / n_frames:.3f},{frac:.4f},"
+                f"{type_lipids[t] / type_lipids.sum():.4f},{de[s, t]:.3f}"
+            )
+    de_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    print(f"DCD:        {dcd}  (frames: {n_frames})")
+    print(f"ND chains:  {','.join(chains)}  (heavy atoms: {sel.n_ref})")
+    print("Lipids:     " + "  ".join(f"{name}={n}" for name, n in zip(sel.types, type_lipids.tolist())))
+    print(f"g(r):       0-{args.r_max:g} A in {sel.bin_width:g} A bins  (<V> = {1.0 / mean_inv_volume:.0f} A^3)")
+    print(f"DE index within {args.shell:g} A of any ND chain:")
+    for t, name in enumerate(sel.types):
+        print(f"  {name:<5} mean bound {shell_sum[-1, t] / n_frames:7.2f}  DE {de[-1, t]:.3f}")
+    print(f"Wrote: {rdf_path}")
+    print(f"Wrote: {de_path}")
+    print(f"Wrote: {series_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
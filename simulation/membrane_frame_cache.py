@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from pdb_atom_table import PdbAtomTable, read_pdb_atom_table
+
+
+CACHE_FILE_NAME = "membrane_frame_cache.json"
+CACHE_VERSION = 1
+
+# Cache outcomes returned by `cached_reference_frame` (a failed write is reported as
+# "write failed: <reason>").
+CACHE_HIT = "hit"
+CACHE_STORED = "stored"
+CACHE_DISABLED = "disabled"
+
+Vec3 = tuple[float, float, float]
+# Same layout as `pca_basis`: (mean, u, v, n, eigenvalues ascending).
+Frame = tuple[Vec3, Vec3, Vec3, Vec3, list[float]]
+
+
+@dataclass(frozen=True)
+class MembraneFrame:
+    """Fitted membrane frame: plane point (PCA mean), in-plane axes u/v and normal n."""
+
+    mean: Vec3
+    u: Vec3
+    v: Vec3
+    n: Vec3
+    eigenvalues: list[float]
+
+    @classmethod
+    def from_basis(cls, basis: Frame) -> "MembraneFrame":
+        mean, u, v, n, eigs = basis
+        return cls(mean=tuple(mean), u=tuple(u), v=tuple(v), n=tuple(n), eigenvalues=list(eigs))
+
+    def as_basis(self) -> Frame:
+        return self.mean, self.u, self.v, self.n, list(self.eigenvalues)
+
+
+def _dot(a: Vec3, b: Vec3) -> float:
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _cross(a: Vec3, b: Vec3) -> Vec3:
+    return (
+        a[1] * b[2] - a[2] * b[1],
+        a[2] * b[0] - a[0] * b[2],
+        a[0] * b[1] - a[1] * b[0],
+    )
+
+
+def _normalize(a: Vec3) -> Vec3:
+    n = math.sqrt(_dot(a, a))
+    if n == 0.0:
+        raise ValueError("Cannot normalize zero-length vector")
+    return (a[0] / n, a[1] / n, a[2] / n)
+
+
+def _jacobi_eigen_3x3(
+    a: list[list[float]],
+    *,
+    max_iter: int = 50,
+    eps: float = 1e-12,
+) -> tuple[list[float], list[list[float]]]:
+    """Eigen-decomposition of a real symmetric 3x3 matrix using Jacobi rotations.
+
+    Returns (eigenvalues, eigenvectors_matrix), where eigenvectors are columns of V.
+    """
+    v = [
+        [1.0, 0.0, 0.0],
+        [0.0, 1.0, 0.0],
+        [0.0, 0.0, 1.0],
+    ]
+
+    def max_offdiag(m: list[list[float]]):
+        pairs = [(0, 1), (0, 2), (1, 2)]
+        p, q = max(pairs, key=lambda ij: abs(m[ij[0]][ij[1]]))
+        return p, q, abs(m[p][q])
+
+    for _ in range(max_iter):
+        p, q, off = max_offdiag(a)
+        if off < eps:
+            break
+
+        app = a[p][p]
+        aqq = a[q][q]
+        apq = a[p][q]
+        if apq == 0.0:
+            continue
+
+        phi = 0.5 * math.atan2(2.0 * apq, (aqq - app))
+        c = math.cos(phi)
+        s = math.sin(phi)
+
+        # Rotate rows/cols p and q to zero out apq.
+        for i in range(3):
+            if i == p or i == q:
+                continue
+            aip = a[i][p]
+            aiq = a[i][q]
+            a[i][p] = a[p][i] = c * aip - s * aiq
+            a[i][q] = a[q][i] = s * aip + c * aiq
+
+        a[p][p] = c * c * app - 2.0 * s * c * apq + s * s * aqq
+        a[q][q] = s * s * app + 2.0 * s * c * apq + c * c * aqq
+        a[p][q] = a[q][p] = 0.0
+
+        # Update eigenvectors
+        for i in range(3):
+            vip = v[i][p]
+            viq = v[i][q]
+            v[i][p] = c * vip - s * viq
+            v[i][q] = s * vip + c * viq
+
+    eigvals = [a[0][0], a[1][1], a[2][2]]
+    return eigvals, v
+
+
+def pca_basis(points: list[tuple[float, float, float]]) -> Frame:
+    """PCA plane fit: (mean, u, v, n, eigenvalues ascending) with n the smallest-variance axis."""
+    if len(points) < 3:
+        raise ValueError("Need at least 3 points for PCA plane fit")
+
+    n = float(len(points))
+    mean = (sum(p[0] for p in points) / n, sum(p[1] for p in points) / n, sum(p[2] for p in points) / n)
+
+    cov = [[0.0, 0.0, 0.0] for _ in range(3)]
+    for x, y, z in points:
+        dx = x - mean[0]
+        dy = y - mean[1]
+        dz = z - mean[2]
+        cov[0][0] += dx * dx
+        cov[0][1] += dx * dy
+        cov[0][2] += dx * dz
+        cov[1][1] += dy * dy
+        cov[1][2] += dy * dz
+        cov[2][2] += dz * dz
+    cov[0][0] /= n
+    cov[0][1] /= n
+    cov[0][2] /= n
+    cov[1][1] /= n
+    cov[1][2] /= n
+    cov[2][2] /= n
+    cov[1][0] = cov[0][1]
+    cov[2][0] = cov[0][2]
+    cov[2][1] = cov[1][2]
+
+    eigvals, v = _jacobi_eigen_3x3(cov)
+
+    # columns of v are eigenvectors
+    eig = [
+        (eigvals[0], (v[0][0], v[1][0], v[2][0])),
+        (eigvals[1], (v[0][1], v[1][1], v[2][1])),
+        (eigvals[2], (v[0][2], v[1][2], v[2][2])),
+    ]
+    eig.sort(key=lambda t: t[0])  # ascending
+
+    nvec = _normalize(eig[0][1])
+    uvec = _normalize(eig[2][1])  # largest variance in-plane axis
+    # If numerical issues make u ~ parallel to n, fall back to middle.
+    if abs(_dot(uvec, nvec)) > 0.9:
+        uvec = _normalize(eig[1][1])
+
+    vvec = _normalize(_cross(nvec, uvec))
+    uvec = _normalize(_cross(vvec, nvec))
+
+    return mean, uvec, vvec, nvec, [e[0] for e in eig]
+
+
+def file_sha256(path: Path, *, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def default_cache_path(reference_pdb: Path) -> Path:
+    """Cache lives next to the reference model (e.g. the models/ directory)."""
+    return reference_pdb.parent / CACHE_FILE_NAME
+
+
+def frame_key(reference_digest: str, lipid_resnames: set[str]) -> str:
+    return f"{reference_digest}:{','.join(sorted(lipid_resnames))}"
+
+
+def _read_cache(cache_path: Path) -> dict:
+    try:
+        data = json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+        return {}
+    frames = data.get("frames")
+    return frames if isinstance(frames, dict) else {}
+
+
+def _write_cache(cache_path: Path, frames: dict) -> None:
+    payload = {"version": CACHE_VERSION, "frames": frames}
+    tmp = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(payload, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    os.replace(tmp, cache_path)
+
+
+def _frame_from_entry(entry: dict) -> Frame:
+    return (
+        tuple(entry["mean"]),
+        tuple(entry["u"]),
+        tuple(entry["v"]),
+        tuple(entry["n"]),
+        list(entry["eigenvalues"]),
+    )
+
+
+def cached_reference_frame(
+    reference_pdb: Path,
+    lipid_resnames: set[str],
+    fit: Callable[[], Frame],
+    *,
+    cache_path: Path | None = None,
+    use_cache: bool = True,
+) -> tuple[Frame, str]:
+    """Return the fitted membrane frame for `reference_pdb`, using the JSON cache when possible.
+
+    Entries are keyed by the SHA-256 of the reference file content plus the sorted lipid
+    resname set, so editing the model or changing --reference-lipids refits. `fit` is only
+    called on a miss. Returns (frame, status) with status CACHE_HIT, CACHE_STORED,
+    CACHE_DISABLED or "write failed: ..." (an unwritable cache does not stop the run).
+    """
+    if not use_cache:
+        return fit(), CACHE_DISABLED
+
+    path = cache_path if cache_path is not None else default_cache_path(reference_pdb)
+    digest = file_sha256(reference_pdb)
+    key = frame_key(digest, lipid_resnames)
+    frames = _read_cache(path)
+    entry = frames.get(key)
+    if entry is not None:
+        try:
+            return _frame_from_entry(entry), CACHE_HIT
+        except (KeyError, TypeError):
+            pass
+
+    frame = fit()
+    mean, u, v, n, eigs = frame
+    frames[key] = {
+        "reference": reference_pdb.name,
+        "sha256": digest,
+        "lipid_resnames": sorted(lipid_resnames),
+        "mean": list(mean),
+        "u": list(u),
+        "v": list(v),
+        "n": list(n),
+        "eigenvalues": list(eigs),
+    }
+    try:
+        _write_cache(path, frames)
+    except OSError as exc:
+        return frame, f"write failed: {exc}"
+    return frame, CACHE_STORED
+
+
+def cache_status_text(status: str) -> str:
+    """Human-readable cache outcome for the CLI summaries."""
+    if status == CACHE_HIT or status == CACHE_DISABLED:
+        return status
+    if status == CACHE_STORED:
+        return "miss (fitted + stored)"
+    return f"miss (fitted; cache {status})"
+
+
+def fit_reference_frame(reference: PdbAtomTable, lipid_resnames: set[str]) -> MembraneFrame:
+    """Fit the membrane plane to native lipid atoms of a reference model (ValueError if < 3 atoms)."""
+    idx = reference.select(resnames=lipid_resnames)
+    if len(idx) < 3:
+        raise ValueError(
+            f"Not enough reference lipid atoms to fit plane (resnames={sorted(lipid_resnames)}; atoms={len(idx)})."
+        )
+    return MembraneFrame.from_basis(pca_basis(reference.xyz[idx].tolist()))
+
+
+def load_reference_frame(
+    reference_pdb: Path,
+    lipid_resnames: set[str],
+    *,
+    cache_path: Path | None = None,
+    use_cache: bool = True,
+) -> tuple[MembraneFrame, str]:
+    """Return (frame, cache status); the reference PDB is only parsed on a cache miss."""
+    basis, status = cached_reference_frame(
+        reference_pdb,
+        lipid_resnames,
+        lambda: fit_reference_frame(read_pdb_atom_table(reference_pdb), lipid_resnames).as_basis(),
+        cache_path=cache_path,
+        use_cache=use_cache,
+    )
+    return MembraneFrame.from_basis(basis), status
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from dcd_reader import DcdChunk, DcdTrajectory, add_frame_range_args, check_atom_count, map_chunks
+from pdb_atom_table import PdbAtomTable, parse_resname_list, read_pdb_atom_table
+from place_membrane_patch import DEFAULT_LIPID_RESNAMES
+
+
+# Per-frame columns of the time series (CSV header / npz keys), in output order.
+SERIES_COLUMNS = (
+    "frame",
+    "time_ps",
+    "cx",
+    "cy",
+    "cz",
+    "nx",
+    "ny",
+    "nz",
+    "tilt_deg",
+    "thickness",
+    "apl_upper",
+    "apl_lower",
+)
+
+
+@dataclass(frozen=True)
+class LeafletSelection:
+    """Lipid phosphorus atoms grouped per lipid and split into leaflets (fixed for the run).
+
+    `p_atoms` index the system/DCD atoms; lipid k owns p_atoms[starts[k] : starts[k] + counts[k]]
+    (cardiolipin has two P atoms and counts once). `upper` marks lipids on the +`normal`
+    side of the midplane in the frame the split was made.
+    """
+
+    p_atoms: np.ndarray
+    starts: np.ndarray
+    counts: np.ndarray
+    upper: np.ndarray
+    normal: np.ndarray
+    exclude_area: float = 0.0
+
+    @property
+    def n_upper(self) -> int:
+        return int(self.upper.sum())
+
+    @property
+    def n_lower(self) -> int:
+        return int(len(self.upper) - self.upper.sum())
+
+
+def select_lipid_p_atoms(system: PdbAtomTable, lipid_resnames: set[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (p_atoms, starts, counts): phosphorus atoms of lipid residues grouped per residue."""
+    p_atoms = system.select(resnames=lipid_resnames)
+    p_atoms = p_atoms[system.element[p_atoms] == "P"]
+    if len(p_atoms) < 3:
+        raise ValueError(f"Not enough lipid P atoms (resnames={sorted(lipid_resnames)}; found {len(p_atoms)})")
+    residue_ids = system.residue_ids()[p_atoms]
+    starts = np.flatnonzero(np.diff(residue_ids, prepend=-1))
+    counts = np.diff(np.append(starts, len(p_atoms)))
+    return p_atoms, starts, counts
+
+
+def headgroup_points(p_xyz: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """(frames, n_P, 3) P coordinates -> (frames, n_lipids, 3) per-lipid mean P position."""
+    sums = np.add.reduceat(np.asarray(p_xyz, dtype=np.float64), starts, axis=1)
+    return sums / counts[None, :, None]
+
+
+def fit_planes(points: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Batched `membrane_frame_cache.pca_basis`: (frames, n, 3) -> (mean, normal, eigenvalues ascending) per frame.
+
+    One (frames, 3, 3) covariance stack and one `np.linalg.eigh` call replace the
+    per-frame Jacobi loop; the normal is the eigenvector of the smallest eigenvalue.
+    """
+    mean = points.mean(axis=1)
+    d = points - mean[:, None, :]
+    cov = np.einsum("fni,fnj->fij", d, d) / points.shape[1]
+    eigvals, eigvecs = np.linalg.eigh(cov)
+    return mean, eigvecs[:, :, 0], eigvals
+
+
+def split_leaflets(
+    system: PdbAtomTable,
+    reference_xyz: np.ndarray,
+    *,
+    lipid_resnames: set[str],
+    exclude_area: float = 0.0,
+) -> LeafletSelection:
+    """Select lipid P atoms once and assign each lipid to a leaflet in `reference_xyz`.
+
+    The reference normal is oriented towards +z, so "upper" is the leaflet on the +z side
+    for a membrane in the xy plane.
+    """
+    p_atoms, starts, counts = select_lipid_p_atoms(system, lipid_resnames)
+    heads = headgroup_points(reference_xyz[p_atoms][None], starts, counts)
+    mean, normal, _eigs = fit_planes(heads)
+    n0 = normal[0] if normal[0, 2] >= 0.0 else -normal[0]
+    heights = (heads[0] - mean[0]) @ n0
+    upper = heights > 0.0
+    if upper.all() or not upper.any():
+        raise ValueError("Could not split lipids into two leaflets (all P atoms on one side of the midplane)")
+    return LeafletSelection(p_atoms, starts, counts, upper, n0, float(exclude_area))
+
+
+def membrane_series_chunk(chunk: DcdChunk, sel: LeafletSelection) -> dict[str, np.ndarray]:
+    """Per-frame membrane center/normal/tilt/thickness/APL for one chunk of P-atom coordinates."""
+    heads = headgroup_points(chunk.xyz, sel.starts, sel.counts)
+    mean, normal, _eigs = fit_planes(heads)
+    # Keep the normal pointing from the lower to the upper leaflet of the reference split.
+    normal *= np.where(normal @ sel.normal < 0.0, -1.0, 1.0)[:, None]
+    heights = np.einsum("fni,fi->fn", heads - mean[:, None, :], normal)
+    thickness = heights[:, sel.upper].mean(axis=1) - heights[:, ~sel.upper].mean(axis=1)
+    tilt = np.degrees(np.arccos(np.clip(np.abs(normal[:, 2]), 0.0, 1.0)))
+
+    if chunk.unit_cells is None:
+        area = np.full(len(chunk), np.nan)
+    else:
+        a, b, gamma = chunk.unit_cells[:, 0], chunk.unit_cells[:, 1], chunk.unit_cells[:, 5]
+        area = a * b * np.sin(np.radians(gamma)) - sel.exclude_area
+    frames = np.asarray(chunk.frames, dtype=np.int64)
+    return {
+        "frame": frames,
+        "center": mean,
+        "normal": normal,
+        "tilt_deg": tilt,
+        "thickness": thickness,
+        "apl_upper": area / sel.n_upper,
+        "apl_lower": area / sel.n_lower,
+    }
+
+
+def membrane_series(
+    dcd: Path,
+    sel: LeafletSelection,
+    *,
+    start: int = 0,
+    stop: int | None = None,
+    stride: int = 1,
+    chunk_size: int = 2000,
+    jobs: int = 0,
+) -> dict[str, np.ndarray]:
+    """Run `membrane_series_chunk` over a DCD in parallel chunks; returns SERIES_COLUMNS arrays."""
+    parts = list(
+        map_chunks(
+            dcd,
+            membrane_series_chunk,
+            sel,
+            chunk_size=chunk_size,
+            start=start,
+            stop=stop,
+            stride=stride,
+            atoms=sel.p_atoms,
+            jobs=jobs,
+        )
+    )
+    if not parts:
+        raise ValueError(f"No frames selected from {dcd}")
+    merged = {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+    with DcdTrajectory(dcd) as traj:
+        time_ps = traj.times_ps(merged["frame"])
+    center, normal = merged.pop("center"), merged.pop("normal")
+    series = {"frame": merged["frame"], "time_ps": time_ps}
+    series.update({"cx": center[:, 0], "cy": center[:, 1], "cz": center[:, 2]})
+    series.update({"nx": normal[:, 0], "ny": normal[:, 1], "nz": normal[:, 2]})
+    series.update({k: merged[k] for k in ("tilt_deg", "thickness", "apl_upper", "apl_lower")})
+    return series
+
+
+def write_series(path: Path, series: dict[str, np.ndarray], *, header_lines: list[str] | None = None) -> None:
+    """Write the time series as CSV, or as compressed `.npz` arrays when `path` ends in .npz."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".npz":
+        np.savez_compressed(path, **{k: series[k] for k in SERIES_COLUMNS})
+        return
+    table = np.column_stack([series[k] for k in SERIES_COLUMNS])
+    fmt = ["%d", "%.3f"] + ["%.3f"] * 3 + ["%.6f"] * 3 + ["%.3f"] * 4
+    header = [*(header_lines or []), ",".join(SERIES_COLUMNS)]
+    np.savetxt(path, table, fmt=fmt, delimiter=",", header="\n".join(header), comments="# ")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=(
+            "Per-frame membrane normal, tilt, P-P thickness and area per lipid over a NAMD DCD trajectory.\n\n"
+            "Lipid P atoms are selected once from --pdb (same atom order as the DCD) and split into leaflets\n"
+            "along the plane fitted in the first analysed frame. Every frame then gets a PCA plane fit\n"
+            "(batched over chunks of frames, chunks run in parallel workers), the leaflet P-P distance along\n"
+            "that normal and the box area per lipid of each leaflet.\n"
+        )
+    )
+    ap.add_argument("--pdb", required=True, help="System PDB with the same atoms/order as the DCD (e.g. the NAMD input).")
+    ap.add_argument("--dcd", required=True, help="NAMD DCD trajectory.")
+    ap.add_argument(
+        "--out",
+        default=None,
+        help="Output time series (.csv, or .npz for compressed arrays). Default: <dcd stem>_membrane.csv next to the DCD.",
+    )
+    ap.add_argument(
+        "--lipid-resnames",
+        action="append",
+        default=[],
+        help=(
+            "Comma-separated lipid residue names whose P atoms define the bilayer (can be provided multiple times). "
+            f"Default: {','.join(sorted(DEFAULT_LIPID_RESNAMES))}."
+        ),
+    )
+    ap.add_argument(
+        "--exclude-area",
+        type=float,
+        default=0.0,
+        help="Area in A^2 subtracted from the box area before dividing by lipid counts (e.g. the protein cross-section).",
+    )
+    add_frame_range_args(ap, chunk_size=2000)
+    args = ap.parse_args()
+
+    dcd = Path(args.dcd)
+    out = Path(args.out) if args.out else dcd.with_name(f"{dcd.stem}_membrane.csv")
+    lipid_resnames = parse_resname_list(args.lipid_resnames) if args.lipid_resnames else set(DEFAULT_LIPID_RESNAMES)
+
+    if not dcd.exists():
+        raise SystemExit(f"Missing --dcd: {dcd}")
+    system = read_pdb_atom_table(Path(args.pdb))
+    try:
+        with DcdTrajectory(dcd) as traj:
+            check_atom_count(traj, args.pdb, len(system))
+            frames = range(len(traj))[args.start : args.stop : args.stride]
+            if not frames:
+                raise ValueError(f"No frames selected from {dcd} ({len(traj)} frames)")
+            has_cell = traj.has_unit_cell
+            sel = split_leaflets(
+                system,
+                np.asarray(traj.frame(frames[0]), dtype=np.float64),
+                lipid_resnames=lipid_resnames,
+                exclude_area=args.exclude_area,
+            )
+        series = membrane_series(
+            dcd,
+            sel,
+            start=args.start,
+            stop=args.stop,
+            stride=args.stride,
+            chunk_size=args.chunk_size,
+            jobs=args.jobs,
+        )
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    write_series(
+        out,
+        series,
+        header_lines=[
+            f"dcd={dcd.name} pdb={Path(args.pdb).name} lipids={','.join(sorted(lipid_resnames))}",
+            f"p_atoms={len(sel.p_atoms)} lipids_upper={sel.n_upper} lipids_lower={sel.n_lower} "
+            f"exclude_area={sel.exclude_area:g}",
+        ],
+    )
+
+    def stat(key: str) -> str:
+        v = series[key]
+        return f"{np.nanmean(v):.3f} +/- {np.nanstd(v):.3f}" if np.isfinite(v).any() else "n/a (no unit cell)"
+
+    print(f"DCD:        {dcd}  (frames analysed: {len(series['frame'])})")
+    print(f"Lipids:     {','.join(sorted(lipid_resnames))}  (P atoms: {len(sel.p_atoms)}; upper/lower: {sel.n_upper}/{sel.n_lower})")
+    print(f"Thickness (A):  {stat('thickness')}")
+    print(f"Tilt (deg):     {stat('tilt_deg')}")
+    print(f"APL upper (A^2): {stat('apl_upper')}")
+    print(f"APL lower (A^2): {stat('apl_lower')}")
+    if not has_cell:
+        print("Note: DCD has no unit cell records; APL columns are NaN.")
+    print(f"Wrote: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
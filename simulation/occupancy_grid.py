@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from dcd_reader import DcdChunk, DcdTrajectory, add_frame_range_args, check_atom_count, map_chunks
+from pdb_atom_table import PdbAtomTable, parse_name_list, parse_resname_list, read_pdb_atom_table
+from superpose import apply_superposition, kabsch_rotations
+
+
+@dataclass(frozen=True)
+class GridSpec:
+    """Regular grid: voxel (i, j, k) covers origin + [i, i+1) * spacing along each axis."""
+
+    origin: np.ndarray
+    shape: tuple[int, int, int]
+    spacing: float
+
+    @classmethod
+    def around(cls, center: np.ndarray, size: np.ndarray, spacing: float) -> "GridSpec":
+        if spacing <= 0.0:
+            raise ValueError("Grid spacing must be positive")
+        shape = np.maximum(np.ceil(np.asarray(size, dtype=np.float64) / spacing), 1).astype(np.int64)
+        origin = np.asarray(center, dtype=np.float64) - 0.5 * shape * spacing
+        return cls(origin=origin, shape=(int(shape[0]), int(shape[1]), int(shape[2])), spacing=float(spacing))
+
+    @property
+    def n_voxels(self) -> int:
+        return self.shape[0] * self.shape[1] * self.shape[2]
+
+
+@dataclass(frozen=True)
+class GridTask:
+    """Per-run context for the chunk workers.
+
+    Chunks read `atoms` (the counted atoms first, then the alignment atoms when aligning);
+    `reference` holds the reference coordinates of the alignment atoms or is None.
+    """
+
+    atoms: np.ndarray
+    n_counted: int
+    grid: GridSpec
+    reference: np.ndarray | None
+
+
+# Points binned per pass in `grid_chunk`; bounds the per-worker temporaries (~50 MB).
+BLOCK_POINTS = 1 << 20
+
+
+def voxel_counts(xyz: np.ndarray, grid: GridSpec) -> np.ndarray:
+    """Histogram of (..., 3) points over `grid` as a flat int64 array (points outside dropped).
+
+    Voxel indices are computed in float32 (the DCD precision); only the points inside the
+    grid are converted to integer indices.
+    """
+    points = np.asarray(xyz, dtype=np.float32).reshape(-1, 3)
+    scaled = points - grid.origin.astype(np.float32)
+    scaled /= np.float32(grid.spacing)
+    np.floor(scaled, out=scaled)
+    inside = np.all((scaled >= 0) & (scaled < np.asarray(grid.shape, dtype=np.float32)), axis=1)
+    flat = np.ravel_multi_index(tuple(scaled[inside].astype(np.int64).T), grid.shape)
+    return np.bincount(flat, minlength=grid.n_voxels)
+
+
+def grid_chunk(chunk: DcdChunk, task: GridTask) -> tuple[np.ndarray, int]:
+    """Partial grid (flat counts) and frame count of one chunk, aligned first when requested.
+
+    Frames are aligned and binned in blocks of about BLOCK_POINTS counted atoms, so the
+    float64 superposition and the index arrays never cover the whole chunk.
+    """
+    counts = np.zeros(task.grid.n_voxels, dtype=np.int64)
+    step = max(1, BLOCK_POINTS // max(task.n_counted, 1))
+    for lo in range(0, len(chunk), step):
+        frames = chunk.xyz[lo : lo + step]
+        xyz = frames[:, : task.n_counted]
+        if task.reference is not None:
+            rotations, centers, ref_center = kabsch_rotations(frames[:, task.n_counted :], task.reference)
+            xyz = apply_superposition(xyz, rotations, centers, ref_center)
+        counts += voxel_counts(xyz, task.grid)
+    return counts, len(chunk)
+
+
+def accumulate_grid(
+    dcd: Path,
+    task: GridTask,
+    *,
+    start: int = 0,
+    stop: int | None = None,
+    stride: int = 1,
+    chunk_size: int = 100,
+    jobs: int = 0,
+) -> tuple[np.ndarray, int]:
+    """Sum the per-chunk grids of a DCD; returns (counts shaped like the grid, frames).
+
+    Partial grids are merged in frame order as they arrive; `map_chunks` keeps at most
+    2 * jobs chunks in flight, so memory is a few grids per worker plus one chunk, not
+    proportional to trajectory length.
+    """
+    total = np.zeros(task.grid.n_voxels, dtype=np.int64)
+    n_frames = 0
+    for counts, n in map_chunks(
+        dcd,
+        grid_chunk,
+        task,
+        chunk_size=chunk_size,
+        start=start,
+        stop=stop,
+        stride=stride,
+        atoms=task.atoms,
+        jobs=jobs,
+    ):
+        total += counts
+        n_frames += n
+    return total.reshape(task.grid.shape), n_frames
+
+
+def write_dx(path: Path, values: np.ndarray, grid: GridSpec, *, comments: list[str] | None = None) -> None:
+    """Write a 3-D array as an OpenDX scalar field (VMD `mol addfile ... type dx`).
+
+    DX positions are voxel centers, so the written origin is shifted by half a spacing.
+    Values are listed with z fastest (C order), three per line.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    nx, ny, nz = grid.shape
+    center0 = grid.origin + 0.5 * grid.spacing
+    s = grid.spacing
+    flat = np.asarray(values, dtype=np.float64).reshape(-1)
+    head = [f"# {c}" for c in comments or []]
+    head += [
+        f"object 1 class gridpositions counts {nx} {ny} {nz}",
+        f"origin {center0[0]:.6f} {center0[1]:.6f} {center0[2]:.6f}",
+        f"delta {s:.6f} 0.000000 0.000000",
+        f"delta 0.000000 {s:.6f} 0.000000",
+        f"delta 0.000000 0.000000 {s:.6f}",
+        f"object 2 class gridconnections counts {nx} {ny} {nz}",
+        f"object 3 class array type double rank 0 items {len(flat)} data follows",
+    ]
+    tail = [
+        'attribute "dep" string "positions"',
+        'object "occupancy" class field',
+        'component "positions" value 1',
+        'component "connections" value 2',
+        'component "data" value 3',
+    ]
+    full = len(flat) // 3 * 3
+    with path.open("w", encoding="utf-8", newline="\n") as fout:
+        fout.write("\n".join(head) + "\n")
+        if full:
+            np.savetxt(fout, flat[:full].reshape(-1, 3), fmt="%.6e")
+        if full < len(flat):
+            fout.write(" ".join(f"{v:.6e}" for v in flat[full:].tolist()) + "\n")
+        fout.write("\n".join(tail) + "\n")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=(
+            "Accumulate a 3-D occupancy grid of selected atoms (e.g. water oxygens, O2) over a NAMD DCD\n"
+            "trajectory and write it as an OpenDX map for VMD.\n\n"
+            "Each chunk of frames is binned in float32 blocks of ~1M points (voxel indices + np.bincount) in a\n"
+            "worker process; partial grids are summed as they arrive. With --align, every frame is first\n"
+            "superposed (batched Kabsch) onto the --pdb coordinates of the alignment atoms, so the map is in\n"
+            "the frame of --pdb.\n"
+        )
+    )
+    ap.add_argument("--pdb", required=True, help="System PDB with the same atoms/order as the DCD (also the grid/alignment frame).")
+    ap.add_argument("--dcd", required=True, help="NAMD DCD trajectory.")
+    ap.add_argument("--out-dx", required=True, help="Output OpenDX file.")
+    ap.add_argument(
+        "--resnames",
+        action="append",
+        default=[],
+        required=True,
+        help="Comma-separated residue names of the atoms to count (e.g. TIP3 or OXY; can be repeated).",
+    )
+    ap.add_argument("--atomnames", action="append", default=[], help="Comma-separated atom names to count (e.g. OH2).")
+    ap.add_argument(
+        "--center-resnames",
+        action="append",
+        default=[],
+        help="Center the grid on these residues in --pdb (e.g. 8Q1). Default: center of the counted atoms.",
+    )
+    ap.add_argument("--center", nargs=3, type=float, default=None, metavar=("X", "Y", "Z"), help="Explicit grid center (A).")
+    ap.add_argument("--size", nargs="+", type=float, default=[40.0], help="Grid edge length(s) in A: one value or X Y Z (default: 40).")
+    ap.add_argument("--spacing", type=float, default=1.0, help="Voxel size in A (default: 1.0).")
+    ap.add_argument("--align", action="store_true", help="Superpose every frame onto --pdb before binning.")
+    ap.add_argument(
+        "--align-chains",
+        default=None,
+        help="Comma-separated chains whose CA atoms define the alignment (default: all protein CA atoms).",
+    )
+    ap.add_argument(
+        "--density",
+        action="store_true",
+        help="Write atoms per A^3 instead of mean atoms per voxel per frame.",
+    )
+    add_frame_range_args(ap, chunk_size=100)
+    args = ap.parse_args()
+
+    if len(args.size) not in (1, 3) or min(args.size) <= 0.0:
+        raise SystemExit("--size expects one or three positive lengths")
+    dcd = Path(args.dcd)
+    if not dcd.exists():
+        raise SystemExit(f"Missing --dcd: {dcd}")
+    system: PdbAtomTable = read_pdb_atom_table(Path(args.pdb))
+
+    counted = system.select(
+        resnames=parse_resname_list(args.resnames),
+        atomnames=parse_resname_list(args.atomnames) if args.atomnames else None,
+    )
+    if len(counted) == 0:
+        raise SystemExit("No atoms match --resnames/--atomnames")
+
+    if args.center is not None:
+        center = np.asarray(args.center, dtype=np.float64)
+    elif args.center_resnames:
+        idx = system.select(resnames=parse_resname_list(args.center_resnames))
+        if len(idx) == 0:
+            raise SystemExit("No atoms match --center-resnames")
+        center = system.xyz[idx].mean(axis=0)
+    else:
+        center = system.xyz[counted].mean(axis=0)
+    size = np.asarray(args.size * 3 if len(args.size) == 1 else args.size, dtype=np.float64)
+    try:
+        grid = GridSpec.around(center, size, args.spacing)
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+
+    reference = None
+    atoms = counted
+    if args.align:
+        align = system.select(atomnames={"CA"}, chains=parse_name_list([args.align_chains]) if args.align_chains else None)
+        align = align[system.record[align] == "ATOM"]
+        if len(align) < 3:
+            raise SystemExit("Need at least 3 CA atoms for --align")
+        reference = system.xyz[align]
+        atoms = np.concatenate([counted, align])
+    task = GridTask(atoms=atoms, n_counted=len(counted), grid=grid, reference=reference)
+
+    with DcdTrajectory(dcd) as traj:
+        check_atom_count(traj, args.pdb, len(system))
+    counts, n_frames = accumulate_grid(
+        dcd,
+        task,
+        start=args.start,
+        stop=args.stop,
+        stride=args.stride,
+        chunk_size=args.chunk_size,
+        jobs=args.jobs,
+    )
+    if n_frames == 0:
+        raise SystemExit(f"No frames selected from {dcd}")
+
+    values = counts / n_frames
+    unit = "mean atoms per voxel per frame"
+    if args.density:
+        values = values / grid.spacing**3
+        unit = "atoms per A^3"
+    out = Path(args.out_dx)
+    write_dx(
+        out,
+        values,
+        grid,
+        comments=[
+            f"occupancy_grid.py: {dcd.name} frames={n_frames} atoms={len(counted)} aligned={'yes' if args.align else 'no'}",
+            f"values: {unit}",
+        ],
+    )
+
+    nx, ny, nz = grid.shape
+    print(f"DCD:        {dcd}  (frames: {n_frames}; counted atoms: {len(counted)})")
+    print(f"Grid:       {nx} x {ny} x {nz} @ {grid.spacing:g} A  (center {center[0]:.3f}, {center[1]:.3f}, {center[2]:.3f})")
+    alignment = f"CA atoms: {len(reference)}" if reference is not None else "none"
+    print(f"Alignment:  {alignment}")
+    print(f"Binned:     {int(counts.sum())} atom positions inside the grid; max voxel {values.max():.4g} ({unit})")
+    print(f"Wrote: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
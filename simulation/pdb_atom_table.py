@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+
+@dataclass
+class PdbAtomTable:
+    """Columnar view of the ATOM/HETATM records of one PDB file.
+
+    Columns are NumPy arrays indexed by atom (file order). `lines` keeps the original
+    records so tools can write subsets without re-formatting; `header` holds the
+    non-atom lines (CRYST1, REMARK, ...) that precede the first atom record, and
+    `other_lines` the later ones (TER, CONECT, END, ...) as (atoms before it, line).
+    """
+
+    lines: list[str]
+    header: list[str]
+    record: np.ndarray
+    atomname: np.ndarray
+    resname: np.ndarray
+    chain: np.ndarray
+    resseq: np.ndarray
+    icode: np.ndarray
+    segid: np.ndarray
+    element: np.ndarray
+    xyz: np.ndarray
+    other_lines: list[tuple[int, str]] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def residue_ids(self) -> np.ndarray:
+        """Return a 0-based residue index per atom.
+
+        A new residue starts whenever segid/chain/resseq/icode/resname changes between
+        consecutive records (VMD convention), so wrapped 4-digit resseq values in large
+        patches still separate correctly.
+        """
+        n = len(self)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        changed = np.zeros(n, dtype=bool)
+        changed[0] = True
+        for col in (self.segid, self.chain, self.resseq, self.icode, self.resname):
+            changed[1:] |= col[1:] != col[:-1]
+        return np.cumsum(changed) - 1
+
+    def heavy_mask(self) -> np.ndarray:
+        return self.element != "H"
+
+    def select(
+        self,
+        *,
+        resnames: Iterable[str] | None = None,
+        exclude_resnames: Iterable[str] | None = None,
+        atomnames: Iterable[str] | None = None,
+        chains: Iterable[str] | None = None,
+        segids: Iterable[str] | None = None,
+        heavy_only: bool = False,
+    ) -> np.ndarray:
+        """Return atom indices matching all given filters.
+
+        Residue/atom names are compared upper-case; chains and segids are case-sensitive
+        (9TI4 uses both 'M' and 'm', for example).
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if resnames is not None:
+            mask &= np.isin(self.resname, [s.upper() for s in resnames])
+        if exclude_resnames is not None:
+            mask &= ~np.isin(self.resname, [s.upper() for s in exclude_resnames])
+        if atomnames is not None:
+            mask &= np.isin(self.atomname, [s.upper() for s in atomnames])
+        if chains is not None:
+            mask &= np.isin(self.chain, list(chains))
+        if segids is not None:
+            mask &= np.isin(self.segid, list(segids))
+        if heavy_only:
+            mask &= self.heavy_mask()
+        return np.flatnonzero(mask)
+
+
+def parse_name_list(values: Iterable[str]) -> set[str]:
+    """Names from repeatable CLI values ("POPC,CDL", "TIP3;SOD"), case preserved (e.g. chain IDs)."""
+    out: set[str] = set()
+    for item in values:
+        for part in str(item).replace(";", ",").split(","):
+            part = part.strip()
+            if part:
+                out.add(part)
+    return out
+
+
+def parse_resname_list(values: Iterable[str]) -> set[str]:
+    """Upper-cased `parse_name_list`; used for residue and atom names."""
+    return {name.upper() for name in parse_name_list(values)}
+
+
+def _guess_element(atomname: str) -> str:
+    name = atomname.lstrip("0123456789")
+    return name[:1] if name else ""
+
+
+def read_pdb_atom_table(path: Path) -> PdbAtomTable:
+    """Parse ATOM/HETATM records of a PDB into a `PdbAtomTable`.
+
+    Residue names are read from columns 18-21 (VMD/CHARMM 4-letter names) and upper-cased;
+    chain IDs and segids keep their case. Records with unreadable coordinates are skipped.
+    """
+    lines: list[str] = []
+    header: list[str] = []
+    other_lines: list[tuple[int, str]] = []
+    record: list[str] = []
+    atomname: list[str] = []
+    resname: list[str] = []
+    chain: list[str] = []
+    resseq: list[int] = []
+    icode: list[str] = []
+    segid: list[str] = []
+    element: list[str] = []
+    coords: list[tuple[float, float, float]] = []
+
+    with path.open("r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            if not (line.startswith("ATOM") or line.startswith("HETATM")):
+                if not lines:
+                    if not line.startswith("END"):
+                        header.append(line)
+                elif line.strip():
+                    other_lines.append((len(lines), line))
+                continue
+            if len(line) < 54:
+                continue
+            try:
+                x = float(line[30:38])
+                y = float(line[38:46])
+                z = float(line[46:54])
+            except ValueError:
+                continue
+            name = line[12:16].strip().upper()
+            try:
+                seq = int(line[22:26])
+            except ValueError:
+                seq = 0
+            el = line[76:78].strip().upper() if len(line) >= 78 else ""
+            lines.append(line)
+            record.append(line[:6].strip())
+            atomname.append(name)
+            resname.append(line[17:21].strip().upper())
+            chain.append(line[21:22].strip())
+            resseq.append(seq)
+            icode.append(line[26:27].strip())
+            segid.append(line[72:76].strip())
+            element.append(el or _guess_element(name))
+            coords.append((x, y, z))
+
+    return PdbAtomTable(
+        lines=lines,
+        header=header,
+        record=np.array(record, dtype=str),
+        atomname=np.array(atomname, dtype=str),
+        resname=np.array(resname, dtype=str),
+        chain=np.array(chain, dtype=str),
+        resseq=np.array(resseq, dtype=np.int64),
+        icode=np.array(icode, dtype=str),
+        segid=np.array(segid, dtype=str),
+        element=np.array(element, dtype=str),
+        xyz=np.array(coords, dtype=np.float64).reshape(-1, 3),
+        other_lines=other_lines,
+    )
+
+
+def _conect_serials(line: str) -> list[int]:
+    serials: list[int] = []
+    for start in range(6, min(len(line.rstrip("\n")), 31), 5):
+        try:
+            serials.append(int(line[start : start + 5]))
+        except ValueError:
+            pass
+    return serials
+
+
+def write_pdb_subset(path: Path, table: PdbAtomTable, indices: np.ndarray) -> int:
+    """Write the header plus the original records at `indices`; return atoms written.
+
+    A TER record is kept (after the last written atom before it) when any atom of its
+    chain segment is written; CONECT records are kept when every atom they reference
+    is written. Other records after the atoms (MASTER, END, ...) are replaced by END.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    indices = np.asarray(indices, dtype=np.int64)
+    written = np.zeros(len(table), dtype=bool)
+    written[indices] = True
+    # TER positions -> insert after the last written atom of the segment they close.
+    ter_after: dict[int, list[str]] = {}
+    segment_start = 0
+    conect: list[str] = []
+    serials: set[int] | None = None
+    for pos, line in table.other_lines:
+        if line.startswith("TER"):
+            hit = np.flatnonzero(written[segment_start:pos])
+            if len(hit):
+                ter_after.setdefault(segment_start + int(hit[-1]), []).append(line)
+            segment_start = pos
+        elif line.startswith("CONECT"):
+            if serials is None:
+                serials = set()
+                for i in indices.tolist():
+                    try:
+                        serials.add(int(table.lines[i][6:11]))
+                    except ValueError:
+                        pass
+            refs = _conect_serials(line)
+            if refs and all(r in serials for r in refs):
+                conect.append(line)
+    with path.open("w", encoding="utf-8", newline="\n") as fout:
+        for line in table.header:
+            fout.write(line if line.endswith("\n") else line + "\n")
+        for i in indices.tolist():
+            line = table.lines[i]
+            fout.write(line if line.endswith("\n") else line + "\n")
+            for ter in ter_after.get(i, ()):
+                fout.write(ter if ter.endswith("\n") else ter + "\n")
+        for line in conect:
+            fout.write(line if line.endswith("\n") else line + "\n")
+        fout.write("END\n")
+    return int(len(indices))
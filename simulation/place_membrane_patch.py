@@ -1,10 +1,15 @@
 from __future__ import annotations
 
 import argparse
-import math
+import os
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable
+
+import numpy as np
+
+from membrane_frame_cache import CACHE_FILE_NAME, MembraneFrame, cache_status_text, load_reference_frame, pca_basis
+from pdb_atom_table import PdbAtomTable, parse_resname_list, read_pdb_atom_table
 
 
 WATER_RESNAMES = {"HOH", "WAT", "TIP", "TIP3", "TP3"}
@@ -18,95 +23,10 @@ DEFAULT_REFERENCE_PDB = Path("output/playwright/chatgpt_botprompts/models/comple
 DEFAULT_EXCLUDE_FOR_PROTEIN_BBOX = WATER_RESNAMES | ION_RESNAMES | DEFAULT_LIPID_RESNAMES
 
 
-@dataclass
-class MinMax:
-    minx: float = math.inf
-    miny: float = math.inf
-    minz: float = math.inf
-    maxx: float = -math.inf
-    maxy: float = -math.inf
-    maxz: float = -math.inf
-
-    def update(self, x: float, y: float, z: float) -> None:
-        if x < self.minx:
-            self.minx = x
-        if y < self.miny:
-            self.miny = y
-        if z < self.minz:
-            self.minz = z
-        if x > self.maxx:
-            self.maxx = x
-        if y > self.maxy:
-            self.maxy = y
-        if z > self.maxz:
-            self.maxz = z
-
-    def valid(self) -> bool:
-        return self.minx != math.inf
-
-    def center(self) -> tuple[float, float, float]:
-        return (
-            (self.minx + self.maxx) * 0.5,
-            (self.miny + self.maxy) * 0.5,
-            (self.minz + self.maxz) * 0.5,
-        )
-
-    def center_xy(self) -> tuple[float, float]:
-        return ((self.minx + self.maxx) * 0.5, (self.miny + self.maxy) * 0.5)
-
-
-def _split_csv(values: Iterable[str]) -> set[str]:
-    out: set[str] = set()
-    for item in values:
-        for part in str(item).split(","):
-            part = part.strip()
-            if not part:
-                continue
-            out.add(part.upper())
-    return out
-
-
-def iter_pdb_atoms(path: Path):
-    """Yield (resname, atomname, x, y, z, line) for ATOM/HETATM records.
-
-    Notes on residue names:
-    - Standard PDB has 3-char residue names (cols 18-20).
-    - VMD/CHARMM-style PDBs may use 4-char residue names (cols 18-21, chain blank).
-    This parser reads up to 4 chars (line[17:21]) and strips whitespace.
-    """
-    with path.open("r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            if not (line.startswith("ATOM") or line.startswith("HETATM")):
-                continue
-            if len(line) < 54:
-                continue
-            resname = line[17:21].strip().upper()
-            atomname = line[12:16].strip().upper()
-            try:
-                x = float(line[30:38])
-                y = float(line[38:46])
-                z = float(line[46:54])
-            except ValueError:
-                continue
-            yield resname, atomname, x, y, z, line
-
-
 def _dot(a: tuple[float, float, float], b: tuple[float, float, float]) -> float:
     return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
 
 
-def _cross(a: tuple[float, float, float], b: tuple[float, float, float]) -> tuple[float, float, float]:
-    return (
-        a[1] * b[2] - a[2] * b[1],
-        a[2] * b[0] - a[0] * b[2],
-        a[0] * b[1] - a[1] * b[0],
-    )
-
-
-def _norm(a: tuple[float, float, float]) -> float:
-    return math.sqrt(_dot(a, a))
-
-
 def _scale(a: tuple[float, float, float], s: float) -> tuple[float, float, float]:
     return (a[0] * s, a[1] * s, a[2] * s)
 
@@ -119,13 +39,6 @@ def _sub(a: tuple[float, float, float], b: tuple[float, float, float]) -> tuple[
     return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
 
 
-def _normalize(a: tuple[float, float, float]) -> tuple[float, float, float]:
-    n = _norm(a)
-    if n == 0.0:
-        raise ValueError("Cannot normalize zero-length vector")
-    return _scale(a, 1.0 / n)
-
-
 def _mat_vec_mul_cols(
     col0: tuple[float, float, float],
     col1: tuple[float, float, float],
@@ -141,283 +54,202 @@ def _mat_vec_mul_cols(
     )
 
 
-def _jacobi_eigen_3x3(
-    a: list[list[float]],
-    *,
-    max_iter: int = 50,
-    eps: float = 1e-12,
-) -> tuple[list[float], list[list[float]]]:
-    """Eigen-decomposition of a real symmetric 3x3 matrix using Jacobi rotations.
-
-    Returns (eigenvalues, eigenvectors_matrix), where eigenvectors are columns of V.
-    """
-    v = [
-        [1.0, 0.0, 0.0],
-        [0.0, 1.0, 0.0],
-        [0.0, 0.0, 1.0],
-    ]
-
-    def max_offdiag(m: list[list[float]]):
-        pairs = [(0, 1), (0, 2), (1, 2)]
-        p, q = max(pairs, key=lambda ij: abs(m[ij[0]][ij[1]]))
-        return p, q, abs(m[p][q])
-
-    for _ in range(max_iter):
-        p, q, off = max_offdiag(a)
-        if off < eps:
-            break
-
-        app = a[p][p]
-        aqq = a[q][q]
-        apq = a[p][q]
-        if apq == 0.0:
+def _parse_chain_list(chains: str) -> set[str]:
+    parts: list[str] = []
+    for part in chains.replace(",", " ").split():
+        part = part.strip()
+        if not part:
             continue
+        parts.append(part.lower())
+    return set("".join(parts))
 
-        phi = 0.5 * math.atan2(2.0 * apq, (aqq - app))
-        c = math.cos(phi)
-        s = math.sin(phi)
-
-        # Rotate rows/cols p and q to zero out apq.
-        for i in range(3):
-            if i == p or i == q:
-                continue
-            aip = a[i][p]
-            aiq = a[i][q]
-            a[i][p] = a[p][i] = c * aip - s * aiq
-            a[i][q] = a[q][i] = s * aip + c * aiq
-
-        a[p][p] = c * c * app - 2.0 * s * c * apq + s * s * aqq
-        a[q][q] = s * s * app + 2.0 * s * c * apq + c * c * aqq
-        a[p][q] = a[q][p] = 0.0
-
-        # Update eigenvectors
-        for i in range(3):
-            vip = v[i][p]
-            viq = v[i][q]
-            v[i][p] = c * vip - s * viq
-            v[i][q] = s * vip + c * viq
-
-    eigvals = [a[0][0], a[1][1], a[2][2]]
-    return eigvals, v
-
-
-def _pca_basis(points: list[tuple[float, float, float]]):
-    if len(points) < 3:
-        raise ValueError("Need at least 3 points for PCA plane fit")
-
-    n = float(len(points))
-    mean = (sum(p[0] for p in points) / n, sum(p[1] for p in points) / n, sum(p[2] for p in points) / n)
-
-    cov = [[0.0, 0.0, 0.0] for _ in range(3)]
-    for x, y, z in points:
-        dx = x - mean[0]
-        dy = y - mean[1]
-        dz = z - mean[2]
-        cov[0][0] += dx * dx
-        cov[0][1] += dx * dy
-        cov[0][2] += dx * dz
-        cov[1][1] += dy * dy
-        cov[1][2] += dy * dz
-        cov[2][2] += dz * dz
-    cov[0][0] /= n
-    cov[0][1] /= n
-    cov[0][2] /= n
-    cov[1][1] /= n
-    cov[1][2] /= n
-    cov[2][2] /= n
-    cov[1][0] = cov[0][1]
-    cov[2][0] = cov[0][2]
-    cov[2][1] = cov[1][2]
-
-    eigvals, v = _jacobi_eigen_3x3(cov)
-
-    # columns of v are eigenvectors
-    eig = [
-        (eigvals[0], (v[0][0], v[1][0], v[2][0])),
-        (eigvals[1], (v[0][1], v[1][1], v[2][1])),
-        (eigvals[2], (v[0][2], v[1][2], v[2][2])),
-    ]
-    eig.sort(key=lambda t: t[0])  # ascending
-
-    nvec = _normalize(eig[0][1])
-    uvec = _normalize(eig[2][1])  # largest variance in-plane axis
-    # If numerical issues make u ~ parallel to n, fall back to middle.
-    if abs(_dot(uvec, nvec)) > 0.9:
-        uvec = _normalize(eig[1][1])
-
-    vvec = _normalize(_cross(nvec, uvec))
-    uvec = _normalize(_cross(vvec, nvec))
 
-    return mean, uvec, vvec, nvec, [e[0] for e in eig]
+@dataclass(frozen=True)
+class PatchPlacement:
+    """Rigid transform that places a membrane patch around one protein model.
 
+    New coordinates are `rotation_cols[0]*x + rotation_cols[1]*y + rotation_cols[2]*z + translation`.
+    """
 
-def compute_bbox(
-    pdb_path: Path,
+    frame: MembraneFrame
+    patch_frame: MembraneFrame
+    patch_p_atoms: int
+    rotated: bool
+    rotation_cols: tuple[tuple[float, float, float], tuple[float, float, float], tuple[float, float, float]]
+    translation: tuple[float, float, float]
+    nd_ca_atoms: int
+    nd_atoms: int
+    nd_extent_u: float
+    nd_extent_v: float
+    margin: float
+    recommended_x: float
+    recommended_y: float
+
+
+def fit_patch_frame(patch: PdbAtomTable) -> tuple[MembraneFrame, int]:
+    """PCA of the patch lipid P atoms (the patch "midplane center"); returns (frame, n_p_atoms)."""
+    idx = patch.select(atomnames={"P"}, exclude_resnames=WATER_RESNAMES | ION_RESNAMES)
+    if len(idx) < 3:
+        raise ValueError(f"Not enough P atoms found in patch (found {len(idx)})")
+    return MembraneFrame.from_basis(pca_basis(patch.xyz[idx].tolist())), len(idx)
+
+
+def _nd_atom_indices(protein: PdbAtomTable, nd_chains: set[str]) -> np.ndarray:
+    # ATOM records only; chain IDs compared lower-case (see _parse_chain_list).
+    mask = (protein.record == "ATOM") & np.isin(np.char.lower(protein.chain), [c.lower() for c in nd_chains])
+    return np.flatnonzero(mask)
+
+
+def compute_placement(
+    protein: PdbAtomTable,
+    patch: PdbAtomTable,
     *,
-    exclude_resnames: set[str] | None = None,
-    exclude_water: bool = False,
-) -> tuple[int, MinMax]:
-    mm = MinMax()
-    atoms = 0
-    for resname, _atomname, x, y, z, _line in iter_pdb_atoms(pdb_path):
-        if exclude_resnames and resname in exclude_resnames:
-            continue
-        if exclude_water and resname in WATER_RESNAMES:
-            continue
-        atoms += 1
-        mm.update(x, y, z)
-    return atoms, mm
+    nd_chains: set[str],
+    frame: MembraneFrame | None = None,
+    patch_frame: tuple[MembraneFrame, int] | None = None,
+    no_rotate: bool = False,
+    margin: float = 25.0,
+) -> PatchPlacement:
+    """Compute the patch transform for a preloaded protein/patch pair.
+
+    `frame` is the membrane frame (e.g. from `load_reference_frame`); when None the plane
+    is fitted to the ND CA atoms of `protein`. Pass a precomputed `patch_frame` (from
+    `fit_patch_frame`) to reuse it across many proteins. Raises ValueError on too few atoms.
+    """
+    nd_idx = _nd_atom_indices(protein, nd_chains)
+    nd_ca = nd_idx[protein.atomname[nd_idx] == "CA"]
+    if len(nd_ca) < 3:
+        raise ValueError(
+            f"Not enough ND CA atoms to infer membrane orientation "
+            f"(chains={sorted(nd_chains)}; points={len(nd_ca)})."
+        )
+    if frame is None:
+        frame = MembraneFrame.from_basis(pca_basis(protein.xyz[nd_ca].tolist()))
+    patch_fr, n_p = patch_frame if patch_frame is not None else fit_patch_frame(patch)
 
+    u_ref, v_ref, n_ref = frame.u, frame.v, frame.n
+    if no_rotate:
+        r0, r1, r2 = (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)
+        rotated_patch_center = patch_fr.mean
+    else:
+        # Rotate patch so its normal matches the inferred membrane normal.
+        # We build a rotation that maps patch XYZ axes to (u_ref,v_ref,n_ref) in the current coordinate frame.
+        r0, r1, r2 = u_ref, v_ref, n_ref
+        rotated_patch_center = _mat_vec_mul_cols(r0, r1, r2, patch_fr.mean)
 
-def compute_p_points(
-    pdb_path: Path,
-    *,
-    lipid_resnames: set[str] | None = None,
-) -> list[tuple[float, float, float]]:
-    points: list[tuple[float, float, float]] = []
-    for resname, atomname, x, y, z, _line in iter_pdb_atoms(pdb_path):
-        if atomname != "P":
-            continue
-        if resname in WATER_RESNAMES or resname in ION_RESNAMES:
-            continue
-        if lipid_resnames is not None and resname not in lipid_resnames:
-            continue
-        points.append((x, y, z))
-    return points
+    # Center target:
+    # - in-plane center uses the ND bounding box center in the inferred membrane plane (u/v).
+    # - midplane (along n) is anchored to the inferred plane itself (n·x = constant).
+    pts = protein.xyz[nd_idx]
+    uu = pts @ np.asarray(u_ref)
+    vv = pts @ np.asarray(v_ref)
+    mins_u, maxs_u = float(uu.min()), float(uu.max())
+    mins_v, maxs_v = float(vv.min()), float(vv.max())
+    center_u = 0.5 * (mins_u + maxs_u)
+    center_v = 0.5 * (mins_v + maxs_v)
+    center_n = _dot(n_ref, frame.mean)
+    target_center = _add(_add(_scale(u_ref, center_u), _scale(v_ref, center_v)), _scale(n_ref, center_n))
+    t = _sub(target_center, rotated_patch_center)
 
+    nd_u = maxs_u - mins_u
+    nd_v = maxs_v - mins_v
+    return PatchPlacement(
+        frame=frame,
+        patch_frame=patch_fr,
+        patch_p_atoms=n_p,
+        rotated=not no_rotate,
+        rotation_cols=(r0, r1, r2),
+        translation=t,
+        nd_ca_atoms=len(nd_ca),
+        nd_atoms=len(nd_idx),
+        nd_extent_u=nd_u,
+        nd_extent_v=nd_v,
+        margin=float(margin),
+        recommended_x=nd_u + 2.0 * float(margin),
+        recommended_y=nd_v + 2.0 * float(margin),
+    )
 
-def compute_resname_points(
-    pdb_path: Path,
-    *,
-    resnames: set[str],
-) -> list[tuple[float, float, float]]:
-    points: list[tuple[float, float, float]] = []
-    for resname, _atomname, x, y, z, _line in iter_pdb_atoms(pdb_path):
-        if resname in resnames:
-            points.append((x, y, z))
-    return points
 
+def transform_coordinates(xyz: np.ndarray, placement: PatchPlacement) -> np.ndarray:
+    """Apply a placement to (n, 3) coordinates (same operation order as `_mat_vec_mul_cols`)."""
+    c0, c1, c2 = placement.rotation_cols
+    t = placement.translation
+    x = xyz[:, 0]
+    y = xyz[:, 1]
+    z = xyz[:, 2]
+    out = np.empty_like(xyz, dtype=np.float64)
+    out[:, 0] = (c0[0] * x + c1[0] * y + c2[0] * z) + t[0]
+    out[:, 1] = (c0[1] * x + c1[1] * y + c2[1] * z) + t[1]
+    out[:, 2] = (c0[2] * x + c1[2] * y + c2[2] * z) + t[2]
+    return out
 
-def transform_pdb(
-    *,
-    in_pdb: Path,
+
+def write_placed_patch(
     out_pdb: Path,
-    r_col0: tuple[float, float, float],
-    r_col1: tuple[float, float, float],
-    r_col2: tuple[float, float, float],
-    t: tuple[float, float, float],
-    strip_waters: bool,
+    patch: PdbAtomTable,
+    placement: PatchPlacement,
+    *,
+    strip_waters: bool = False,
 ) -> int:
-    written_atoms = 0
-    with in_pdb.open("r", encoding="utf-8", errors="ignore") as fin, out_pdb.open(
-        "w", encoding="utf-8", newline="\n"
-    ) as fout:
-        for line in fin:
-            if line.startswith("ATOM") or line.startswith("HETATM"):
-                if len(line) < 54:
-                    continue
-                resname = line[17:21].strip().upper()
-                if strip_waters and resname in WATER_RESNAMES:
-                    continue
-                try:
-                    x0 = float(line[30:38])
-                    y0 = float(line[38:46])
-                    z0 = float(line[46:54])
-                except ValueError:
-                    continue
-
-                x1, y1, z1 = _mat_vec_mul_cols(r_col0, r_col1, r_col2, (x0, y0, z0))
-                x = x1 + t[0]
-                y = y1 + t[1]
-                z = z1 + t[2]
-
-                # Keep everything else unchanged (occupancy/B-factor/segname/element...).
-                fout.write(f"{line[:30]}{x:8.3f}{y:8.3f}{z:8.3f}{line[54:]}")
-                if not line.endswith("\n"):
-                    fout.write("\n")
-                written_atoms += 1
-            else:
-                fout.write(line)
-                if not line.endswith("\n"):
-                    fout.write("\n")
-
-    return written_atoms
-
+    """Write the transformed patch; returns atoms written.
 
-def _parse_chain_list(chains: str) -> set[str]:
-    parts: list[str] = []
-    for part in chains.replace(",", " ").split():
-        part = part.strip()
-        if not part:
-            continue
-        parts.append(part.lower())
-    return set("".join(parts))
-
-
-def _parse_resname_list(values: Iterable[str]) -> set[str]:
-    out: set[str] = set()
-    for item in values:
-        for part in str(item).replace(";", ",").split(","):
-            part = part.strip()
-            if not part:
-                continue
-            out.add(part.upper())
-    return out
+    Everything but the coordinates (occupancy/B-factor/segname/element...) is kept unchanged,
+    and non-atom records (TER, CONECT, END, ...) are copied at their original positions.
+    """
+    keep = np.arange(len(patch))
+    if strip_waters:
+        keep = patch.select(exclude_resnames=WATER_RESNAMES)
+    xyz = transform_coordinates(patch.xyz[keep], placement).tolist()
+    other = patch.other_lines
+    k = 0
+    out_pdb.parent.mkdir(parents=True, exist_ok=True)
+    with out_pdb.open("w", encoding="utf-8", newline="\n") as fout:
+        for line in patch.header:
+            fout.write(line if line.endswith("\n") else line + "\n")
+        for i, (x, y, z) in zip(keep.tolist(), xyz):
+            while k < len(other) and other[k][0] <= i:
+                fout.write(other[k][1] if other[k][1].endswith("\n") else other[k][1] + "\n")
+                k += 1
+            line = patch.lines[i]
+            tail = line[54:] if line.endswith("\n") else line[54:] + "\n"
+            fout.write(f"{line[:30]}{x:8.3f}{y:8.3f}{z:8.3f}{tail}")
+        for _pos, line in other[k:]:
+            fout.write(line if line.endswith("\n") else line + "\n")
+        if not any(line.startswith("END") for _pos, line in other):
+            fout.write("END\n")
+    return int(len(keep))
+
+
+# Patch table shared by batch workers (set once per worker process by the pool initializer).
+_WORKER_PATCH: PdbAtomTable | None = None
+
+
+def _init_batch_worker(patch: PdbAtomTable) -> None:
+    global _WORKER_PATCH
+    _WORKER_PATCH = patch
+
+
+def _place_variant(task: dict) -> dict:
+    """Place the shared patch around one protein model and write it (batch worker)."""
+    protein_pdb = Path(task["protein_pdb"])
+    try:
+        placement = compute_placement(
+            read_pdb_atom_table(protein_pdb),
+            _WORKER_PATCH,
+            nd_chains=task["nd_chains"],
+            frame=task["frame"],
+            patch_frame=task["patch_frame"],
+            no_rotate=task["no_rotate"],
+            margin=task["margin"],
+        )
+    except ValueError as exc:
+        return {"protein_pdb": protein_pdb, "error": str(exc)}
+    written = write_placed_patch(Path(task["out_pdb"]), _WORKER_PATCH, placement, strip_waters=task["strip_waters"])
+    return {"protein_pdb": protein_pdb, "out_pdb": Path(task["out_pdb"]), "placement": placement, "written": written}
 
 
-def compute_chain_ca_points(pdb_path: Path, *, chains: set[str]) -> list[tuple[float, float, float]]:
-    points: list[tuple[float, float, float]] = []
-    with pdb_path.open("r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            if not line.startswith("ATOM"):
-                continue
-            if len(line) < 54:
-                continue
-            chain = line[21:22].strip().lower()
-            if chain not in chains:
-                continue
-            atomname = line[12:16].strip().upper()
-            if atomname != "CA":
-                continue
-            try:
-                x = float(line[30:38])
-                y = float(line[38:46])
-                z = float(line[46:54])
-            except ValueError:
-                continue
-            points.append((x, y, z))
-    return points
-
-
-def compute_chain_atom_points(pdb_path: Path, *, chains: set[str]) -> list[tuple[float, float, float]]:
-    points: list[tuple[float, float, float]] = []
-    with pdb_path.open("r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            if not line.startswith("ATOM"):
-                continue
-            if len(line) < 54:
-                continue
-            chain = line[21:22].strip().lower()
-            if chain not in chains:
-                continue
-            try:
-                x = float(line[30:38])
-                y = float(line[38:46])
-                z = float(line[46:54])
-            except ValueError:
-                continue
-            points.append((x, y, z))
-    return points
-
-
-def _median(values: list[float]) -> float:
-    if not values:
-        raise ValueError("median of empty list")
-    vs = sorted(values)
-    mid = len(vs) // 2
-    if len(vs) % 2 == 1:
-        return float(vs[mid])
-    return 0.5 * (float(vs[mid - 1]) + float(vs[mid]))
+def _batch_out_path(out_dir: Path, protein_pdb: Path, suffix: str) -> Path:
+    return out_dir / f"{protein_pdb.stem}{suffix}.pdb"
 
 
 def main() -> int:
@@ -425,12 +257,35 @@ def main() -> int:
         description=(
             "Rotate + translate a VMD membrane patch PDB into the coordinate frame of a Complex I model.\n\n"
             "By default, membrane orientation is inferred from PCA of lipid atoms in a reference model.\n"
-            "The patch is then centered on the ND footprint in that membrane plane.\n"
+            "The patch is then centered on the ND footprint in that membrane plane.\n\n"
+            "Batch mode: pass several --protein-pdb models (e.g. WT + variants) with --out-dir; the reference\n"
+            "plane and patch are fitted/parsed once and every variant is placed in parallel.\n"
         )
     )
-    ap.add_argument("--protein-pdb", required=True, help="Complex I PDB (protein-only or full system).")
+    ap.add_argument(
+        "--protein-pdb",
+        required=True,
+        nargs="+",
+        help="Complex I PDB (protein-only or full system). Several paths enable batch mode (requires --out-dir).",
+    )
     ap.add_argument("--patch-pdb", required=True, help="Membrane patch PDB produced by VMD membrane plugin.")
-    ap.add_argument("--out-pdb", required=True, help="Output placed membrane PDB path.")
+    ap.add_argument("--out-pdb", default=None, help="Output placed membrane PDB path (single protein).")
+    ap.add_argument(
+        "--out-dir",
+        default=None,
+        help="Batch output directory; writes <protein stem><--out-suffix>.pdb per protein.",
+    )
+    ap.add_argument(
+        "--out-suffix",
+        default="_membrane_placed",
+        help="File-name suffix for batch outputs (default: _membrane_placed).",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=0,
+        help="Worker processes for batch mode (default: min(#proteins, CPU count)).",
+    )
     ap.add_argument(
         "--plane-source",
         choices=["lipids", "nd"],
@@ -454,6 +309,16 @@ def main() -> int:
             "(can be provided multiple times). Default: CDL,PEE,PLX,DGT."
         ),
     )
+    ap.add_argument(
+        "--frame-cache",
+        default=None,
+        help=f"JSON cache of fitted reference frames (default: {CACHE_FILE_NAME} next to --reference-pdb).",
+    )
+    ap.add_argument(
+        "--no-frame-cache",
+        action="store_true",
+        help="Always refit the reference lipid plane (do not read or write the frame cache).",
+    )
     ap.add_argument(
         "--strip-waters",
         action="store_true",
@@ -477,121 +342,140 @@ def main() -> int:
     )
     args = ap.parse_args()
 
-    protein_pdb = Path(args.protein_pdb)
+    protein_pdbs = [Path(p) for p in args.protein_pdb]
     patch_pdb = Path(args.patch_pdb)
-    out_pdb = Path(args.out_pdb)
-
-    if not protein_pdb.exists():
-        raise SystemExit(f"Missing --protein-pdb: {protein_pdb}")
+    batch = len(protein_pdbs) > 1 or args.out_dir is not None
+
+    if batch and args.out_dir is None:
+        raise SystemExit("Several --protein-pdb paths given; pass --out-dir for batch outputs.")
+    if not batch and args.out_pdb is None:
+        raise SystemExit("Pass --out-pdb (single protein) or --out-dir (batch).")
+    for protein_pdb in protein_pdbs:
+        if not protein_pdb.exists():
+            raise SystemExit(f"Missing --protein-pdb: {protein_pdb}")
     if not patch_pdb.exists():
         raise SystemExit(f"Missing --patch-pdb: {patch_pdb}")
 
     nd_chains = _parse_chain_list(args.nd_chains)
-    nd_ca_points = compute_chain_ca_points(protein_pdb, chains=nd_chains)
-    if len(nd_ca_points) < 3:
-        raise SystemExit(
-            f"Not enough ND CA atoms to infer membrane orientation in {protein_pdb} "
-            f"(chains={sorted(nd_chains)}; points={len(nd_ca_points)})."
-        )
 
     # Infer membrane plane basis (u_ref, v_ref, n_ref) and a point on the plane.
+    # With --plane-source nd the plane depends on each protein and is fitted per variant.
     plane_source = str(args.plane_source).lower().strip()
-    plane_point: tuple[float, float, float]
-    ref_eigs: list[float]
-
+    frame: MembraneFrame | None = None
+    ref_lipids: set[str] = set()
+    cache_info = ""
     if plane_source == "lipids":
         ref_pdb = Path(args.reference_pdb)
         if not ref_pdb.exists():
             raise SystemExit(f"Missing --reference-pdb: {ref_pdb}")
 
         ref_lipids = set(DEFAULT_REFERENCE_LIPID_RESNAMES)
-        ref_lipids |= _parse_resname_list(args.reference_lipids)
-        ref_points = compute_resname_points(ref_pdb, resnames=ref_lipids)
-        if len(ref_points) < 3:
-            raise SystemExit(
-                f"Not enough reference lipid atoms to fit plane in {ref_pdb} "
-                f"(resnames={sorted(ref_lipids)}; atoms={len(ref_points)})."
+        ref_lipids |= parse_resname_list(args.reference_lipids)
+        try:
+            frame, cache_status = load_reference_frame(
+                ref_pdb,
+                ref_lipids,
+                cache_path=Path(args.frame_cache) if args.frame_cache else None,
+                use_cache=not args.no_frame_cache,
             )
+        except ValueError as exc:
+            raise SystemExit(f"{exc} Reference: {ref_pdb}")
+        cache_info = cache_status_text(cache_status)
+
+    # Patch: parsed once; its lipid phosphorus atoms define the patch "midplane center".
+    patch = read_pdb_atom_table(patch_pdb)
+    try:
+        patch_frame = fit_patch_frame(patch)
+    except ValueError as exc:
+        raise SystemExit(f"{exc}: {patch_pdb}")
+    patch_fr, n_patch_p = patch_frame
+
+    tasks = [
+        {
+            "protein_pdb": protein_pdb,
+            "out_pdb": (
+                _batch_out_path(Path(args.out_dir), protein_pdb, args.out_suffix) if batch else Path(args.out_pdb)
+            ),
+            "nd_chains": nd_chains,
+            "frame": frame,
+            "patch_frame": patch_frame,
+            "no_rotate": bool(args.no_rotate),
+            "strip_waters": bool(args.strip_waters),
+            "margin": float(args.margin),
+        }
+        for protein_pdb in protein_pdbs
+    ]
+    if batch:
+        # Output names come from the input stems; same-stem models from different folders would overwrite each other.
+        sources: dict[Path, Path] = {}
+        for task in tasks:
+            other = sources.setdefault(task["out_pdb"], task["protein_pdb"])
+            if other is not task["protein_pdb"]:
+                raise SystemExit(f"{other} and {task['protein_pdb']} would both write {task['out_pdb']}; rename one of the inputs.")
+
+    if not batch:
+        _init_batch_worker(patch)
+        result = _place_variant(tasks[0])
+        if "error" in result:
+            raise SystemExit(f"{result['error']} Protein: {result['protein_pdb']}")
+        pl: PatchPlacement = result["placement"]
+        n_ref = pl.frame.n
+        t = pl.translation
+
+        print(f"Protein: {protein_pdbs[0]}")
+        print(f"Patch:   {patch_pdb}")
+        print(f"ND chains:     {','.join(sorted(nd_chains))}  (CA atoms: {pl.nd_ca_atoms})")
+        print(f"Plane source:  {plane_source}")
+        if plane_source == "lipids":
+            print(f"Reference PDB: {Path(args.reference_pdb)}")
+            print(f"Ref lipids:    {','.join(sorted(ref_lipids))}")
+            print(f"Frame cache:   {cache_info}")
+        print(f"Plane eigvals: {', '.join(f'{x:.6f}' for x in pl.frame.eigenvalues)}")
+        print(f"Patch P atoms: {pl.patch_p_atoms}")
+        print(f"Patch eigvals: {', '.join(f'{x:.6f}' for x in pl.patch_frame.eigenvalues)}")
+        print(f"Plane normal:  nx={n_ref[0]:.6f} ny={n_ref[1]:.6f} nz={n_ref[2]:.6f}")
+        print(f"Rotation:      {'enabled' if pl.rotated else 'disabled'}")
+        print(f"Translate (A): dX={t[0]:.3f} dY={t[1]:.3f} dZ={t[2]:.3f}")
+        print(
+            f"Recommended patch (A): x={pl.recommended_x:.3f} y={pl.recommended_y:.3f}  "
+            f"(margin={pl.margin:.1f}/side; ND-only)"
+        )
+        print(f"Wrote: {result['out_pdb']}  (atoms: {result['written']})")
+        return 0
 
-        plane_point, u_ref, v_ref, n_ref, ref_eigs = _pca_basis(ref_points)
-    else:
-        plane_point, u_ref, v_ref, n_ref, ref_eigs = _pca_basis(nd_ca_points)
-
-    # Patch: use its lipid phosphorus atoms as the patch "midplane center".
-    patch_p_points = compute_p_points(patch_pdb, lipid_resnames=None)
-    if len(patch_p_points) < 3:
-        raise SystemExit(f"Not enough P atoms found in patch: {patch_pdb} (found {len(patch_p_points)})")
-    patch_plane_point, u_patch, v_patch, n_patch, patch_eigs = _pca_basis(patch_p_points)
-
-    if args.no_rotate:
-        r0, r1, r2 = (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)
-        rotated_patch_center = patch_plane_point
-    else:
-        # Rotate patch so its normal matches the inferred membrane normal.
-        # We build a rotation that maps patch XYZ axes to (u_ref,v_ref,n_ref) in the current coordinate frame.
-        r0, r1, r2 = u_ref, v_ref, n_ref
-        rotated_patch_center = _mat_vec_mul_cols(r0, r1, r2, patch_plane_point)
-
-    # Center target:
-    # - in-plane center uses the ND bounding box center in the inferred membrane plane (u/v).
-    # - midplane (along n) is anchored to the inferred plane itself (n·x = constant).
-    nd_all_points = compute_chain_atom_points(protein_pdb, chains=nd_chains)
-    mins_u = math.inf
-    maxs_u = -math.inf
-    mins_v = math.inf
-    maxs_v = -math.inf
-    for p in nd_all_points:
-        uu = _dot(u_ref, p)
-        vv = _dot(v_ref, p)
-        mins_u = min(mins_u, uu)
-        maxs_u = max(maxs_u, uu)
-        mins_v = min(mins_v, vv)
-        maxs_v = max(maxs_v, vv)
-
-    center_u = 0.5 * (mins_u + maxs_u)
-    center_v = 0.5 * (mins_v + maxs_v)
-    center_n = _dot(n_ref, plane_point)
-    target_center = _add(_add(_scale(u_ref, center_u), _scale(v_ref, center_v)), _scale(n_ref, center_n))
-
-    t = _sub(target_center, rotated_patch_center)
-
-    out_pdb.parent.mkdir(parents=True, exist_ok=True)
-    written = transform_pdb(
-        in_pdb=patch_pdb,
-        out_pdb=out_pdb,
-        r_col0=r0,
-        r_col1=r1,
-        r_col2=r2,
-        t=t,
-        strip_waters=bool(args.strip_waters),
-    )
-
-    # Report recommended patch size in the inferred membrane plane.
-    nd_u = maxs_u - mins_u
-    nd_v = maxs_v - mins_v
-    rec_x = nd_u + 2.0 * float(args.margin)
-    rec_y = nd_v + 2.0 * float(args.margin)
+    jobs = int(args.jobs) if args.jobs and args.jobs > 0 else min(len(tasks), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker, initargs=(patch,)) as pool:
+        results = list(pool.map(_place_variant, tasks))
 
-    print(f"Protein: {protein_pdb}")
-    print(f"Patch:   {patch_pdb}")
-    print(f"ND chains:     {','.join(sorted(nd_chains))}  (CA atoms: {len(nd_ca_points)})")
+    eigs = ", ".join(f"{x:.3f}" for x in patch_fr.eigenvalues)
+    print(f"Patch:   {patch_pdb}  (P atoms: {n_patch_p}; eigvals: {eigs})")
+    print(f"ND chains:     {','.join(sorted(nd_chains))}")
     print(f"Plane source:  {plane_source}")
-    if plane_source == "lipids":
-        ref_pdb = Path(args.reference_pdb)
-        ref_lipids = set(DEFAULT_REFERENCE_LIPID_RESNAMES)
-        ref_lipids |= _parse_resname_list(args.reference_lipids)
-        print(f"Reference PDB: {ref_pdb}")
-        print(f"Ref lipids:    {','.join(sorted(ref_lipids))}")
-    print(f"Plane eigvals: {', '.join(f'{x:.6f}' for x in ref_eigs)}")
-    print(f"Patch P atoms: {len(patch_p_points)}")
-    print(f"Patch eigvals: {', '.join(f'{x:.6f}' for x in patch_eigs)}")
-    print(f"Plane normal:  nx={n_ref[0]:.6f} ny={n_ref[1]:.6f} nz={n_ref[2]:.6f}")
+    if frame is not None:
+        print(f"Reference PDB: {Path(args.reference_pdb)}  (lipids: {','.join(sorted(ref_lipids))})")
+        print(f"Frame cache:   {cache_info}")
+        n_ref = frame.n
+        print(f"Plane normal:  nx={n_ref[0]:.6f} ny={n_ref[1]:.6f} nz={n_ref[2]:.6f}")
     print(f"Rotation:      {'disabled' if args.no_rotate else 'enabled'}")
-    print(f"Translate (A): dX={t[0]:.3f} dY={t[1]:.3f} dZ={t[2]:.3f}")
-    print(f"Recommended patch (A): x={rec_x:.3f} y={rec_y:.3f}  (margin={float(args.margin):.1f}/side; ND-only)")
-    print(f"Wrote: {out_pdb}  (atoms: {written})")
-
-    return 0
+    print(f"Variants:      {len(results)}  (jobs: {jobs}; margin={float(args.margin):.1f}/side; ND-only)")
+    print(f"{'protein':<44} {'CA':>5} {'dX':>9} {'dY':>9} {'dZ':>9} {'rec_x':>8} {'rec_y':>8} {'atoms':>8}")
+    failed = 0
+    for r in results:
+        name = Path(r["protein_pdb"]).name
+        if "error" in r:
+            failed += 1
+            print(f"{name:<44} ERROR: {r['error']}")
+            continue
+        pl = r["placement"]
+        t = pl.translation
+        print(
+            f"{name:<44} {pl.nd_ca_atoms:>5d} {t[0]:>9.3f} {t[1]:>9.3f} {t[2]:>9.3f} "
+            f"{pl.recommended_x:>8.3f} {pl.recommended_y:>8.3f} {r['written']:>8d}"
+        )
+    for r in results:
+        if "error" not in r:
+            print(f"Wrote: {r['out_pdb']}")
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
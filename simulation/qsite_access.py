@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from cell_list import CellList
+from dcd_reader import DcdChunk, DcdTrajectory, add_frame_range_args, check_atom_count, map_chunks
+from pdb_atom_table import PdbAtomTable, parse_resname_list, read_pdb_atom_table
+from place_membrane_patch import WATER_RESNAMES
+
+
+DEFAULT_SITE_RESNAMES = {"8Q1"}
+# Molecular oxygen residue names used by CHARMM/NAMD setups (CGenFF "OXY", PDB "OXY"/"O2").
+DEFAULT_O2_RESNAMES = {"OXY", "O2", "OXYG"}
+DEFAULT_RADII = (3.5, 5.0, 8.0)
+
+SPECIES = ("water", "o2")
+
+
+@dataclass(frozen=True)
+class QSiteSelection:
+    """Atoms of one system taking part in the Q-site counts (fixed for the run).
+
+    `atoms` is the DCD atom selection read per chunk: the site atoms first, then the
+    solvent atoms (water oxygens, then O2 atoms). `molecule` maps each solvent atom to a
+    molecule index; molecules [0, n_water) are waters, [n_water, n_water + n_o2) are O2.
+    """
+
+    atoms: np.ndarray
+    n_site: int
+    molecule: np.ndarray
+    n_water: int
+    n_o2: int
+    radii: tuple[float, ...]
+    residence_radius: float
+
+
+def _molecule_index(system: PdbAtomTable, atoms: np.ndarray) -> np.ndarray:
+    # Compact 0-based molecule index per atom from the residue ids.
+    _uniq, inv = np.unique(system.residue_ids()[atoms], return_inverse=True)
+    return inv.reshape(-1).astype(np.int64)
+
+
+def select_qsite_atoms(
+    system: PdbAtomTable,
+    *,
+    site_resnames: set[str],
+    site_chains: set[str] | None = None,
+    o2_resnames: set[str],
+    radii: tuple[float, ...],
+    residence_radius: float,
+) -> QSiteSelection:
+    """Pick the site heavy atoms, water oxygens and O2 atoms of `system` once."""
+    site = system.select(resnames=site_resnames, chains=site_chains, heavy_only=True)
+    if len(site) == 0:
+        raise ValueError(f"No site atoms found (resnames={sorted(site_resnames)})")
+    water = system.select(resnames=WATER_RESNAMES)
+    water = water[system.element[water] == "O"]
+    o2 = system.select(resnames=o2_resnames)
+    water_mol = _molecule_index(system, water)
+    o2_mol = _molecule_index(system, o2)
+    n_water = int(water_mol.max()) + 1 if len(water_mol) else 0
+    n_o2 = int(o2_mol.max()) + 1 if len(o2_mol) else 0
+    return QSiteSelection(
+        atoms=np.concatenate([site, water, o2]),
+        n_site=len(site),
+        molecule=np.concatenate([water_mol, o2_mol + n_water]),
+        n_water=n_water,
+        n_o2=n_o2,
+        radii=tuple(sorted(radii)),
+        residence_radius=float(residence_radius),
+    )
+
+
+def qsite_chunk(chunk: DcdChunk, sel: QSiteSelection) -> dict[str, np.ndarray]:
+    """Per-frame water/O2 molecule counts within each radius of the site atoms.
+
+    Each frame only indexes the solvent atoms inside the site bounding box grown by the
+    largest radius; a cell list over those answers the site-atom queries. Also returns
+    the (frame position, molecule) pairs inside `residence_radius` for residence times.
+    """
+    xyz = chunk.xyz
+    site_xyz = np.asarray(xyz[:, : sel.n_site], dtype=np.float64)
+    solvent_xyz = xyz[:, sel.n_site :]
+    r_max = max(sel.radii)
+    lo = site_xyz.min(axis=1) - r_max
+    hi = site_xyz.max(axis=1) + r_max
+    in_box = np.all((solvent_xyz >= lo[:, None, :]) & (solvent_xyz <= hi[:, None, :]), axis=2)
+
+    n_mol = sel.n_water + sel.n_o2
+    radii = np.asarray(sel.radii)
+    counts = np.zeros((len(chunk), len(SPECIES), len(radii)), dtype=np.int64)
+    inside_frame: list[np.ndarray] = []
+    inside_mol: list[np.ndarray] = []
+    for f in range(len(chunk)):
+        local = np.flatnonzero(in_box[f])
+        if len(local) == 0:
+            continue
+        index = CellList(solvent_xyz[f, local], cell_size=r_max)
+        _qi, pj, d2 = index.query_pairs(site_xyz[f], r_max)
+        if len(pj) == 0:
+            continue
+        # Closest approach of each molecule to any site atom.
+        nearest = np.full(n_mol, np.inf)
+        np.minimum.at(nearest, sel.molecule[local[pj]], d2)
+        hit = np.flatnonzero(np.isfinite(nearest))
+        dist = np.sqrt(nearest[hit])
+        is_o2 = hit >= sel.n_water
+        within = dist[:, None] <= radii[None, :]
+        counts[f, 0] = within[~is_o2].sum(axis=0)
+        counts[f, 1] = within[is_o2].sum(axis=0)
+        res = hit[dist <= sel.residence_radius]
+        inside_frame.append(np.full(len(res), f, dtype=np.int64))
+        inside_mol.append(res)
+
+    frames = np.asarray(chunk.frames, dtype=np.int64)
+    if inside_frame:
+        pos = np.concatenate(inside_frame)
+        mol = np.concatenate(inside_mol)
+    else:
+        pos = mol = np.zeros(0, dtype=np.int64)
+    return {"frame": frames, "counts": counts, "inside_frame": frames[pos], "inside_mol": mol}
+
+
+def residence_runs(frame_pos: np.ndarray, molecule: np.ndarray) -> np.ndarray:
+    """Lengths (in analysed frames) of uninterrupted stays of each molecule.
+
+    `frame_pos` are consecutive 0-based positions in the analysed frame sequence; a stay
+    ends when the molecule is absent for one analysed frame. Stays cut by the end of the
+    trajectory count with their observed length.
+    """
+    if len(frame_pos) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort((frame_pos, molecule))
+    f = frame_pos[order]
+    m = molecule[order]
+    new_run = np.ones(len(f), dtype=bool)
+    new_run[1:] = (m[1:] != m[:-1]) | (f[1:] != f[:-1] + 1)
+    starts = np.flatnonzero(new_run)
+    return np.diff(np.append(starts, len(f)))
+
+
+@dataclass
+class QSiteResult:
+    label: str
+    frames: np.ndarray
+    time_ps: np.ndarray
+    counts: np.ndarray  # (frames, species, radii)
+    runs: dict[str, np.ndarray]  # species -> stay lengths in frames
+    frame_dt_ps: float
+    radii: tuple[float, ...]
+    residence_radius: float
+
+
+def analyze_qsite(
+    label: str,
+    dcd: Path,
+    sel: QSiteSelection,
+    *,
+    start: int = 0,
+    stop: int | None = None,
+    stride: int = 1,
+    chunk_size: int = 200,
+    jobs: int = 0,
+) -> QSiteResult:
+    parts = list(
+        map_chunks(
+            dcd,
+            qsite_chunk,
+            sel,
+            chunk_size=chunk_size,
+            start=start,
+            stop=stop,
+            stride=stride,
+            atoms=sel.atoms,
+            jobs=jobs,
+        )
+    )
+    if not parts:
+        raise ValueError(f"No frames selected from {dcd}")
+    frames = np.concatenate([p["frame"] for p in parts])
+    counts = np.concatenate([p["counts"] for p in parts])
+    # Frame numbers -> positions in the analysed sequence (start + k * stride).
+    inside_pos = (np.concatenate([p["inside_frame"] for p in parts]) - frames[0]) // stride
+    inside_mol = np.concatenate([p["inside_mol"] for p in parts])
+    is_o2 = inside_mol >= sel.n_water
+    with DcdTrajectory(dcd) as traj:
+        time_ps = traj.times_ps(frames)
+        dt = traj.header.timestep_ps * stride
+    return QSiteResult(
+        label=label,
+        frames=frames,
+        time_ps=time_ps,
+        counts=counts,
+        runs={
+            "water": residence_runs(inside_pos[~is_o2], inside_mol[~is_o2]),
+            "o2": residence_runs(inside_pos[is_o2], inside_mol[is_o2]),
+        },
+        frame_dt_ps=dt,
+        radii=sel.radii,
+        residence_radius=sel.residence_radius,
+    )
+
+
+def _radius_tag(r: float) -> str:
+    return f"{r:g}"
+
+
+def write_counts(path: Path, result: QSiteResult) -> None:
+    """Per-frame CSV: frame,time_ps,water_r<R>...,o2_r<R>..."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    names = [f"{s}_r{_radius_tag(r)}" for s in SPECIES for r in result.radii]
+    table = np.column_stack([result.frames, result.time_ps, result.counts.reshape(len(result.frames), -1)])
+    fmt = ["%d", "%.3f"] + ["%d"] * len(names)
+    np.savetxt(path, table, fmt=fmt, delimiter=",", header=",".join(["frame", "time_ps", *names]), comments="")
+
+
+SUMMARY_COLUMNS = (
+    "system",
+    "species",
+    "radius",
+    "mean_count",
+    "occupancy",
+    "events",
+    "mean_residence_ps",
+    "median_residence_ps",
+    "max_residence_ps",
+)
+
+
+def summary_rows(result: QSiteResult) -> list[list[str]]:
+    """Mean count and occupancy (fraction of frames with >= 1 molecule) per species/radius;
+    residence-time statistics at the residence radius."""
+    rows: list[list[str]] = []
+    for s, species in enumerate(SPECIES):
+        stays = result.runs[species] * result.frame_dt_ps
+        for r, radius in enumerate(result.radii):
+            c = result.counts[:, s, r]
+            row = [result.label, species, _radius_tag(radius), f"{c.mean():.3f}", f"{(c > 0).mean():.4f}"]
+            if radius == result.residence_radius and len(stays):
+                row += [str(len(stays)), f"{stays.mean():.3f}", f"{np.median(stays):.3f}", f"{stays.max():.3f}"]
+            else:
+                row += ["0" if radius == result.residence_radius else "", "", "", ""]
+            rows.append(row)
+    return rows
+
+
+def _parse_radii(text: str) -> tuple[float, ...]:
+    radii = tuple(float(x) for x in text.replace(";", ",").split(",") if x.strip())
+    if not radii or min(radii) <= 0.0:
+        raise SystemExit("--radii must be a comma-separated list of positive distances")
+    return radii
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=(
+            "Q-site hydration and O2 access over NAMD DCD trajectories (WT vs variants).\n\n"
+            "For every frame, counts water molecules (oxygens) and O2 molecules with any atom within each\n"
+            "--radii distance of the site ligand heavy atoms (default resname 8Q1). Only solvent inside the\n"
+            "site box (+ largest radius) is put into a per-frame cell list. Frames run in parallel chunks.\n"
+            "Residence times are the uninterrupted stays of each molecule within --residence-radius.\n"
+        )
+    )
+    ap.add_argument(
+        "--system",
+        nargs=3,
+        action="append",
+        required=True,
+        metavar=("LABEL", "PDB", "DCD"),
+        help="System label, PDB (same atoms/order as the DCD) and DCD; repeat for WT, ND6_M64V, ...",
+    )
+    ap.add_argument("--out-dir", required=True, help="Output directory for <label>_qsite_counts.csv and qsite_summary.csv.")
+    ap.add_argument(
+        "--site-resnames",
+        action="append",
+        default=[],
+        help="Comma-separated residue names of the site ligand (default: 8Q1).",
+    )
+    ap.add_argument("--site-chains", default=None, help="Comma-separated chain IDs to restrict the site ligand (case-sensitive).")
+    ap.add_argument(
+        "--o2-resnames",
+        action="append",
+        default=[],
+        help=f"Comma-separated O2 residue names (default: {','.join(sorted(DEFAULT_O2_RESNAMES))}).",
+    )
+    ap.add_argument(
+        "--radii",
+        default=",".join(f"{r:g}" for r in DEFAULT_RADII),
+        help=f"Comma-separated count radii in A (default: {','.join(f'{r:g}' for r in DEFAULT_RADII)}).",
+    )
+    ap.add_argument(
+        "--residence-radius",
+        type=float,
+        default=None,
+        help="Radius (one of --radii) for residence-time statistics (default: the smallest).",
+    )
+    add_frame_range_args(ap, chunk_size=200)
+    args = ap.parse_args()
+
+    radii = _parse_radii(args.radii)
+    residence_radius = min(radii) if args.residence_radius is None else float(args.residence_radius)
+    if residence_radius not in radii:
+        raise SystemExit(f"--residence-radius {residence_radius:g} is not one of --radii")
+    site_resnames = parse_resname_list(args.site_resnames) if args.site_resnames else set(DEFAULT_SITE_RESNAMES)
+    o2_resnames = parse_resname_list(args.o2_resnames) if args.o2_resnames else set(DEFAULT_O2_RESNAMES)
+    site_chains = {c.strip() for c in args.site_chains.split(",") if c.strip()} if args.site_chains else None
+    out_dir = Path(args.out_dir)
+
+    results: list[QSiteResult] = []
+    for label, pdb, dcd in args.system:
+        dcd_path = Path(dcd)
+        if not dcd_path.exists():
+            raise SystemExit(f"Missing DCD for {label}: {dcd_path}")
+        system = read_pdb_atom_table(Path(pdb))
+        try:
+            with DcdTrajectory(dcd_path) as traj:
+                check_atom_count(traj, pdb, len(system))
+            sel = select_qsite_atoms(
+                system,
+                site_resnames=site_resnames,
+                site_chains=site_chains,
+                o2_resnames=o2_resnames,
+                radii=radii,
+                residence_radius=residence_radius,
+            )
+            result = analyze_qsite(
+                label,
+                dcd_path,
+                sel,
+                start=args.start,
+                stop=args.stop,
+                stride=args.stride,
+                chunk_size=args.chunk_size,
+                jobs=args.jobs,
+            )
+        except ValueError as exc:
+            raise SystemExit(f"{label}: {exc}")
+        write_counts(out_dir / f"{label}_qsite_counts.csv", result)
+        results.append(result)
+        print(
+            f"{label}: {dcd_path}  (frames: {len(result.frames)}; site atoms: {sel.n_site}; "
+            f"waters: {sel.n_water}; O2: {sel.n_o2})"
+        )
+
+    rows = [row for r in results for row in summary_rows(r)]
+    summary = out_dir / "qsite_summary.csv"
+    summary.write_text("\n".join(",".join(r) for r in [list(SUMMARY_COLUMNS), *rows]) + "\n", encoding="utf-8")
+
+    print(f"Radii (A):     {', '.join(_radius_tag(r) for r in radii)}  (residence: {_radius_tag(residence_radius)})")
+    print(f"{'system':<14} {'species':<6} {'r':>5} {'mean':>8} {'occ':>7} {'events':>7} {'mean_ps':>9} {'max_ps':>9}")
+    for row in rows:
+        label, species, r, mean, occ, events, mean_ps, _median_ps, max_ps = row
+        print(f"{label:<14} {species:<6} {r:>5} {mean:>8} {occ:>7} {events:>7} {mean_ps:>9} {max_ps:>9}")
+    for r in results:
+        print(f"Wrote: {out_dir / f'{r.label}_qsite_counts.csv'}")
+    print(f"Wrote: {summary}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
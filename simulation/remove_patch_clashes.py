@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import argparse
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from cell_list import CellList
+from pdb_atom_table import PdbAtomTable, parse_resname_list, read_pdb_atom_table, write_pdb_subset
+from place_membrane_patch import ION_RESNAMES, WATER_RESNAMES
+
+
+def find_clashing_residues(
+    protein: PdbAtomTable,
+    patch: PdbAtomTable,
+    *,
+    cutoff: float,
+    water_cutoff: float | None = None,
+    protein_exclude_resnames: set[str] | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Flag patch residues with any atom within `cutoff` of a protein heavy atom.
+
+    Returns (residue_ids, clash_mask_per_residue) where residue_ids is the per-atom
+    residue index of `patch` (see `PdbAtomTable.residue_ids`). Waters use `water_cutoff`
+    when given, so solvent can be cleared with a wider shell than lipids.
+    """
+    exclude = (WATER_RESNAMES | ION_RESNAMES) if protein_exclude_resnames is None else protein_exclude_resnames
+    protein_idx = protein.select(exclude_resnames=exclude, heavy_only=True)
+    if len(protein_idx) == 0:
+        raise ValueError("No protein heavy atoms to test against")
+
+    w_cut = cutoff if water_cutoff is None else water_cutoff
+    max_cut = max(cutoff, w_cut)
+    index = CellList(protein.xyz[protein_idx], cell_size=max_cut)
+
+    atom_cut = np.where(np.isin(patch.resname, list(WATER_RESNAMES)), w_cut, cutoff)
+    qi, _pj, d2 = index.query_pairs(patch.xyz, max_cut)
+    hit = d2 <= atom_cut[qi] ** 2
+
+    residue_ids = patch.residue_ids()
+    n_res = int(residue_ids[-1]) + 1 if len(residue_ids) else 0
+    clash = np.zeros(n_res, dtype=bool)
+    clash[residue_ids[qi[hit]]] = True
+    return residue_ids, clash
+
+
+def _count_residues_by_resname(patch: PdbAtomTable, residue_ids: np.ndarray, residue_mask: np.ndarray) -> Counter:
+    # First atom of each residue carries the residue name.
+    first_atom = np.flatnonzero(np.diff(residue_ids, prepend=-1))
+    names = patch.resname[first_atom][residue_mask]
+    return Counter(str(n) for n in names)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=(
+            "Remove membrane-patch residues (lipids/waters/ions) that clash with a Complex I model.\n\n"
+            "Builds a uniform cell list over protein heavy atoms and drops every patch residue with any\n"
+            "atom within --cutoff of it. Replaces the separate VMD 'delete ... within' step after\n"
+            "place_membrane_patch.py.\n"
+        )
+    )
+    ap.add_argument("--protein-pdb", required=True, help="Complex I PDB (protein-only or full system).")
+    ap.add_argument("--patch-pdb", required=True, help="Placed membrane patch PDB (output of place_membrane_patch.py).")
+    ap.add_argument("--out-pdb", required=True, help="Output pruned membrane PDB path.")
+    ap.add_argument("--cutoff", type=float, default=2.0, help="Clash distance in A for lipids/ions (default: 2.0).")
+    ap.add_argument(
+        "--water-cutoff",
+        type=float,
+        default=None,
+        help="Clash distance in A for water residues (default: same as --cutoff).",
+    )
+    ap.add_argument(
+        "--protein-exclude-resnames",
+        action="append",
+        default=[],
+        help=(
+            "Comma-separated residue names in --protein-pdb that do not count as clash partners "
+            "(can be provided multiple times). Default: waters and ions."
+        ),
+    )
+    args = ap.parse_args()
+
+    protein_pdb = Path(args.protein_pdb)
+    patch_pdb = Path(args.patch_pdb)
+    out_pdb = Path(args.out_pdb)
+    if not protein_pdb.exists():
+        raise SystemExit(f"Missing --protein-pdb: {protein_pdb}")
+    if not patch_pdb.exists():
+        raise SystemExit(f"Missing --patch-pdb: {patch_pdb}")
+    if args.cutoff <= 0.0 or (args.water_cutoff is not None and args.water_cutoff <= 0.0):
+        raise SystemExit("Cutoffs must be positive.")
+
+    exclude = set(WATER_RESNAMES) | set(ION_RESNAMES)
+    exclude |= parse_resname_list(args.protein_exclude_resnames)
+
+    protein = read_pdb_atom_table(protein_pdb)
+    patch = read_pdb_atom_table(patch_pdb)
+    if len(patch) == 0:
+        raise SystemExit(f"No atoms found in patch: {patch_pdb}")
+
+    try:
+        residue_ids, clash = find_clashing_residues(
+            protein,
+            patch,
+            cutoff=float(args.cutoff),
+            water_cutoff=args.water_cutoff,
+            protein_exclude_resnames=exclude,
+        )
+    except ValueError as exc:
+        raise SystemExit(f"{exc} in {protein_pdb}")
+
+    keep_atoms = np.flatnonzero(~clash[residue_ids])
+    written = write_pdb_subset(out_pdb, patch, keep_atoms)
+
+    removed = _count_residues_by_resname(patch, residue_ids, clash)
+    kept = _count_residues_by_resname(patch, residue_ids, ~clash)
+
+    w_cut = args.cutoff if args.water_cutoff is None else args.water_cutoff
+    print(f"Protein: {protein_pdb}")
+    print(f"Patch:   {patch_pdb}")
+    print(f"Cutoff (A):    {float(args.cutoff):.2f}  (waters: {float(w_cut):.2f})")
+    print(f"Residues:      {len(clash)} in patch, {int(clash.sum())} removed, {int((~clash).sum())} kept")
+    for resname in sorted(set(removed) | set(kept)):
+        print(f"  {resname:<5} removed={removed.get(resname, 0):<7d} kept={kept.get(resname, 0)}")
+    print(f"Wrote: {out_pdb}  (atoms: {written})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
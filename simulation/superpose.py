@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from dcd_reader import DcdChunk, DcdTrajectory, add_frame_range_args, check_atom_count, map_chunks
+from pdb_atom_table import PdbAtomTable, parse_name_list, parse_resname_list, read_pdb_atom_table
+
+
+def kabsch_rotations(
+    mobile: np.ndarray,
+    reference: np.ndarray,
+    weights: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Optimal rotations superposing a stack of frames onto one reference (batched Kabsch).
+
+    `mobile` is (frames, n, 3), `reference` (n, 3). Returns (rotations (frames, 3, 3),
+    mobile_centers (frames, 3), reference_center (3,)) such that
+    `(mobile[f] - mobile_centers[f]) @ rotations[f] + reference_center` is the best fit of
+    frame f. All 3x3 covariances are built with one einsum and decomposed with one
+    stacked SVD; a determinant sign flip excludes reflections.
+    """
+    mobile = np.asarray(mobile, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    if mobile.ndim == 2:
+        mobile = mobile[None]
+    if mobile.shape[1:] != reference.shape or reference.shape[-1] != 3:
+        raise ValueError(f"Shape mismatch: mobile {mobile.shape} vs reference {reference.shape}")
+    if weights is None:
+        w = np.full(len(reference), 1.0 / len(reference))
+    else:
+        w = np.asarray(weights, dtype=np.float64)
+        w = w / w.sum()
+    ref_center = w @ reference
+    mob_centers = np.einsum("n,fni->fi", w, mobile)
+    ref_c = reference - ref_center
+    cov = np.einsum("n,fni,nj->fij", w, mobile - mob_centers[:, None, :], ref_c)
+    u, _s, vt = np.linalg.svd(cov)
+    d = np.sign(np.linalg.det(u @ vt))
+    d[d == 0.0] = 1.0
+    u[:, :, 2] *= d[:, None]
+    return u @ vt, mob_centers, ref_center
+
+
+def apply_superposition(
+    xyz: np.ndarray,
+    rotations: np.ndarray,
+    mobile_centers: np.ndarray,
+    reference_center: np.ndarray,
+) -> np.ndarray:
+    """Move (frames, m, 3) coordinates with the transforms from `kabsch_rotations`."""
+    moved = np.matmul(np.asarray(xyz, dtype=np.float64) - mobile_centers[:, None, :], rotations)
+    moved += reference_center
+    return moved
+
+
+def fitted_rmsd(mobile: np.ndarray, reference: np.ndarray, weights: np.ndarray | None = None) -> np.ndarray:
+    """Per-frame RMSD after optimal superposition of (frames, n, 3) onto (n, 3)."""
+    rotations, centers, ref_center = kabsch_rotations(mobile, reference, weights)
+    moved = apply_superposition(mobile if np.ndim(mobile) == 3 else mobile[None], rotations, centers, ref_center)
+    d2 = ((moved - np.asarray(reference, dtype=np.float64)) ** 2).sum(axis=2)
+    if weights is None:
+        return np.sqrt(d2.mean(axis=1))
+    w = np.asarray(weights, dtype=np.float64)
+    return np.sqrt(d2 @ (w / w.sum()))
+
+
+@dataclass
+class PositionMoments:
+    """Running count, mean position and summed squared deviation of a set of atoms.
+
+    Chunks (or workers) are reduced independently with `from_frames` and combined with
+    `merge` (pairwise update of Chan et al.), so RMSF over any number of frames needs one
+    pass and memory for two (n_atoms, 3) arrays.
+    """
+
+    count: int
+    mean: np.ndarray
+    m2: np.ndarray
+
+    @classmethod
+    def empty(cls, n_atoms: int) -> "PositionMoments":
+        return cls(0, np.zeros((n_atoms, 3)), np.zeros(n_atoms))
+
+    @classmethod
+    def from_frames(cls, xyz: np.ndarray) -> "PositionMoments":
+        xyz = np.asarray(xyz, dtype=np.float64)
+        mean = xyz.mean(axis=0)
+        m2 = ((xyz - mean) ** 2).sum(axis=(0, 2))
+        return cls(len(xyz), mean, m2)
+
+    def merge(self, other: "PositionMoments") -> "PositionMoments":
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            return other
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        mean = self.mean + delta * (other.count / n)
+        m2 = self.m2 + other.m2 + (delta * delta).sum(axis=1) * (self.count * other.count / n)
+        return PositionMoments(n, mean, m2)
+
+    def rmsf(self) -> np.ndarray:
+        """Per-atom root-mean-square fluctuation around the mean position."""
+        if self.count == 0:
+            return np.full(len(self.m2), np.nan)
+        return np.sqrt(self.m2 / self.count)
+
+
+@dataclass(frozen=True)
+class FitTask:
+    """Per-run context for trajectory chunk workers.
+
+    Chunks read `atoms`: the `n_fit` fit atoms first (superposed onto `reference`), then
+    the atoms whose RMSF is accumulated (moved with the same per-frame transform).
+    """
+
+    atoms: np.ndarray
+    n_fit: int
+    reference: np.ndarray
+
+
+def fit_chunk(chunk: DcdChunk, task: FitTask) -> tuple[np.ndarray, np.ndarray, PositionMoments]:
+    """(frames, per-frame RMSD of the fit atoms, moments of the fitted RMSF atoms) for one chunk."""
+    fit_xyz = chunk.xyz[:, : task.n_fit]
+    rotations, centers, ref_center = kabsch_rotations(fit_xyz, task.reference)
+    moved = apply_superposition(chunk.xyz, rotations, centers, ref_center)
+    d2 = ((moved[:, : task.n_fit] - task.reference) ** 2).sum(axis=2)
+    rmsd = np.sqrt(d2.mean(axis=1))
+    return np.asarray(chunk.frames, dtype=np.int64), rmsd, PositionMoments.from_frames(moved[:, task.n_fit :])
+
+
+def trajectory_rmsd_rmsf(
+    dcd: Path,
+    task: FitTask,
+    *,
+    start: int = 0,
+    stop: int | None = None,
+    stride: int = 1,
+    chunk_size: int = 1000,
+    jobs: int = 0,
+) -> tuple[np.ndarray, np.ndarray, PositionMoments]:
+    """Stream a DCD through `fit_chunk`; returns (frames, rmsd, merged RMSF moments).
+
+    Only per-frame RMSDs and one `PositionMoments` per chunk leave the workers, so memory
+    is proportional to the atom count (times the chunk size), not the trajectory length.
+    """
+    frames: list[np.ndarray] = []
+    rmsd: list[np.ndarray] = []
+    moments = PositionMoments.empty(len(task.atoms) - task.n_fit)
+    for f, r, m in map_chunks(
+        dcd,
+        fit_chunk,
+        task,
+        chunk_size=chunk_size,
+        start=start,
+        stop=stop,
+        stride=stride,
+        atoms=task.atoms,
+        jobs=jobs,
+    ):
+        frames.append(f)
+        rmsd.append(r)
+        moments = moments.merge(m)
+    if not frames:
+        raise ValueError(f"No frames selected from {dcd}")
+    return np.concatenate(frames), np.concatenate(rmsd), moments
+
+
+AtomKey = tuple[str, int, str, str]  # (chain, resseq, icode, atomname)
+
+
+def protein_atoms(table: PdbAtomTable, atomnames: set[str] | None, chains: set[str] | None) -> np.ndarray:
+    idx = table.select(atomnames=atomnames, chains=chains)
+    return idx[table.record[idx] == "ATOM"]
+
+
+def atom_keys(table: PdbAtomTable, idx: np.ndarray) -> list[AtomKey]:
+    return list(
+        zip(
+            table.chain[idx].tolist(),
+            table.resseq[idx].tolist(),
+            table.icode[idx].tolist(),
+            table.atomname[idx].tolist(),
+        )
+    )
+
+
+def match_atoms(tables: list[PdbAtomTable], selected: list[np.ndarray]) -> tuple[list[AtomKey], np.ndarray]:
+    """Atoms present in every model, in the order of the first.
+
+    Returns (keys, index) where index[m] holds the row of each common atom in model m;
+    atoms of mutated residues match by chain/resseq/icode/atom name (e.g. the CA of M64V).
+    """
+    keyed = [dict(zip(atom_keys(t, idx), idx.tolist())) for t, idx in zip(tables, selected)]
+    common = [k for k in keyed[0] if all(k in d for d in keyed[1:])]
+    index = np.array([[d[k] for k in common] for d in keyed], dtype=np.int64).reshape(len(tables), len(common))
+    return common, index
+
+
+def write_rmsf(path: Path, table: PdbAtomTable, idx: np.ndarray, rmsf: np.ndarray) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = ["chain,resseq,icode,resname,atomname,rmsf"]
+    for i, value in zip(idx.tolist(), rmsf.tolist()):
+        lines.append(
+            f"{table.chain[i]},{table.resseq[i]},{table.icode[i]},{table.resname[i]},{table.atomname[i]},{value:.4f}"
+        )
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=(
+            "Batched Kabsch superposition: per-frame RMSD and per-atom RMSF for a NAMD DCD trajectory or a set of\n"
+            "PDB models (e.g. nd6_chain_m_WT_heavy.pdb vs nd6_chain_m_M64V_heavy.pdb).\n\n"
+            "All frames of a chunk are fitted at once (stacked 3x3 covariances, one SVD call); RMSF comes from\n"
+            "running position moments merged across chunks/workers, so a trajectory is read once in memory\n"
+            "proportional to the atom count. Fluctuations are measured after fitting onto the reference.\n"
+        )
+    )
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--dcd", default=None, help="NAMD DCD trajectory (atoms/order of --pdb).")
+    src.add_argument("--models", nargs="+", default=None, help="PDB models to compare; atoms are matched by chain/resseq/icode/name.")
+    ap.add_argument(
+        "--pdb",
+        default=None,
+        help="Reference PDB: the DCD topology/reference (required with --dcd); with --models defaults to the first model.",
+    )
+    ap.add_argument("--out-prefix", required=True, help="Writes <prefix>_rmsd.csv and <prefix>_rmsf.csv.")
+    ap.add_argument("--fit-atomnames", action="append", default=[], help="Atom names used for fitting/RMSD (default: CA).")
+    ap.add_argument("--fit-chains", default=None, help="Comma-separated chains used for fitting (default: all; case-sensitive).")
+    ap.add_argument("--rmsf-atomnames", action="append", default=[], help="Atom names reported in the RMSF table (default: CA).")
+    ap.add_argument("--rmsf-chains", default=None, help="Comma-separated chains reported in the RMSF table (default: --fit-chains).")
+    add_frame_range_args(ap)
+    args = ap.parse_args()
+
+    fit_names = parse_resname_list(args.fit_atomnames) or {"CA"}
+    rmsf_names = parse_resname_list(args.rmsf_atomnames) or {"CA"}
+    fit_chains = parse_name_list([args.fit_chains]) or None if args.fit_chains else None
+    rmsf_chains = parse_name_list([args.rmsf_chains]) or None if args.rmsf_chains else fit_chains
+    prefix = Path(args.out_prefix)
+    rmsd_path = prefix.with_name(f"{prefix.name}_rmsd.csv")
+    rmsf_path = prefix.with_name(f"{prefix.name}_rmsf.csv")
+    rmsd_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if args.dcd is not None:
+        if args.pdb is None:
+            raise SystemExit("--dcd requires --pdb")
+        dcd = Path(args.dcd)
+        if not dcd.exists():
+            raise SystemExit(f"Missing --dcd: {dcd}")
+        ref = read_pdb_atom_table(Path(args.pdb))
+        fit = protein_atoms(ref, fit_names, fit_chains)
+        rmsf_idx = protein_atoms(ref, rmsf_names, rmsf_chains)
+        if len(fit) < 3:
+            raise SystemExit(f"Need at least 3 fit atoms (found {len(fit)})")
+        task = FitTask(atoms=np.concatenate([fit, rmsf_idx]), n_fit=len(fit), reference=ref.xyz[fit])
+        with DcdTrajectory(dcd) as traj:
+            check_atom_count(traj, args.pdb, len(ref))
+        try:
+            frames, rmsd, moments = trajectory_rmsd_rmsf(
+                dcd,
+                task,
+                start=args.start,
+                stop=args.stop,
+                stride=args.stride,
+                chunk_size=args.chunk_size,
+                jobs=args.jobs,
+            )
+        except ValueError as exc:
+            raise SystemExit(str(exc))
+        with DcdTrajectory(dcd) as traj:
+            times = traj.times_ps(frames)
+        table = np.column_stack([frames, times, rmsd])
+        np.savetxt(rmsd_path, table, fmt=["%d", "%.3f", "%.4f"], delimiter=",", header="frame,time_ps,rmsd", comments="")
+        write_rmsf(rmsf_path, ref, rmsf_idx, moments.rmsf())
+        print(f"DCD:        {dcd}  (frames: {len(frames)})")
+        print(f"Fit atoms:  {len(fit)}  (RMSF atoms: {len(rmsf_idx)})")
+        print(f"RMSD (A):   mean {rmsd.mean():.3f}  min {rmsd.min():.3f}  max {rmsd.max():.3f}")
+    else:
+        paths = [Path(p) for p in args.models]
+        if args.pdb is not None:
+            paths.insert(0, Path(args.pdb))
+        missing = [p for p in paths if not p.exists()]
+        if missing:
+            raise SystemExit(f"Missing model(s): {', '.join(str(p) for p in missing)}")
+        tables = [read_pdb_atom_table(p) for p in paths]
+        fit_keys, fit = match_atoms(tables, [protein_atoms(t, fit_names, fit_chains) for t in tables])
+        _rmsf_keys, rmsf_idx = match_atoms(tables, [protein_atoms(t, rmsf_names, rmsf_chains) for t in tables])
+        if len(fit_keys) < 3:
+            raise SystemExit(f"Need at least 3 common fit atoms (found {len(fit_keys)})")
+        mobile = np.stack([t.xyz[i] for t, i in zip(tables, fit)])
+        rotations, centers, ref_center = kabsch_rotations(mobile, mobile[0])
+        rmsd = fitted_rmsd(mobile, mobile[0])
+        moved = apply_superposition(np.stack([t.xyz[i] for t, i in zip(tables, rmsf_idx)]), rotations, centers, ref_center)
+        moments = PositionMoments.from_frames(moved)
+        lines = ["model,rmsd"] + [f"{p.name},{r:.4f}" for p, r in zip(paths, rmsd.tolist())]
+        rmsd_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        write_rmsf(rmsf_path, tables[0], rmsf_idx[0], moments.rmsf())
+        print(f"Reference:  {paths[0]}")
+        print(f"Fit atoms:  {len(fit_keys)} common to {len(paths)} models  (RMSF atoms: {rmsf_idx.shape[1]})")
+        for p, r in zip(paths, rmsd.tolist()):
+            print(f"  {p.name:<44} RMSD {r:.4f} A")
+    print(f"Wrote: {rmsd_path}")
+    print(f"Wrote: {rmsf_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import argparse
+import math
+from pathlib import Path
+
+import numpy as np
+
+from pdb_atom_table import PdbAtomTable, read_pdb_atom_table
+from place_membrane_patch import ION_RESNAMES, WATER_RESNAMES
+
+
+MAX_RESIDUES_PER_SEGID = 9999
+
+
+def _parse_cryst1(header: list[str]) -> tuple[float, float, float] | None:
+    for line in header:
+        if line.startswith("CRYST1") and len(line) >= 33:
+            try:
+                return float(line[6:15]), float(line[15:24]), float(line[24:33])
+            except ValueError:
+                return None
+    return None
+
+
+def _fixed_width(values: np.ndarray, width: int, decimals: int = 0) -> np.ndarray:
+    """Right-justified fixed-point text (like "%{width}.{decimals}f") as an (n, width) uint8 block.
+
+    Digits are produced with integer arithmetic on whole columns, which is much faster
+    than per-value string formatting for 10^5-10^6 atoms.
+    """
+    v = np.asarray(values, dtype=np.float64)
+    n = len(v)
+    scaled = np.rint(np.abs(v) * 10**decimals).astype(np.int64)
+    out = np.full((n, width), ord(" "), dtype=np.uint8)
+    col = width - 1
+    for _ in range(decimals):
+        out[:, col] = ord("0") + scaled % 10
+        scaled //= 10
+        col -= 1
+    if decimals:
+        out[:, col] = ord(".")
+        col -= 1
+    lead = np.full(n, col, dtype=np.int64)
+    # Units digit is always printed; higher digits only while something is left.
+    active = np.ones(n, dtype=bool)
+    while col >= 0 and active.any():
+        out[active, col] = ord("0") + scaled[active] % 10
+        lead[active] = col
+        scaled //= 10
+        active = scaled > 0
+        col -= 1
+    neg = (v < 0) & (np.rint(np.abs(v) * 10**decimals) != 0)
+    if active.any() or (lead[neg] < 1).any():
+        raise ValueError(f"Value does not fit in {width} PDB columns")
+    out[np.flatnonzero(neg), lead[neg] - 1] = ord("-")
+    return out
+
+
+def _residue_centers(xyz: np.ndarray, residue_ids: np.ndarray, n_res: int) -> np.ndarray:
+    counts = np.bincount(residue_ids, minlength=n_res).astype(np.float64)
+    return np.stack(
+        [np.bincount(residue_ids, weights=xyz[:, k], minlength=n_res) / counts for k in range(3)],
+        axis=1,
+    )
+
+
+def tile_patch(
+    unit: PdbAtomTable,
+    *,
+    unit_x: float,
+    unit_y: float,
+    target_x: float,
+    target_y: float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Replicate `unit` on an n x m periodic lattice and trim to the target box.
+
+    Residues are first wrapped into the unit cell by their center, so molecules that
+    straddle the unit boundary are neither duplicated nor lost. The tiled patch is
+    centered on x=y=0 (z unchanged), like the VMD membrane plugin output, and residues
+    whose center lies outside [-x/2, x/2) x [-y/2, y/2) are dropped whole.
+
+    Returns (atom_index_into_unit, xyz, residue_index, tile_index) for the kept atoms,
+    ordered tile by tile in unit-file order (deterministic for a given input).
+    """
+    residue_ids = unit.residue_ids()
+    n_res = int(residue_ids[-1]) + 1
+    box = np.array([unit_x, unit_y], dtype=np.float64)
+
+    centers = _residue_centers(unit.xyz, residue_ids, n_res)
+    lo = unit.xyz[:, :2].min(axis=0)
+    shift = -np.floor((centers[:, :2] - lo) / box) * box
+    wrapped = unit.xyz.copy()
+    wrapped[:, :2] += shift[residue_ids]
+    centers[:, :2] += shift
+    origin = lo
+
+    nx = int(math.ceil(target_x / unit_x))
+    ny = int(math.ceil(target_y / unit_y))
+    ii, jj = np.meshgrid(np.arange(nx), np.arange(ny), indexing="ij")
+    offsets = np.zeros((nx * ny, 3), dtype=np.float64)
+    offsets[:, 0] = ii.ravel() * unit_x
+    offsets[:, 1] = jj.ravel() * unit_y
+    # Center the full lattice on the origin in x/y.
+    offsets[:, :2] -= origin + 0.5 * np.array([nx * unit_x, ny * unit_y])
+
+    tile_centers = centers[None, :, :2] + offsets[:, None, :2]  # (tiles, residues, 2)
+    half = 0.5 * np.array([target_x, target_y])
+    keep_res = np.all((tile_centers >= -half) & (tile_centers < half), axis=2)  # (tiles, residues)
+
+    keep_atoms = keep_res[:, residue_ids]  # (tiles, atoms)
+    tile_idx, atom_idx = np.nonzero(keep_atoms)
+    xyz = wrapped[atom_idx] + offsets[tile_idx]
+    return atom_idx, xyz, residue_ids[atom_idx], tile_idx
+
+
+def _segid_prefix(resname: np.ndarray) -> np.ndarray:
+    prefix = np.full(len(resname), "L", dtype="<U1")
+    prefix[np.isin(resname, list(WATER_RESNAMES))] = "W"
+    prefix[np.isin(resname, list(ION_RESNAMES))] = "I"
+    return prefix
+
+
+def render_tiled_pdb(
+    unit: PdbAtomTable,
+    atom_idx: np.ndarray,
+    xyz: np.ndarray,
+    residue_idx: np.ndarray,
+    tile_idx: np.ndarray,
+) -> tuple[bytes, dict[str, int]]:
+    """Render tiled atoms as PDB records using the unit records as column templates.
+
+    Residues are renumbered 1..9999 within segids L001, L002, ... (lipids), W001, ...
+    (waters) and I001, ... (ions); atom serials wrap at 99999 like VMD. Returns the
+    record bytes and the residue count per segid family.
+    """
+    n = len(atom_idx)
+    template = np.array([line.rstrip("\r\n").ljust(80)[:80] for line in unit.lines], dtype="S80")
+    block = template.view(np.uint8).reshape(-1, 80)[atom_idx].copy()
+
+    # Global residue key: residues are contiguous within a tile, tiles are in order.
+    new_residue = np.ones(n, dtype=bool)
+    if n:
+        new_residue[1:] = (residue_idx[1:] != residue_idx[:-1]) | (tile_idx[1:] != tile_idx[:-1])
+    first_atoms = np.flatnonzero(new_residue)
+    res_prefix = _segid_prefix(unit.resname[atom_idx[first_atoms]])
+
+    seg_resseq = np.zeros(len(first_atoms), dtype=np.int64)
+    seg_number = np.zeros(len(first_atoms), dtype=np.int64)
+    totals: dict[str, int] = {}
+    for prefix in ("L", "W", "I"):
+        sel = np.flatnonzero(res_prefix == prefix)
+        if len(sel) == 0:
+            continue
+        rank = np.arange(len(sel))
+        seg_number[sel] = rank // MAX_RESIDUES_PER_SEGID + 1
+        seg_resseq[sel] = rank % MAX_RESIDUES_PER_SEGID + 1
+        totals[prefix] = len(sel)
+    if int(seg_number.max(initial=0)) > 999:
+        raise ValueError("Patch too large: more than 999 segids per residue family")
+
+    res_of_atom = np.cumsum(new_residue) - 1
+    # Only a handful of distinct segids exist; render those once and index.
+    seg_code = np.searchsorted(np.array(["I", "L", "W"]), res_prefix) * 1000 + seg_number
+    codes, seg_of_res = np.unique(seg_code, return_inverse=True)
+    seg_text = np.array([f"{'ILW'[c // 1000]}{c % 1000:03d}" for c in codes], dtype="S4")
+    seg_bytes = seg_text.view(np.uint8).reshape(-1, 4)
+
+    block[:, 6:11] = _fixed_width(np.arange(n) % 99999 + 1, 5)
+    block[:, 22:26] = _fixed_width(seg_resseq[res_of_atom], 4)
+    block[:, 30:38] = _fixed_width(xyz[:, 0], 8, 3)
+    block[:, 38:46] = _fixed_width(xyz[:, 1], 8, 3)
+    block[:, 46:54] = _fixed_width(xyz[:, 2], 8, 3)
+    block[:, 72:76] = seg_bytes[seg_of_res[res_of_atom]]
+
+    lines = np.concatenate([block, np.full((n, 1), ord("\n"), dtype=np.uint8)], axis=1)
+    return lines.tobytes(), totals
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=(
+            "Tile a small pre-equilibrated membrane unit (PDB) onto an n x m periodic lattice and trim it to\n"
+            "exact target X/Y dimensions. Output is centered on x=y=0 like the VMD membrane plugin patch, so it\n"
+            "can be passed directly to place_membrane_patch.py.\n"
+        )
+    )
+    ap.add_argument("--unit-pdb", required=True, help="Equilibrated membrane unit PDB (lipids, optionally waters/ions).")
+    ap.add_argument("--out-pdb", required=True, help="Output tiled patch PDB path.")
+    ap.add_argument("--x", type=float, required=True, help="Target patch size X in A (e.g. from calc_membrane_patch_size.py).")
+    ap.add_argument("--y", type=float, required=True, help="Target patch size Y in A.")
+    ap.add_argument(
+        "--unit-x",
+        type=float,
+        default=None,
+        help="Periodic unit length X in A (default: from the unit CRYST1 record).",
+    )
+    ap.add_argument(
+        "--unit-y",
+        type=float,
+        default=None,
+        help="Periodic unit length Y in A (default: from the unit CRYST1 record).",
+    )
+    args = ap.parse_args()
+
+    unit_pdb = Path(args.unit_pdb)
+    out_pdb = Path(args.out_pdb)
+    if not unit_pdb.exists():
+        raise SystemExit(f"Missing --unit-pdb: {unit_pdb}")
+    if args.x <= 0.0 or args.y <= 0.0:
+        raise SystemExit("--x and --y must be positive.")
+
+    unit = read_pdb_atom_table(unit_pdb)
+    if len(unit) == 0:
+        raise SystemExit(f"No atoms found in unit: {unit_pdb}")
+
+    cryst = _parse_cryst1(unit.header)
+    unit_x = args.unit_x if args.unit_x is not None else (cryst[0] if cryst else None)
+    unit_y = args.unit_y if args.unit_y is not None else (cryst[1] if cryst else None)
+    if not unit_x or not unit_y:
+        raise SystemExit(f"No CRYST1 record in {unit_pdb}; pass --unit-x and --unit-y.")
+    unit_z = cryst[2] if cryst else float(np.ptp(unit.xyz[:, 2]))
+
+    atom_idx, xyz, residue_idx, tile_idx = tile_patch(
+        unit, unit_x=unit_x, unit_y=unit_y, target_x=float(args.x), target_y=float(args.y)
+    )
+    try:
+        body, totals = render_tiled_pdb(unit, atom_idx, xyz, residue_idx, tile_idx)
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+
+    out_pdb.parent.mkdir(parents=True, exist_ok=True)
+    with out_pdb.open("wb") as fout:
+        fout.write(
+            f"CRYST1{float(args.x):9.3f}{float(args.y):9.3f}{unit_z:9.3f}  90.00  90.00  90.00 P 1           1\n".encode(
+                "ascii"
+            )
+        )
+        fout.write(f"REMARK   1 Tiled from {unit_pdb.name} ({unit_x:.3f} x {unit_y:.3f} A unit)".ljust(80).encode("ascii"))
+        fout.write(b"\n")
+        fout.write(body)
+        fout.write(b"END\n")
+
+    nx = int(math.ceil(float(args.x) / unit_x))
+    ny = int(math.ceil(float(args.y) / unit_y))
+    labels = {"L": "lipid/other", "W": "water", "I": "ion"}
+    print(f"Unit:    {unit_pdb}  ({len(unit)} atoms; cell {unit_x:.3f} x {unit_y:.3f} A)")
+    print(f"Lattice: {nx} x {ny} tiles")
+    print(f"Target (A): x={float(args.x):.3f} y={float(args.y):.3f}")
+    for prefix, count in totals.items():
+        segs = (count - 1) // MAX_RESIDUES_PER_SEGID + 1
+        print(f"  {labels[prefix]:<11} residues={count:<8d} segids={prefix}001..{prefix}{segs:03d}")
+    print(f"Wrote: {out_pdb}  (atoms: {len(atom_idx)})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())